@@ -125,7 +125,7 @@ install_packages() {
         "btop" "stow" "imagemagick" "curl" "wget"
         
         # Development tools
-        "python" "python-requests" "python-pillow"
+        "python" "python-requests" "python-pillow" "python-numpy"
         
         # Fonts and themes
         "ttf-jetbrains-mono" "ttf-font-awesome" "papirus-icon-theme"
@@ -179,6 +179,8 @@ check_requirement "json" "json" "python"
 check_requirement "re" "re" "python"
 check_requirement "base64" "base64" "python"
 check_requirement "hashlib" "hashlib" "python"
+check_requirement "numpy (native engine)" "numpy" "python" "false"
+check_requirement "pillow (native engine)" "PIL" "python" "false"
 
 # Check file structure
 echo -e "\n${BOLD}File Structure:${NC}"
@@ -193,6 +195,7 @@ echo -e "\n${BOLD}Core Scripts:${NC}"
 check_requirement "logger.sh" "$DOTFILES_DIR/theme_engine/logger.sh" "file"
 check_requirement "wallpaper_picker.sh" "$DOTFILES_DIR/scripts/wallpaper_picker.sh" "file"
 check_requirement "apply_theme.sh" "$DOTFILES_DIR/scripts/apply_theme.sh" "file"
+check_requirement "clypr.py" "$DOTFILES_DIR/theme_engine/clypr.py" "file"
 check_requirement "extract_colors.py" "$DOTFILES_DIR/theme_engine/extract_colors.py" "file"
 check_requirement "render_templates.py" "$DOTFILES_DIR/theme_engine/render_templates.py" "file"
 check_requirement "merge_configs.py" "$DOTFILES_DIR/theme_engine/merge_configs.py" "file"
@@ -207,6 +210,7 @@ check_syntax "setup_symlinks.sh" "$DOTFILES_DIR/scripts/setup_symlinks.sh" "bash
 check_syntax "install.sh" "$DOTFILES_DIR/install.sh" "bash"
 check_syntax "logger.sh" "$DOTFILES_DIR/theme_engine/logger.sh" "bash"
 
+check_syntax "clypr.py" "$DOTFILES_DIR/theme_engine/clypr.py" "python"
 check_syntax "extract_colors.py" "$DOTFILES_DIR/theme_engine/extract_colors.py" "python"
 check_syntax "render_templates.py" "$DOTFILES_DIR/theme_engine/render_templates.py" "python"
 check_syntax "merge_configs.py" "$DOTFILES_DIR/theme_engine/merge_configs.py" "python"
@@ -1,7 +1,7 @@
 #!/bin/bash
 # scripts/wallpaper_picker.sh
 # Rofi-wayland wallpaper picker with previews and theme application
-# Requires: rofi-wayland, swww, imagemagick (for thumbnails)
+# Requires: rofi-wayland, swww, python-pillow (for thumbnails)
 
 set -euo pipefail
 
@@ -32,32 +32,11 @@ ROFI_COLORS="window {background-color: #1e1e2e;} listview {background-color: #1e
 # Ensure directories exist
 mkdir -p "${THUMBNAILS_DIR}"
 
-# Function to generate thumbnail if it doesn't exist
-generate_thumbnail() {
-    local wallpaper="$1"
-    local thumbnail="${THUMBNAILS_DIR}/$(basename "${wallpaper%.*}.jpg")"
-    
-    log_debug "WALLPAPER" "Checking thumbnail for: $(basename "$wallpaper")"
-    log_debug "WALLPAPER" "Thumbnail path: $thumbnail"
-    
-    if [[ ! -f "$thumbnail" ]]; then
-        log_info "WALLPAPER" "Generating thumbnail for $(basename "$wallpaper")..."
-        # Create 200x200 thumbnail with imagemagick
-        if convert "$wallpaper" -resize 200x200^ -gravity center -extent 200x200 "$thumbnail" 2>/dev/null; then
-            log_success "WALLPAPER" "Thumbnail generated: $thumbnail"
-        else
-            log_error "WALLPAPER" "Failed to generate thumbnail for $wallpaper"
-            return 1
-        fi
-    else
-        log_debug "WALLPAPER" "Thumbnail already exists: $thumbnail"
-    fi
-    
-    echo "$thumbnail"
-}
-
-# Function to get all wallpapers recursively
-get_wallpapers() {
+# Function to build rofi entries for all wallpapers in one batch
+# The wallpaper list comes from the incremental catalog (wallpaper_catalog.py);
+# thumbnails are generated in parallel and cached by thumbnails.py
+# Format: "thumbnail_path|display_name|full_path"
+get_rofi_entries() {
     log_info "WALLPAPER" "Scanning for wallpapers in: $WALLPAPERS_DIR"
     
     if [[ ! -d "$WALLPAPERS_DIR" ]]; then
@@ -65,66 +44,33 @@ get_wallpapers() {
         return 1
     fi
     
-    local wallpapers
-    wallpapers=$(find "$WALLPAPERS_DIR" -type f \( -iname "*.jpg" -o -iname "*.jpeg" -o -iname "*.png" -o -iname "*.webp" \) 2>/dev/null | sort)
-    
-    local count=$(echo "$wallpapers" | wc -l)
-    if [[ -z "$wallpapers" ]]; then
-        count=0
-    fi
-    
-    log_info "WALLPAPER" "Found $count wallpaper files"
-    
-    if [[ $count -eq 0 ]]; then
-        log_warning "WALLPAPER" "No wallpapers found. Add wallpapers to $WALLPAPERS_DIR"
+    # CLYPR_PICKER_SORT=similar lists wallpapers closest to the current theme first
+    if ! python3 "${THEME_ENGINE_DIR}/thumbnails.py" --rofi --sort "${CLYPR_PICKER_SORT:-name}"; then
+        log_error "WALLPAPER" "Thumbnail generation failed"
         return 1
     fi
-    
-    echo "$wallpapers"
-}
-
-# Function to create rofi entry with preview
-create_rofi_entry() {
-    local wallpaper="$1"
-    local thumbnail="$2"
-    local basename=$(basename "$wallpaper")
-    local dirname=$(basename "$(dirname "$wallpaper")")
-    
-    # Format: "thumbnail_path|display_name|full_path"
-    echo "${thumbnail}|${dirname}/${basename}|${wallpaper}"
 }
 
 # Function to show wallpaper picker
 show_picker() {
-    local wallpapers=()
     local rofi_entries=()
     
     log_info "WALLPAPER" "Starting wallpaper picker..."
     
-    # Get wallpapers - this function now includes error checking
-    local wallpaper_list
-    if ! wallpaper_list=$(get_wallpapers); then
+    # Get wallpapers with thumbnails (wallpapers whose thumbnail failed are skipped)
+    local entry_list
+    if ! entry_list=$(get_rofi_entries); then
         log_error "WALLPAPER" "Failed to get wallpapers"
         return 1
     fi
     
-    # Generate thumbnails and create rofi entries
-    while IFS= read -r wallpaper; do
-        if [[ -n "$wallpaper" && -f "$wallpaper" ]]; then
-            log_debug "WALLPAPER" "Processing wallpaper: $wallpaper"
-            local thumbnail
-            if thumbnail=$(generate_thumbnail "$wallpaper"); then
-                local entry=$(create_rofi_entry "$wallpaper" "$thumbnail")
-                rofi_entries+=("$entry")
-                log_debug "WALLPAPER" "Added entry: $entry"
-            else
-                log_warning "WALLPAPER" "Skipping wallpaper (thumbnail failed): $wallpaper"
-            fi
-        fi
-    done <<< "$wallpaper_list"
+    if [[ -n "$entry_list" ]]; then
+        mapfile -t rofi_entries <<< "$entry_list"
+    fi
     
     if [[ ${#rofi_entries[@]} -eq 0 ]]; then
         log_error "WALLPAPER" "No valid wallpapers found in $WALLPAPERS_DIR"
+        log_warning "WALLPAPER" "Add wallpapers to $WALLPAPERS_DIR"
         return 1
     fi
     
@@ -183,7 +129,13 @@ set_wallpaper() {
     if ! pgrep -x swww-daemon > /dev/null 2>&1; then
         echo "Starting swww daemon..."
         swww-daemon &
-        sleep 2
+        
+        # Wait until the daemon answers instead of a fixed delay (max 5s)
+        local tries=0
+        until swww query > /dev/null 2>&1 || [[ $tries -ge 100 ]]; do
+            sleep 0.05
+            tries=$((tries + 1))
+        done
     fi
     
     # Set wallpaper with transition
@@ -194,6 +146,18 @@ set_wallpaper() {
         --transition-angle 30
 }
 
+# Function to start the resident theme daemon in the background if needed
+ensure_theme_daemon() {
+    if python3 "${THEME_ENGINE_DIR}/theme_daemon.py" status > /dev/null 2>&1; then
+        log_debug "WALLPAPER" "Theme daemon already running"
+        return 0
+    fi
+    
+    log_info "WALLPAPER" "Starting theme daemon..."
+    nohup python3 "${THEME_ENGINE_DIR}/theme_daemon.py" serve > /dev/null 2>&1 &
+    disown
+}
+
 # Function to apply theme based on selected wallpaper
 apply_theme() {
     local wallpaper="$1"
@@ -218,7 +182,7 @@ main() {
     # Check dependencies
     log_info "WALLPAPER" "Checking dependencies..."
     local missing_deps=()
-    local deps=(rofi swww convert)
+    local deps=(rofi swww python3)
     
     for cmd in "${deps[@]}"; do
         if command -v "$cmd" > /dev/null 2>&1; then
@@ -231,7 +195,7 @@ main() {
     
     if [[ ${#missing_deps[@]} -gt 0 ]]; then
         log_error "WALLPAPER" "Missing dependencies: ${missing_deps[*]}"
-        log_info "WALLPAPER" "Please install: rofi-wayland swww imagemagick"
+        log_info "WALLPAPER" "Please install: rofi-wayland swww python"
         return 1
     fi
     
@@ -240,6 +204,9 @@ main() {
     mkdir -p "$WALLPAPERS_DIR"
     mkdir -p "$THUMBNAILS_DIR"
     
+    # Warm up the theme daemon while the user is choosing
+    ensure_theme_daemon
+    
     # Show wallpaper picker
     log_info "WALLPAPER" "Starting wallpaper selection..."
     local selected_wallpaper
@@ -0,0 +1,7 @@
+# tests/conftest.py
+# theme_engine modules import each other by bare name, as when run as scripts
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "theme_engine"))
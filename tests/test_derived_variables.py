@@ -0,0 +1,49 @@
+# tests/test_derived_variables.py
+# Bright variants keep their hue and stay distinct on a dark palette
+
+import math
+from itertools import combinations
+
+from color_math import hex_to_rgb, srgb_to_oklab
+from derived_variables import DerivedVariables
+
+# Catppuccin-style dark palette (the fallback palette)
+DARK_PALETTE = {
+    "primary": "#89b4fa", "secondary": "#cba6f7", "tertiary": "#f38ba8",
+    "background": "#1e1e2e", "surface": "#313244", "accent": "#a6e3a1",
+    "text_primary": "#cdd6f4", "text_secondary": "#bac2de", "text_accent": "#f9e2af",
+}
+# Keys behind kitty's bright ANSI slots (color8-color14)
+ANSI_KEYS = ("surface", "tertiary", "accent", "text_accent", "primary", "secondary")
+
+def lch(hex_color: str):
+    lightness, a, b = srgb_to_oklab(hex_to_rgb(hex_color))
+    return lightness, math.hypot(a, b), math.atan2(b, a)
+
+def test_bright_variants_keep_hue():
+    brights = DerivedVariables().resolve(DARK_PALETTE, [f"{key}_bright" for key in ANSI_KEYS])
+    
+    for key in ANSI_KEYS:
+        bright = brights[f"{key}_bright"]
+        assert bright not in ("#ffffff", "#000000"), key
+        assert bright != DARK_PALETTE[key], key
+        
+        _, base_chroma, base_hue = lch(DARK_PALETTE[key])
+        _, chroma, hue = lch(bright)
+        assert chroma > 0.5 * base_chroma, key
+        hue_error = abs(math.remainder(hue - base_hue, math.tau))
+        assert hue_error < math.radians(8), key
+
+def test_bright_variants_are_distinct():
+    brights = DerivedVariables().resolve(DARK_PALETTE, [f"{key}_bright" for key in DARK_PALETTE])
+    
+    for first, second in combinations(ANSI_KEYS, 2):
+        distance = math.dist(srgb_to_oklab(hex_to_rgb(brights[f"{first}_bright"])),
+                             srgb_to_oklab(hex_to_rgb(brights[f"{second}_bright"])))
+        assert distance > 0.05, (first, second)
+
+def test_bright_variants_move_away_from_background():
+    brights = DerivedVariables().resolve(DARK_PALETTE, ["primary_bright", "surface_bright"])
+    
+    assert lch(brights["primary_bright"])[0] > lch(DARK_PALETTE["primary"])[0]
+    assert lch(brights["surface_bright"])[0] > lch(DARK_PALETTE["surface"])[0]
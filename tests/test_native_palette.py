@@ -0,0 +1,91 @@
+# tests/test_native_palette.py
+# The native engine is deterministic (so palettes can be cached) and only
+# produces in-gamut colors that keep the requested lightness and hue
+
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import color_math
+from native_palette import NativePaletteExtractor, hex_to_srgb, lch_to_hex, srgb_to_oklab
+
+PALETTE_KEYS = {
+    "primary", "secondary", "tertiary", "background", "surface",
+    "accent", "text_primary", "text_secondary", "text_accent",
+}
+
+def synthetic_pixels(seed: int = 7) -> "np.ndarray":
+    """A few noisy color blobs, as sRGB rows in [0, 1]."""
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.1, 0.12, 0.2], [0.8, 0.3, 0.2], [0.2, 0.6, 0.9], [0.9, 0.85, 0.4]])
+    rows = np.repeat(centers, [400, 150, 100, 50], axis=0)
+    return np.clip(rows + rng.normal(0, 0.03, rows.shape), 0, 1)
+
+def palette_from_pixels(pixels: "np.ndarray"):
+    extractor = NativePaletteExtractor()
+    lab = srgb_to_oklab(pixels)
+    centers, weights = extractor._kmeans(lab)
+    return extractor._map_to_palette(centers, weights, float(lab[:, 0].mean()))
+
+def test_same_pixels_give_same_palette():
+    first = palette_from_pixels(synthetic_pixels())
+    second = palette_from_pixels(synthetic_pixels())
+    
+    assert first == second
+    assert set(first) == PALETTE_KEYS
+    assert all(len(color) == 7 and color.startswith("#") for color in first.values())
+
+def test_same_image_gives_same_palette(tmp_path):
+    from PIL import Image
+    
+    image_path = tmp_path / "wallpaper.png"
+    pixels = (synthetic_pixels().reshape(28, 25, 3) * 255).astype(np.uint8)
+    Image.fromarray(pixels).resize((280, 250), Image.Resampling.NEAREST).save(image_path)
+    
+    assert NativePaletteExtractor().extract(str(image_path)) == NativePaletteExtractor().extract(str(image_path))
+
+def test_large_png_is_reduced_before_conversion(tmp_path):
+    from PIL import Image
+    
+    pixels = (synthetic_pixels().reshape(28, 25, 3) * 255).astype(np.uint8)
+    rgb = Image.fromarray(pixels).resize((2800, 2500), Image.Resampling.NEAREST)
+    rgb.save(tmp_path / "rgb.png")
+    rgb.convert("RGBA").save(tmp_path / "rgba.png")
+    
+    extractor = NativePaletteExtractor()
+    loaded = extractor._load_pixels(str(tmp_path / "rgb.png"))
+    assert len(loaded) <= extractor.max_edge ** 2
+    # Dropping alpha after the reduce gives the same pixels as before it
+    assert np.array_equal(extractor._load_pixels(str(tmp_path / "rgba.png")), loaded)
+
+def test_lch_to_hex_stays_in_gamut():
+    # Chroma far beyond sRGB at every lightness and hue: chroma is reduced, not clipped per channel
+    lightness = np.linspace(0.2, 0.9, 8)
+    hues = np.radians(np.arange(0, 360, 30))
+    rows = np.array([[l, 0.4, h] for l in lightness for h in hues])
+    
+    hexes = lch_to_hex(rows)
+    lab = srgb_to_oklab(hex_to_srgb(hexes))
+    assert np.all(np.abs(lab[:, 0] - rows[:, 0]) < 0.02)
+    
+    chroma = np.hypot(lab[:, 1], lab[:, 2])
+    hue_error = np.abs(np.angle(np.exp(1j * (np.arctan2(lab[:, 2], lab[:, 1]) - rows[:, 2]))))
+    assert np.all(hue_error[chroma > 0.03] < np.radians(6))
+
+def test_in_gamut_colors_round_trip():
+    hexes = ["#1e1e2e", "#89b4fa", "#f38ba8", "#a6e3a1", "#ffffff", "#000000"]
+    lab = srgb_to_oklab(hex_to_srgb(hexes))
+    lch = np.stack([lab[:, 0], np.hypot(lab[:, 1], lab[:, 2]), np.arctan2(lab[:, 2], lab[:, 1])], axis=1)
+    
+    assert lch_to_hex(lch) == hexes
+
+def test_pure_python_helpers_match_numpy():
+    rows = [[0.7, 0.3, math.radians(hue)] for hue in range(0, 360, 15)] + [[0.5, 0.05, 1.0]]
+    expected = lch_to_hex(np.array(rows))
+    
+    for row, hex_color in zip(rows, expected):
+        got = color_math.hex_to_rgb(color_math.lch_to_hex(*row))
+        assert max(abs(a - b) for a, b in zip(got, color_math.hex_to_rgb(hex_color))) <= 1 / 255 + 1e-9
@@ -0,0 +1,180 @@
+# tests/test_ollama_client.py
+# OllamaClient against a local http.server stub: model cache, keep-alive,
+# circuit breaker and recovery after the cooldown
+
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable
+
+class StubServer:
+    """Minimal Ollama API: /api/tags and /api/generate, with scripted failures."""
+    
+    def __init__(self):
+        self.requests = []
+        self.client_ports = set()
+        # Status codes returned (and consumed) before normal responses resume
+        self.fail_with = []
+        self._server = None
+    
+    def _handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so the client's pooled connection is kept alive
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send(self, status, body):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _handle(self, payload):
+                stub.requests.append((self.command, self.path, payload))
+                stub.client_ports.add(self.client_address[1])
+                if stub.fail_with:
+                    self._send(stub.fail_with.pop(0), '{"error": "scripted failure"}')
+                elif self.path == "/api/tags":
+                    self._send(200, json.dumps({"models": [{"name": "llava:latest"}, {"name": "mistral:7b"}]}))
+                elif payload.get("stream"):
+                    chunks = [{"response": token, "done": False} for token in ("{", '"a"', "}")]
+                    chunks.append({"response": "", "done": True})
+                    self._send(200, "".join(json.dumps(chunk) + "\n" for chunk in chunks))
+                else:
+                    self._send(200, json.dumps({"response": "ok", "done": True}))
+            
+            def do_GET(self):
+                self._handle({})
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._handle(json.loads(self.rfile.read(length) or b"{}"))
+        
+        return Handler
+    
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+    
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+@pytest.fixture
+def stub():
+    pytest.importorskip("requests")
+    server = StubServer()
+    server.url = server.start()
+    yield server
+    server.stop()
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_model_list_is_cached(stub):
+    client = OllamaClient(stub.url, model_ttl=60)
+    
+    assert client.find_model("llava") == "llava:latest"
+    assert client.list_models() == ["llava:latest", "mistral:7b"]
+    assert [path for _, path, _ in stub.requests] == ["/api/tags"]
+    
+    client.list_models(force=True)
+    assert len(stub.requests) == 2
+
+def test_requests_reuse_one_connection(stub):
+    client = OllamaClient(stub.url)
+    for _ in range(3):
+        client.list_models(force=True)
+    client.generate("llava:latest", "describe")
+    client.close()
+    
+    assert len(stub.requests) == 4
+    assert len(stub.client_ports) == 1
+
+def test_generate_sends_keep_alive(stub):
+    client = OllamaClient(stub.url, keep_alive="45m")
+    
+    assert client.generate("llava:latest", "describe", images=["aW1n"]) == {"response": "ok", "done": True}
+    _, path, payload = stub.requests[-1]
+    assert path == "/api/generate"
+    assert payload["keep_alive"] == "45m"
+    assert payload["stream"] is False
+    assert payload["images"] == ["aW1n"]
+
+def test_generate_stream_yields_chunks(stub):
+    client = OllamaClient(stub.url)
+    
+    chunks = list(client.generate_stream("llava:latest", "describe"))
+    assert "".join(chunk["response"] for chunk in chunks) == '{"a"}'
+    assert chunks[-1]["done"] is True
+
+def test_breaker_opens_after_server_errors(stub, tmp_path):
+    client = OllamaClient(stub.url, state_file=tmp_path / "state.json", failure_threshold=2, cooldown=60)
+    stub.fail_with = [500, 503]
+    
+    for _ in range(2):
+        with pytest.raises(OllamaError):
+            client.list_models(force=True)
+    assert client.breaker_open()
+    
+    # Open breaker: no request reaches the server
+    with pytest.raises(OllamaUnavailable):
+        client.list_models(force=True)
+    assert len(stub.requests) == 2
+    
+    # The breaker survives into the next one-shot process through the state file
+    assert OllamaClient(stub.url, state_file=tmp_path / "state.json").breaker_open()
+
+def test_client_errors_do_not_trip_breaker(stub):
+    client = OllamaClient(stub.url, failure_threshold=1)
+    stub.fail_with = [404]
+    
+    with pytest.raises(OllamaError):
+        client.generate("missing", "describe")
+    assert not client.breaker_open()
+
+def test_retry_after_cooldown_closes_breaker(stub):
+    client = OllamaClient(stub.url, failure_threshold=1, cooldown=0.2)
+    stub.fail_with = [500]
+    
+    with pytest.raises(OllamaError):
+        client.list_models(force=True)
+    assert client.breaker_open()
+    
+    time.sleep(0.25)
+    assert client.list_models(force=True) == ["llava:latest", "mistral:7b"]
+    assert not client.breaker_open()
+    assert client._state["failures"] == 0
+
+def test_unreachable_server_counts_as_failure():
+    pytest.importorskip("requests")
+    client = OllamaClient(f"http://127.0.0.1:{unused_port()}", failure_threshold=1, cooldown=60)
+    
+    with pytest.raises(OllamaError):
+        client.list_models()
+    assert client.breaker_open()
+
+def test_missing_requests_means_unavailable(monkeypatch):
+    # A None entry makes "import requests" raise ImportError
+    monkeypatch.setitem(sys.modules, "requests", None)
+    client = OllamaClient("http://127.0.0.1:1")
+    
+    with pytest.raises(OllamaUnavailable):
+        client.list_models()
+    assert not client.breaker_open()
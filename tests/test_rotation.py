@@ -0,0 +1,92 @@
+# tests/test_rotation.py
+# Prefetched themes are dropped when the rotation order changes or it stops
+
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from rotation import Playlist, PreparedTheme, ThemeRotator
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def rotator(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    for name in ("config_templates", "config_static", "wallpapers/a"):
+        (tmp_path / name).mkdir(parents=True)
+    for index in range(5):
+        (tmp_path / "wallpapers" / "a" / f"{index}.png").write_bytes(b"png %d" % index)
+    
+    playlist = Playlist(str(tmp_path))
+    rotator = ThemeRotator(str(tmp_path), playlist, prefetch=2)
+    rotator.prepared = []
+    release = threading.Event()
+    release.set()
+    
+    def prepare(wallpaper_path):
+        # Stand-in for extraction, rendering and planning
+        release.wait()
+        rotator.prepared.append(Path(wallpaper_path).name)
+        return None if rotator._cancelled() else PreparedTheme(wallpaper_path, {}, {}, {}, "v")
+    
+    monkeypatch.setattr(rotator, "prepare", prepare)
+    rotator.release = release
+    yield rotator
+    rotator.stop()
+    release.set()
+    # The real prepare must not run once monkeypatch is undone
+    if rotator._worker:
+        rotator._worker.join(5)
+
+def queued(rotator):
+    with rotator._cond:
+        return [Path(prepared.wallpaper_path).name for prepared in rotator._queue]
+
+def test_resync_drops_themes_prepared_for_the_old_order(rotator):
+    rotator.playlist.start_after(None)
+    rotator.start_prefetch()
+    wait_for(lambda: queued(rotator) == ["0.png", "1.png"])
+    
+    # e.g. 3.png was applied by hand: the rotation continues after it
+    rotator.resync(str(rotator.playlist.catalog.root / "a" / "3.png"))
+    wait_for(lambda: queued(rotator) == ["4.png", "0.png"])
+
+def test_resync_abandons_the_theme_in_progress(rotator):
+    rotator.playlist.start_after(None)
+    rotator.release.clear()
+    rotator.start_prefetch()
+    wait_for(lambda: rotator._worker.is_alive())
+    
+    rotator.resync(str(rotator.playlist.catalog.root / "a" / "2.png"))
+    rotator.release.set()
+    wait_for(lambda: len(queued(rotator)) == 2)
+    assert queued(rotator) == ["3.png", "4.png"]
+
+def test_manual_apply_resyncs_before_advancing(rotator, monkeypatch):
+    published = []
+    monkeypatch.setattr(rotator, "publish", lambda prepared: published.append(Path(prepared.wallpaper_path).name))
+    rotator.playlist.start_after(None)
+    rotator.start_prefetch()
+    wait_for(lambda: len(queued(rotator)) == 2)
+    
+    current = rotator.renderer.current_theme_file
+    current.write_text(json.dumps({"wallpaper_path": str(rotator.playlist.catalog.root / "a" / "1.png")}))
+    assert rotator.advance()
+    assert published == ["2.png"]
+
+def test_stop_drops_prepared_themes(rotator):
+    rotator.playlist.start_after(None)
+    rotator.start_prefetch()
+    wait_for(lambda: len(queued(rotator)) == 2)
+    
+    rotator.stop()
+    assert queued(rotator) == []
+    rotator._worker.join(5)
+    assert not rotator._worker.is_alive()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# theme_engine/backup_store.py
+# Content-addressed backup store for merged configs and theme state
+# Every apply records a small generation manifest that references blobs by hash;
+# unchanged files are never re-read or re-stored, and restore copies blobs back
+
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from change_manifest import ChangeManifest, content_hash, stage_file
+
+# Generations kept by gc(); older manifests are dropped and their blobs collected
+DEFAULT_KEEP = 20
+# Label of the snapshot of the user's configs taken before the first theme; never collected
+ORIGINAL_LABEL = "before first theme"
+
+class BackupStore:
+    """Stores file versions once by content hash and groups them into generations."""
+    
+    def __init__(self, root: Path, keep: Optional[int] = None):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.generations_dir = self.root / "generations"
+        self.keep = keep or int(os.getenv("CLYPR_BACKUP_KEEP", str(DEFAULT_KEEP)))
+    
+    def _blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / digest[:2] / digest[2:]
+    
+    def _store_blob(self, data: bytes) -> str:
+        """Store data once; returns its hash."""
+        digest = content_hash(data)
+        blob_path = self._blob_path(digest)
+        if not blob_path.exists():
+            tmp_file = stage_file(blob_path, data)
+            # Blobs are shared by every generation that references them, so keep them read-only
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, blob_path)
+        return digest
+    
+    def generations(self) -> List[int]:
+        """Generation numbers, oldest first."""
+        if not self.generations_dir.is_dir():
+            return []
+        return sorted(int(p.stem) for p in self.generations_dir.glob("*.json") if p.stem.isdigit())
+    
+    def load(self, generation: int) -> Dict:
+        """Load a generation manifest."""
+        with open(self.generations_dir / f"{generation:06d}.json", 'r') as f:
+            return json.load(f)
+    
+    def snapshot(self, files: Iterable[Tuple[str, Path]], label: str = "") -> Optional[int]:
+        """Record the current content of (app, path) pairs as a new generation.
+        
+        Files whose size and mtime match the previous generation reuse its blob
+        without being read. Returns None if nothing changed since then.
+        """
+        generations = self.generations()
+        previous = self.load(generations[-1])["files"] if generations else {}
+        
+        entries = {}
+        for app_name, path in files:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            
+            key = str(path)
+            old = previous.get(key)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                entries[key] = dict(old, app=app_name)
+                continue
+            
+            with open(path, 'rb') as f:
+                digest = self._store_blob(f.read())
+            entries[key] = {"app": app_name, "blob": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        
+        if generations and {k: v["blob"] for k, v in entries.items()} == {k: v["blob"] for k, v in previous.items()}:
+            return None
+        
+        manifest = {"created_at": time.time(), "label": label, "files": entries}
+        generation = (generations[-1] if generations else 0) + 1
+        self.generations_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            try:
+                # O_EXCL so two writers never claim the same generation number
+                fd = os.open(self.generations_dir / f"{generation:06d}.json", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                break
+            except FileExistsError:
+                generation += 1
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        if len(generations) + 1 > self.keep:
+            self.gc()
+        return generation
+    
+    def restore(self, generation: int, changes: Optional[ChangeManifest] = None) -> List[str]:
+        """Put every file of a generation back in place; returns the paths that changed."""
+        restored = []
+        for key, entry in self.load(generation)["files"].items():
+            path = Path(key)
+            blob_path = self._blob_path(entry["blob"])
+            try:
+                st = path.stat()
+                if st.st_size == entry["size"] and content_hash(path.read_bytes()) == entry["blob"]:
+                    continue
+            except FileNotFoundError:
+                pass
+            
+            # Copy rather than hardlink: live files must stay writable and independent of the blob
+            os.replace(stage_file(path, blob_path.read_bytes()), path)
+            
+            restored.append(key)
+            if changes is not None:
+                changes.record(entry["app"], path, path.read_bytes())
+        return restored
+    
+    def gc(self) -> Tuple[int, int]:
+        """Drop generations beyond the retention limit and unreferenced blobs.
+        
+        The original-configs generation is pinned and not counted against the limit.
+        Returns (generations removed, blobs removed).
+        """
+        generations = self.generations()
+        if generations and self.load(generations[0]).get("label") == ORIGINAL_LABEL:
+            generations = generations[1:]
+        expired = generations[:-self.keep] if len(generations) > self.keep else []
+        for generation in expired:
+            (self.generations_dir / f"{generation:06d}.json").unlink(missing_ok=True)
+        
+        referenced = set()
+        for generation in self.generations():
+            referenced.update(entry["blob"] for entry in self.load(generation)["files"].values())
+        
+        removed_blobs = 0
+        if self.blobs_dir.is_dir():
+            for blob_path in self.blobs_dir.glob("*/*"):
+                if blob_path.parent.name + blob_path.name not in referenced:
+                    blob_path.unlink()
+                    removed_blobs += 1
+        
+        # Legacy <name>.backup files and timestamped directories from apply_theme.sh
+        for legacy in self.root.iterdir() if self.root.is_dir() else []:
+            if legacy.name.endswith(".backup") and legacy.is_file():
+                legacy.unlink()
+            elif legacy.is_dir() and legacy.name[:8].isdigit() and "_" in legacy.name:
+                shutil.rmtree(legacy)
+        
+        return len(expired), removed_blobs
+
+def main():
+    """CLI entry point for listing, restoring and pruning backup generations."""
+    usage = "Usage: backup_store.py <list|restore [generation]|gc>"
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "restore", "gc"):
+        print(usage)
+        sys.exit(1)
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    theme_data_dir = dotfiles_dir / "theme_engine" / "theme_data"
+    store = BackupStore(theme_data_dir / "backups")
+    generations = store.generations()
+    
+    if sys.argv[1] == "list":
+        for generation in generations:
+            manifest = store.load(generation)
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest["created_at"]))
+            print(f"{generation:6d}  {created}  {len(manifest['files']):3d} files  {manifest['label']}")
+    elif sys.argv[1] == "restore":
+        # Default: the generation before the current one
+        if len(sys.argv) > 2:
+            generation = int(sys.argv[2])
+        elif len(generations) >= 2:
+            generation = generations[-2]
+        else:
+            print("No previous generation to restore")
+            sys.exit(1)
+        
+        if generation not in generations:
+            print(f"Unknown generation: {generation}")
+            sys.exit(1)
+        
+        # Record restored files so reload_apps.sh reloads exactly those apps
+        changes = ChangeManifest(theme_data_dir / "changes.json", "merge")
+        restored = store.restore(generation, changes)
+        changes.save()
+        print(f"Restored generation {generation} ({len(restored)} files changed)")
+    else:
+        removed_generations, removed_blobs = store.gc()
+        print(f"Removed {removed_generations} generations and {removed_blobs} blobs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# theme_engine/benchmark.py
+# End-to-end benchmarks for the theming pipeline
+# Extraction, rendering, merging, thumbnails and cold-start applies run against
+# synthetic wallpapers in a throwaway dotfiles tree and HOME, with a stub Ollama
+# server standing in for LLaVA; results are JSON so runs from different commits
+# can be compared
+# Requires: python-pillow (python-numpy for the native engine cases)
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Synthetic wallpaper sizes, smallest first
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "5k": (5120, 2880),
+}
+FORMATS = ("png", "jpg")
+
+# Median slowdown (fraction) above which compare() reports a regression
+DEFAULT_THRESHOLD = 0.15
+# Absolute median change (ms) below which differences are treated as noise
+NOISE_FLOOR_MS = 0.5
+
+# Answer of the stub LLaVA model (two palettes, so repeated renders really change files)
+STUB_PALETTES = (
+    {
+        "primary": "#5e81ac", "secondary": "#81a1c1", "tertiary": "#88c0d0",
+        "background": "#2e3440", "surface": "#3b4252", "accent": "#d08770",
+        "text_primary": "#eceff4", "text_secondary": "#d8dee9", "text_accent": "#ebcb8b",
+    },
+    {
+        "primary": "#a3be8c", "secondary": "#b48ead", "tertiary": "#8fbcbb",
+        "background": "#1f2329", "surface": "#2a2f38", "accent": "#bf616a",
+        "text_primary": "#f0f0f0", "text_secondary": "#c8ccd4", "text_accent": "#e5c07b",
+    },
+)
+
+class StubOllama:
+    """Minimal Ollama API (/api/tags, /api/version, /api/generate) with configurable latency."""
+    
+    def __init__(self, latency_ms: float = 150.0, token_ms: float = 2.0, model: str = "llava:latest"):
+        # latency_ms stands in for model load and prompt evaluation, token_ms for decoding
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.model = model
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+    
+    def _handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+            
+            def _send_json(self, data: Dict) -> None:
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                stub.requests += 1
+                if self.path == "/api/tags":
+                    self._send_json({"models": [{"name": stub.model}]})
+                elif self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-stub"})
+                else:
+                    self.send_error(404)
+            
+            def do_POST(self):
+                stub.requests += 1
+                if self.path != "/api/generate":
+                    self.send_error(404)
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                answer = json.dumps(STUB_PALETTES[0], indent=2)
+                # Roughly four characters per token, like a real tokenizer on hex-heavy JSON
+                tokens = [answer[i:i + 4] for i in range(0, len(answer), 4)]
+                time.sleep(stub.latency_ms / 1000)
+                
+                if not request.get("stream", True):
+                    time.sleep(stub.token_ms * len(tokens) / 1000)
+                    self._send_json({"model": stub.model, "response": answer, "done": True})
+                    return
+                
+                # NDJSON until the connection closes (HTTP/1.0), as the client reads lines
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        time.sleep(stub.token_ms / 1000)
+                        self.wfile.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+                        self.wfile.flush()
+                    self.wfile.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stops reading once the palette object is complete
+                    pass
+        
+        return Handler
+    
+    def start(self) -> str:
+        """Serve on a free local port in a background thread; returns the base URL."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+    
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def synth_wallpaper(path: Path, width: int, height: int, seed: int = 0) -> None:
+    """Write a deterministic gradient-and-noise image (compresses roughly like a photo)."""
+    from PIL import Image, ImageChops, ImageFilter
+    
+    horizontal = Image.linear_gradient("L").rotate(90 * (seed % 4)).resize((width, height))
+    radial = Image.radial_gradient("L").resize((width, height))
+    # Noise is generated small and scaled up, so it has structure instead of pure grain
+    noise = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 64 + 8 * seed)
+    noise = noise.resize((width, height), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    grain = Image.effect_noise((width, height), 12)
+    
+    channels = [horizontal, radial, ImageChops.add(noise, grain, scale=2.0)]
+    channels = channels[seed % 3:] + channels[:seed % 3]
+    image = Image.merge("RGB", channels)
+    if path.suffix == ".png":
+        image.save(path, "PNG")
+    else:
+        image.save(path, "JPEG", quality=90)
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """min/median/mean/p95/max of millisecond samples."""
+    ordered = sorted(samples)
+    count = len(ordered)
+    middle = count // 2
+    median = ordered[middle] if count % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+    return {
+        "n": count,
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(median, 3),
+        "mean_ms": round(sum(ordered) / count, 3),
+        "p95_ms": round(ordered[min(count - 1, int(round(0.95 * (count - 1))))], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+def _git_revision(repo_dir: Path) -> Tuple[str, bool]:
+    """(short commit, working tree dirty) of the dotfiles repo, or ('unknown', False)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, timeout=10, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                                capture_output=True, text=True, timeout=30).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.SubprocessError):
+        return "unknown", False
+
+class BenchmarkSuite:
+    """Runs the pipeline benchmarks in an isolated workspace."""
+    
+    def __init__(self, dotfiles_dir: str, repeat: int = 5, resolutions: Optional[List[str]] = None,
+                 only: Optional[List[str]] = None, latency_ms: float = 150.0, token_ms: float = 2.0):
+        self.dotfiles_dir = Path(dotfiles_dir).resolve()
+        self.repeat = max(1, repeat)
+        self.resolutions = resolutions or list(RESOLUTIONS)
+        self.only = only or []
+        self.stub = StubOllama(latency_ms=latency_ms, token_ms=token_ms)
+        # Synthetic wallpapers are kept between runs; generating 5K PNGs takes a while
+        self.wallpaper_cache = self.dotfiles_dir / "theme_engine" / "theme_data" / "benchmark" / "wallpapers"
+        self.results: Dict[str, Dict[str, float]] = {}
+        
+        self.workspace: Optional[Path] = None
+        self.bench_dir: Optional[Path] = None
+        self.wallpapers: Dict[str, Path] = {}
+    
+    def config(self) -> Dict:
+        """Settings that must match for results to be comparable."""
+        return {
+            "repeat": self.repeat,
+            "resolutions": self.resolutions,
+            "stub_latency_ms": self.stub.latency_ms,
+            "stub_token_ms": self.stub.token_ms,
+        }
+    
+    def _selected(self, name: str) -> bool:
+        return not self.only or any(name.startswith(prefix) for prefix in self.only)
+    
+    def _prepare_workspace(self) -> None:
+        """Temp dotfiles tree (real templates and static configs), HOME and wallpapers."""
+        self.workspace = Path(tempfile.mkdtemp(prefix="clypr-bench-"))
+        self.bench_dir = self.workspace / "dotfiles"
+        (self.bench_dir / "theme_engine" / "theme_data").mkdir(parents=True)
+        for name in ("config_templates", "config_static"):
+            (self.bench_dir / name).symlink_to(self.dotfiles_dir / name)
+        
+        home = self.workspace / "home"
+        (home / ".config").mkdir(parents=True)
+        # Before any engine import: theme_logging and ConfigMerger resolve paths from HOME
+        os.environ["HOME"] = str(home)
+        
+        library = self.bench_dir / "wallpapers" / "bench"
+        library.mkdir(parents=True)
+        self.wallpaper_cache.mkdir(parents=True, exist_ok=True)
+        for seed, resolution in enumerate(self.resolutions):
+            width, height = RESOLUTIONS[resolution]
+            for fmt in FORMATS:
+                name = f"{resolution}.{fmt}"
+                cached = self.wallpaper_cache / name
+                if not cached.exists():
+                    print(f"Generating {name} ({width}x{height})...", file=sys.stderr)
+                    synth_wallpaper(cached, width, height, seed)
+                shutil.copy2(cached, library / name)
+                self.wallpapers[f"{resolution}.{fmt}"] = library / name
+    
+    def _measure(self, name: str, run: Callable[[], None], setup: Optional[Callable[[], None]] = None,
+                 repeat: Optional[int] = None) -> None:
+        """Time run() repeat times (setup() untimed before each) and record the summary."""
+        if not self._selected(name):
+            return
+        samples = []
+        for _ in range(repeat or self.repeat):
+            # Pipeline progress output would dominate the terminal and cost time itself
+            with contextlib.redirect_stdout(io.StringIO()):
+                if setup:
+                    setup()
+                start = time.perf_counter()
+                run()
+                samples.append((time.perf_counter() - start) * 1000)
+        self.results[name] = summarize(samples)
+        summary = self.results[name]
+        print(f"{name:32} median {summary['median_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms",
+              file=sys.stderr)
+    
+    def _reset_extraction_state(self) -> None:
+        """Forget cached palettes, hashes, upload payloads and the Ollama model list."""
+        theme_data_dir = self.bench_dir / "theme_engine" / "theme_data"
+        for pattern in ("palettes.db*", "fingerprints.json", "ollama_state.json"):
+            for path in theme_data_dir.glob(pattern):
+                path.unlink()
+        shutil.rmtree(theme_data_dir / "llava_payload", ignore_errors=True)
+    
+    def bench_extract(self) -> None:
+        from extract_colors import ColorExtractor
+        from native_palette import NATIVE_AVAILABLE
+        
+        engines = ["llava"] + (["native"] if NATIVE_AVAILABLE else [])
+        state: Dict = {}
+        
+        def fresh_extractor(engine: str, reset: bool) -> Callable[[], None]:
+            def setup() -> None:
+                if reset:
+                    self._reset_extraction_state()
+                state["extractor"] = ColorExtractor(str(self.bench_dir), engine=engine)
+            return setup
+        
+        for key, wallpaper in self.wallpapers.items():
+            for engine in engines:
+                self._measure(f"extract.{engine}.cold.{key}",
+                              lambda: state["extractor"].extract_colors(str(wallpaper)),
+                              setup=fresh_extractor(engine, reset=True))
+            # Cached palette, as on every re-apply (fresh extractor like a CLI run)
+            if self._selected(f"extract.warm.{key}"):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ColorExtractor(str(self.bench_dir), engine="auto").get_palette(str(wallpaper))
+            self._measure(f"extract.warm.{key}", lambda: state["extractor"].extract_colors(str(wallpaper)),
+                          setup=fresh_extractor("auto", reset=False))
+    
+    def bench_render_merge(self) -> None:
+        from extract_colors import ColorExtractor
+        from merge_configs import ConfigMerger
+        from render_templates import ThemeRenderer
+        
+        extractor = ColorExtractor(str(self.bench_dir), engine="native")
+        themes = [extractor.theme_data(str(path), palette)
+                  for path, palette in zip(list(self.wallpapers.values())[:2], STUB_PALETTES)]
+        state = {"turn": 0}
+        
+        def next_theme() -> Dict:
+            # Alternate palettes so every iteration changes every rendered file
+            state["turn"] += 1
+            return themes[state["turn"] % len(themes)]
+        
+        renderer = ThemeRenderer(str(self.bench_dir))
+        self._measure("render.all_templates", lambda: renderer.render_all_templates(state["theme"]),
+                      setup=lambda: state.update(theme=next_theme()))
+        
+        merger = ConfigMerger(str(self.bench_dir))
+        self._measure("merge.all_configs", merger.merge_all_configs,
+                      setup=lambda: renderer.render_all_templates(next_theme()))
+    
+    def bench_thumbnails(self) -> None:
+        from thumbnails import ThumbnailEngine
+        
+        engine = ThumbnailEngine(str(self.bench_dir))
+        self._measure("thumbnails.cold", engine.build,
+                      setup=lambda: shutil.rmtree(engine.thumbnails_dir, ignore_errors=True))
+        self._measure("thumbnails.warm", engine.build)
+    
+    def bench_startup(self) -> None:
+        """Fresh-interpreter applies: what a user waits for when a cached theme is re-applied."""
+        engine_dir = self.bench_dir / "theme_engine"
+        # clypr.py finds its dotfiles tree from its own path, so run it from the workspace
+        entry_point = engine_dir / "clypr.py"
+        if not entry_point.exists():
+            entry_point.symlink_to(Path(__file__).parent / "clypr.py")
+        command = [sys.executable, str(entry_point), "apply", str(next(iter(self.wallpapers.values()))),
+                   "--no-daemon", "--no-wallpaper", "--no-reload", "--engine", "native"]
+        
+        self._measure("startup.python", lambda: subprocess.run([sys.executable, "-c", "pass"], check=True))
+        if self._selected("startup.apply_cached"):
+            # First run extracts the palette and builds the bundle; measured runs are pure cache hits
+            subprocess.run(command, capture_output=True, check=True)
+        self._measure("startup.apply_cached", lambda: subprocess.run(command, capture_output=True, check=True))
+    
+    def run(self) -> Dict:
+        """Run every selected benchmark; returns the result document."""
+        sys.path.insert(0, str(Path(__file__).parent))
+        self._prepare_workspace()
+        os.environ["CLYPR_OLLAMA_URL"] = self.stub.start()
+        started = time.time()
+        try:
+            self.bench_extract()
+            self.bench_render_merge()
+            self.bench_thumbnails()
+            self.bench_startup()
+        finally:
+            self.stub.stop()
+            shutil.rmtree(self.workspace, ignore_errors=True)
+        
+        commit, dirty = _git_revision(self.dotfiles_dir)
+        return {
+            "version": 1,
+            "meta": {
+                "commit": commit,
+                "dirty": dirty,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+                "duration_s": round(time.time() - started, 1),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "config": self.config(),
+            },
+            "results": self.results,
+        }
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD,
+            noise_floor_ms: float = NOISE_FLOOR_MS) -> List[Tuple[str, Optional[float], Optional[float], str]]:
+    """(case, baseline median, current median, status) for every case in either run.
+    
+    status is 'regression' when the median grew by more than threshold (and more than
+    noise_floor_ms), 'improvement' for the mirror case, else 'ok', 'new' or 'missing'.
+    """
+    base_results, new_results = baseline["results"], current["results"]
+    rows = []
+    for case in sorted(set(base_results) | set(new_results)):
+        if case not in base_results:
+            rows.append((case, None, new_results[case]["median_ms"], "new"))
+            continue
+        if case not in new_results:
+            rows.append((case, base_results[case]["median_ms"], None, "missing"))
+            continue
+        
+        before, after = base_results[case]["median_ms"], new_results[case]["median_ms"]
+        status = "ok"
+        if abs(after - before) > noise_floor_ms:
+            if after > before * (1 + threshold):
+                status = "regression"
+            elif after < before * (1 - threshold):
+                status = "improvement"
+        rows.append((case, before, after, status))
+    return rows
+
+def print_comparison(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """Print a comparison table; returns True if any case regressed."""
+    if baseline["meta"].get("config") != current["meta"].get("config"):
+        print("Warning: runs used different benchmark settings, results may not be comparable")
+    print(f"Baseline {baseline['meta']['commit']} vs {current['meta']['commit']} "
+          f"(threshold {threshold * 100:.0f}%)")
+    
+    regressed = False
+    for case, before, after, status in compare(baseline, current, threshold):
+        change = f"{(after / before - 1) * 100:+7.1f}%" if before and after else "       "
+        before_text = f"{before:10.2f}" if before is not None else " " * 10
+        after_text = f"{after:10.2f}" if after is not None else " " * 10
+        marker = {"ok": "", "regression": "  REGRESSION"}.get(status, f"  {status}")
+        print(f"{case:32} {before_text} {after_text} ms {change}{marker}")
+        regressed |= status == "regression"
+    return regressed
+
+def main():
+    """CLI entry point: run the benchmarks, or compare two result files."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark the theming pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    run = commands.add_parser("run", help="run the benchmarks and write a JSON result file")
+    run.add_argument("--repeat", type=int, default=5, help="iterations per case (default: 5)")
+    run.add_argument("--quick", action="store_true", help="1080p and 4k only, 3 iterations")
+    run.add_argument("--resolution", action="append", choices=list(RESOLUTIONS),
+                     help="limit to a resolution (repeatable)")
+    run.add_argument("--only", action="append", metavar="PREFIX",
+                     help="only cases starting with PREFIX, e.g. extract.native (repeatable)")
+    run.add_argument("--ollama-latency", type=float, default=150.0,
+                     help="stub Ollama delay before the first token, ms (default: 150)")
+    run.add_argument("--token-latency", type=float, default=2.0,
+                     help="stub Ollama delay per token, ms (default: 2)")
+    run.add_argument("--output", help="result file (default: theme_data/benchmark/<time>-<commit>.json)")
+    run.add_argument("--baseline", help="compare against this result file; exit 1 on regression")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                     help=f"allowed median slowdown as a fraction (default: {DEFAULT_THRESHOLD})")
+    
+    check = commands.add_parser("compare", help="compare two result files; exit 1 on regression")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help=f"allowed median slowdown as a fraction (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+    
+    if args.command == "compare":
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r') as f:
+            current = json.load(f)
+        sys.exit(1 if print_comparison(baseline, current, args.threshold) else 0)
+    
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        print("Error: benchmarks require python-pillow")
+        sys.exit(1)
+    
+    dotfiles_dir = Path(__file__).resolve().parent.parent
+    resolutions = args.resolution or (["1080p", "4k"] if args.quick else None)
+    suite = BenchmarkSuite(str(dotfiles_dir), repeat=3 if args.quick else args.repeat, resolutions=resolutions,
+                           only=args.only, latency_ms=args.ollama_latency, token_ms=args.token_latency)
+    result = suite.run()
+    
+    output = Path(args.output) if args.output else (
+        dotfiles_dir / "theme_engine" / "theme_data" / "benchmark"
+        / f"{time.strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        sys.exit(1 if print_comparison(baseline, result, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
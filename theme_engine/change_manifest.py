@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# theme_engine/change_manifest.py
+# Content-hash change tracking between render, merge and reload
+# Each stage writes only outputs whose content changed and records them per app,
+# so reload_apps.sh can restart just the applications that are affected
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+def content_hash(data: bytes) -> str:
+    """Short content hash used to identify output versions."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def tree_version(*roots: Path) -> str:
+    """Version hash of roots (files, or every file below directories) from path, size and mtime only."""
+    digest = hashlib.blake2b(digest_size=16)
+    for root in roots:
+        if os.path.isfile(root):
+            st = os.stat(root)
+            digest.update(f"{root}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                digest.update(f"{dirpath}/{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def stage_file(path: Path, data: bytes) -> Path:
+    """Write data to a temp file next to path, ready to be published with os.replace."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    
+    # Same directory as the target so os.replace is an atomic rename
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates 0600; keep the mode of the file being replaced
+        # (plus owner write, in case it was a read-only restored backup blob)
+        try:
+            os.chmod(tmp_name, (path.stat().st_mode & 0o7777) | 0o200)
+        except FileNotFoundError:
+            os.chmod(tmp_name, 0o644)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return Path(tmp_name)
+
+def write_json_atomic(path: Path, data: Any, indent: Optional[int] = None) -> None:
+    """Write data as JSON to path through a unique temp file, so concurrent writers never share one."""
+    os.replace(stage_file(path, json.dumps(data, indent=indent).encode("utf-8")), path)
+
+class ChangeManifest:
+    """Tracks which output files of a stage actually changed, grouped by app."""
+    
+    def __init__(self, manifest_file: Path, stage: str):
+        self.manifest_file = Path(manifest_file)
+        self.stage = stage
+        self._data: Dict[str, Dict[str, Dict[str, str]]] = {}
+        # Apps written through this instance, as opposed to pending from earlier runs
+        self.written_apps: Set[str] = set()
+        self._load()
+    
+    def _load(self) -> None:
+        try:
+            with open(self.manifest_file, 'r') as f:
+                self._data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._data = {}
+    
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        write_json_atomic(self.manifest_file, self._data, indent=2)
+    
+    def reset(self) -> None:
+        """Forget this stage's recorded changes."""
+        self._data[self.stage] = {}
+    
+    def unchanged(self, path: Path, data: bytes) -> bool:
+        """True if path already holds exactly data."""
+        try:
+            with open(path, 'rb') as f:
+                return f.read() == data
+        except FileNotFoundError:
+            return False
+    
+    def record(self, app_name: str, path: Path, data: bytes) -> None:
+        """Record that path now holds data."""
+        self._data.setdefault(self.stage, {}).setdefault(app_name, {})[str(path)] = content_hash(data)
+        self.written_apps.add(app_name)
+    
+    def write(self, app_name: str, path: Path, content: str,
+              before_write: Optional[Callable[[Path], None]] = None) -> bool:
+        """Atomically write content to path unless the file already holds it; returns True if written."""
+        path = Path(path)
+        data = content.encode("utf-8")
+        if self.unchanged(path, data):
+            return False
+        
+        if before_write:
+            before_write(path)
+        os.replace(stage_file(path, data), path)
+        
+        self.record(app_name, path, data)
+        return True
+    
+    def changed_apps(self, stage: Optional[str] = None) -> List[str]:
+        """Apps with at least one changed output in the given stage."""
+        return sorted(app for app, files in self._data.get(stage or self.stage, {}).items() if files)
+    
+    def take(self, stage: Optional[str] = None) -> List[str]:
+        """Return the changed apps of a stage and clear them, so each change is consumed once."""
+        apps = self.changed_apps(stage)
+        self._data[stage or self.stage] = {}
+        self.save()
+        return apps
+
+def main():
+    """CLI entry point: list (or consume) apps whose merged configs changed."""
+    usage = "Usage: change_manifest.py <show|take>"
+    if len(sys.argv) != 2 or sys.argv[1] not in ("show", "take"):
+        print(usage)
+        sys.exit(1)
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    manifest_file = dotfiles_dir / "theme_engine" / "theme_data" / "changes.json"
+    
+    # No manifest yet: the caller cannot know what changed and should reload everything
+    if not manifest_file.exists():
+        sys.exit(3)
+    
+    manifest = ChangeManifest(manifest_file, "merge")
+    if sys.argv[1] == "show":
+        for stage in ("render", "merge"):
+            print(f"{stage}: {' '.join(manifest.changed_apps(stage)) or '(none)'}")
+    else:
+        for app_name in manifest.take():
+            print(app_name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# theme_engine/clypr.py
+# Single-process theme pipeline: extract -> render -> merge -> wallpaper -> reload
+# apply_theme.sh delegates here instead of starting an interpreter per step;
+# engine modules are imported only on the paths that need them, so a cached
+# apply never loads the HTTP stack, base64 or imaging libraries
+
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from theme_logging import log_error, log_info, log_success, log_warning
+from tracing import span
+
+# Process start until the pipeline runs: interpreter plus imports (CLYPR_STARTUP_BUDGET_MS overrides)
+STARTUP_BUDGET_MS = 150
+# Modules only extraction (LLaVA upload, native engine) or rendering needs
+HEAVY_MODULES = ("requests", "urllib3", "base64", "PIL", "numpy")
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage fails and the theme could not be applied."""
+
+def startup_ms() -> Optional[float]:
+    """Milliseconds since this process started (CLYPR_STARTED from the caller, else /proc)."""
+    started = os.getenv("CLYPR_STARTED")
+    if started:
+        try:
+            return (time.time() - float(started)) * 1000
+        except ValueError:
+            pass
+    
+    try:
+        with open("/proc/self/stat", 'r') as f:
+            # starttime is field 22; fields after the command name start at 3
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", 'r') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000
+
+def loaded_heavy_modules() -> List[str]:
+    """Heavy modules imported by this process so far."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+class ThemePipeline:
+    """Applies or restores a theme in one process, handing the work to a running theme daemon if any."""
+    
+    def __init__(self, dotfiles_dir: str, engine: str = "auto", use_daemon: bool = True,
+                 set_wallpaper: bool = True, reload: bool = True):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.theme_data_dir = self.dotfiles_dir / "theme_engine" / "theme_data"
+        self.current_theme_file = self.theme_data_dir / "current.json"
+        self.engine = engine
+        self.use_daemon = use_daemon
+        self.wallpaper_enabled = set_wallpaper
+        self.reload_enabled = reload
+    
+    def check_dependencies(self) -> None:
+        """swww is required to set the wallpaper; without requests only LLaVA is unavailable."""
+        import importlib.util
+        import shutil
+        
+        if self.wallpaper_enabled and shutil.which("swww") is None:
+            raise PipelineError("Missing dependency: swww (install with: sudo pacman -S swww)")
+        if self.engine != "native" and importlib.util.find_spec("requests") is None:
+            log_warning("APPLY", "python-requests not installed, LLaVA extraction unavailable (falling back to native engine)")
+    
+    def _load_current_theme(self) -> Dict[str, Any]:
+        with open(self.current_theme_file, 'r') as f:
+            return json.load(f)
+    
+    def _daemon(self, command: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run a pipeline command in the theme daemon; None when no daemon is running."""
+        if not self.use_daemon:
+            return None
+        from theme_daemon import DaemonTimeout, send_command
+        
+        with span("daemon") as sp:
+            try:
+                response = send_command(command, args)
+            except DaemonTimeout as e:
+                # The daemon may still be writing configs, so running the pipeline here would race it
+                raise PipelineError(f"{e}; not applying locally while it may still be running") from e
+            if response is None:
+                sp.set(running=False)
+                return None
+            if not response.get("ok"):
+                raise PipelineError(f"Theme daemon failed to {command} theme: {response.get('error')}")
+        log_success("APPLY", "Theme pipeline completed by daemon")
+        return response["result"]
+    
+    def extract(self, wallpaper_path: str) -> Dict[str, str]:
+        """Extract (or load the cached) palette and make it the current theme."""
+        from extract_colors import ColorExtractor
+        
+        log_info("APPLY", "Extracting colors from wallpaper...")
+        # The extractor reports progress on stdout; its log lines still reach the log file
+        with span("extract"), open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            palette = ColorExtractor(str(self.dotfiles_dir), engine=self.engine).extract_colors(wallpaper_path)
+        log_success("APPLY", "Colors extracted successfully")
+        return palette
+    
+    def build(self, theme_data: Dict[str, Any]) -> bool:
+        """Render templates and merge configs, or swap in the prebuilt bundle; True on a bundle hit."""
+        from merge_configs import ConfigMerger
+        from render_templates import ThemeRenderer
+        from theme_bundles import ThemeBundles
+        
+        log_info("APPLY", "Rendering templates and merging configurations...")
+        try:
+            with span("build"):
+                hit = ThemeBundles(str(self.dotfiles_dir)).apply(
+                    theme_data, ThemeRenderer(str(self.dotfiles_dir)), ConfigMerger(str(self.dotfiles_dir)))
+        except Exception as e:
+            raise PipelineError(f"Rendering or merging configs failed: {e}") from e
+        
+        if hit:
+            log_success("APPLY", "Configurations applied from prebuilt bundle")
+        else:
+            log_success("APPLY", "Configurations rendered and merged")
+        return hit
+    
+    def set_wallpaper(self, wallpaper_path: str) -> None:
+        """Set the wallpaper through swww, starting its daemon if needed."""
+        if not self.wallpaper_enabled:
+            return
+        from reload_apps import find_pids, wait_until
+        
+        log_info("APPLY", "Setting wallpaper...")
+        with span("wallpaper"):
+            if not find_pids("swww-daemon"):
+                log_info("APPLY", "Starting swww daemon...")
+                subprocess.Popen(["swww-daemon"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                 start_new_session=True)
+                # Wait until the daemon answers instead of a fixed delay
+                wait_until(lambda: subprocess.run(["swww", "query"], capture_output=True).returncode == 0,
+                           timeout=5.0, interval=0.05)
+            
+            result = subprocess.run(["swww", "img", wallpaper_path, "--transition-type", "wipe",
+                                     "--transition-duration", "1", "--transition-fps", "60",
+                                     "--transition-angle", "30"], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise PipelineError(f"Failed to set wallpaper: {result.stderr.strip()}")
+        log_success("APPLY", "Wallpaper set successfully")
+    
+    def reload(self) -> None:
+        """Reload the apps whose configs changed."""
+        if not self.reload_enabled:
+            return
+        from reload_apps import changed_apps, reload_and_report
+        
+        log_info("APPLY", "Reloading applications...")
+        with span("reload"):
+            failed = reload_and_report(self.dotfiles_dir, changed_apps(self.dotfiles_dir))
+        if failed:
+            log_warning("APPLY", "Some applications failed to reload")
+        else:
+            log_success("APPLY", "Applications reloaded successfully")
+    
+    def apply(self, wallpaper_path: str) -> Dict[str, str]:
+        """Full theme application for a wallpaper; returns the palette."""
+        wallpaper_path = os.path.abspath(wallpaper_path)
+        if not os.path.isfile(wallpaper_path):
+            raise PipelineError(f"Wallpaper file not found: {wallpaper_path}")
+        log_info("APPLY", f"Applying theme for wallpaper: {Path(wallpaper_path).name}")
+        
+        # The daemon extracts with the engine chosen here, not the one it was started with
+        result = self._daemon("apply", {"wallpaper": wallpaper_path, "engine": self.engine})
+        if result is not None:
+            palette = result["palette"]
+        else:
+            palette = self.extract(wallpaper_path)
+            self.build(self._load_current_theme())
+        
+        self.set_wallpaper(wallpaper_path)
+        self.reload()
+        log_success("APPLY", "Theme applied successfully!")
+        return palette
+    
+    def restore(self) -> Dict[str, str]:
+        """Re-apply the current theme (e.g. at login); returns the palette."""
+        if not self.current_theme_file.exists():
+            raise PipelineError("No previous theme found to restore")
+        log_info("APPLY", "Restoring previous theme...")
+        
+        result = self._daemon("restore", {})
+        if result is not None:
+            palette, wallpaper_path = result["palette"], result["wallpaper_path"]
+        else:
+            theme_data = self._load_current_theme()
+            palette, wallpaper_path = theme_data["palette"], theme_data["wallpaper_path"]
+            if not os.path.isfile(wallpaper_path):
+                raise PipelineError(f"Previous wallpaper not found: {wallpaper_path}")
+            log_info("APPLY", f"Restoring theme for wallpaper: {Path(wallpaper_path).name}")
+            self.build(theme_data)
+        
+        self.set_wallpaper(wallpaper_path)
+        self.reload()
+        log_success("APPLY", "Theme restored successfully")
+        return palette
+    
+    def restore_generation(self, generation: int) -> None:
+        """Put a backup generation's files back, then set its wallpaper and reload."""
+        from backup_store import BackupStore
+        from change_manifest import ChangeManifest
+        
+        store = BackupStore(self.theme_data_dir / "backups")
+        if generation not in store.generations():
+            raise PipelineError(f"Unknown generation: {generation} (see backup_store.py list)")
+        log_info("APPLY", f"Restoring backup generation {generation}...")
+        
+        # Record restored files so only those apps are reloaded
+        changes = ChangeManifest(self.theme_data_dir / "changes.json", "merge")
+        restored = store.restore(generation, changes)
+        changes.save()
+        log_info("APPLY", f"Restored {len(restored)} files")
+        
+        wallpaper_path = self._load_current_theme().get("wallpaper_path", "")
+        if os.path.isfile(wallpaper_path):
+            self.set_wallpaper(wallpaper_path)
+        else:
+            log_warning("APPLY", f"Wallpaper of generation {generation} not found: {wallpaper_path}")
+        self.reload()
+        log_success("APPLY", f"Generation {generation} restored")
+
+def check_startup(root_span, elapsed_ms: Optional[float], budget_ms: float) -> None:
+    """Attach the cold-start time to the run's root span and warn when it exceeds the budget."""
+    if elapsed_ms is None:
+        return
+    root_span.set(startup_ms=round(elapsed_ms, 1), startup_budget_ms=budget_ms)
+    if elapsed_ms > budget_ms:
+        log_warning("APPLY", f"Startup took {elapsed_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+
+def main():
+    """CLI entry point: apply a wallpaper's theme or restore the current one / a backup generation."""
+    started = startup_ms()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Apply or restore a theme in a single process")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    apply_parser = subparsers.add_parser("apply", help="apply the theme of a wallpaper")
+    apply_parser.add_argument("wallpaper_path")
+    restore_parser = subparsers.add_parser("restore", help="restore the current theme or a backup generation")
+    restore_parser.add_argument("generation", nargs="?", type=int)
+    for sub in (apply_parser, restore_parser):
+        sub.add_argument("--engine", choices=["native", "llava", "auto"], default=os.getenv("CLYPR_ENGINE", "auto"))
+        sub.add_argument("--no-daemon", action="store_true", help="run the pipeline here even if the daemon runs")
+        sub.add_argument("--no-wallpaper", action="store_true", help="do not set the wallpaper")
+        sub.add_argument("--no-reload", action="store_true", help="do not reload applications")
+    args = parser.parse_args()
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    pipeline = ThemePipeline(str(dotfiles_dir), engine=args.engine, use_daemon=not args.no_daemon,
+                             set_wallpaper=not args.no_wallpaper, reload=not args.no_reload)
+    budget_ms = float(os.getenv("CLYPR_STARTUP_BUDGET_MS", str(STARTUP_BUDGET_MS)))
+    
+    # One trace per run, rooted at the whole apply or restore
+    try:
+        with span(args.command) as sp:
+            check_startup(sp, started, budget_ms)
+            pipeline.check_dependencies()
+            if args.command == "apply":
+                palette = pipeline.apply(args.wallpaper_path)
+            elif args.generation is not None:
+                palette = None
+                pipeline.restore_generation(args.generation)
+            else:
+                palette = pipeline.restore()
+            sp.set(imports=loaded_heavy_modules())
+    except PipelineError as e:
+        log_error("APPLY", str(e))
+        sys.exit(1)
+    
+    if args.command == "apply" and palette:
+        log_info("APPLY", "Color palette:")
+        for key, color in palette.items():
+            print(f"  {key}: {color}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# theme_engine/color_math.py
+# Pure-Python OKLab/OKLCh color math for single colors
+# Shares its matrices with the NumPy helpers in native_palette, so template
+# variables resolve identically on systems without NumPy
+
+import math
+from typing import List, Sequence, Tuple
+
+Color = Tuple[float, float, float]
+
+# Linear sRGB -> LMS and LMS' -> OKLab matrices (Björn Ottosson)
+RGB_TO_LMS = [
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+]
+LMS_TO_OKLAB = [
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+]
+# Inverses of the above
+OKLAB_TO_LMS = [
+    [1.0, 0.3963377774, 0.2158037573],
+    [1.0, -0.1055613458, -0.0638541728],
+    [1.0, -0.0894841775, -1.2914855480],
+]
+LMS_TO_RGB = [
+    [4.0767416621, -3.3077115913, 0.2309699292],
+    [-1.2684380046, 2.6097574011, -0.3413193965],
+    [-0.0041960863, -0.7034186147, 1.7076147010],
+]
+
+# Slack allowed when testing whether a color is inside the sRGB gamut
+GAMUT_EPSILON = 1e-4
+
+def _apply(matrix: List[List[float]], vector: Sequence[float]) -> Color:
+    return tuple(row[0] * vector[0] + row[1] * vector[1] + row[2] * vector[2] for row in matrix)
+
+def srgb_to_linear(channel: float) -> float:
+    """Decode one sRGB channel in [0, 1] to linear light."""
+    return channel / 12.92 if channel <= 0.04045 else ((channel + 0.055) / 1.055) ** 2.4
+
+def linear_to_srgb(channel: float) -> float:
+    """Encode one linear-light channel as sRGB; negative (out of gamut) values stay negative."""
+    magnitude = abs(channel)
+    encoded = magnitude * 12.92 if magnitude <= 0.0031308 else 1.055 * magnitude ** (1 / 2.4) - 0.055
+    return math.copysign(encoded, channel)
+
+def hex_to_rgb(hex_color: str) -> Color:
+    """#RRGGBB -> sRGB channels in [0, 1]."""
+    value = hex_color.lstrip('#')
+    return tuple(int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+
+def rgb_to_hex(rgb: Sequence[float]) -> str:
+    """sRGB channels in [0, 1] -> #RRGGBB, clamped."""
+    return "#" + "".join(f"{min(max(int(round(c * 255)), 0), 255):02x}" for c in rgb)
+
+def srgb_to_oklab(rgb: Sequence[float]) -> Color:
+    """Convert one sRGB color in [0, 1] to OKLab."""
+    lms = _apply(RGB_TO_LMS, [srgb_to_linear(c) for c in rgb])
+    return _apply(LMS_TO_OKLAB, [math.copysign(abs(c) ** (1 / 3), c) for c in lms])
+
+def oklab_to_srgb(lab: Sequence[float]) -> Color:
+    """Convert one OKLab color to unclipped sRGB."""
+    lms = [c ** 3 for c in _apply(OKLAB_TO_LMS, lab)]
+    return tuple(linear_to_srgb(c) for c in _apply(LMS_TO_RGB, lms))
+
+def lch_to_srgb(lightness: float, chroma: float, hue: float) -> Color:
+    """OKLCh (hue in radians) -> unclipped sRGB."""
+    return oklab_to_srgb((lightness, chroma * math.cos(hue), chroma * math.sin(hue)))
+
+def in_gamut(rgb: Sequence[float]) -> bool:
+    """True if every channel lies in [0, 1] (within GAMUT_EPSILON)."""
+    return all(-GAMUT_EPSILON <= c <= 1 + GAMUT_EPSILON for c in rgb)
+
+def lch_to_hex(lightness: float, chroma: float, hue: float) -> str:
+    """Convert one OKLCh color to hex, reducing chroma until it is in gamut."""
+    rgb = lch_to_srgb(lightness, chroma, hue)
+    if in_gamut(rgb):
+        return rgb_to_hex(rgb)
+    
+    # Bisect chroma so hue and lightness are preserved
+    low, high = 0.0, chroma
+    for _ in range(12):
+        middle = (low + high) / 2
+        if in_gamut(lch_to_srgb(lightness, middle, hue)):
+            low = middle
+        else:
+            high = middle
+    return rgb_to_hex(lch_to_srgb(lightness, low, hue))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# theme_engine/derived_variables.py
+# Palette-derived template variables, resolved lazily and memoized per palette
+# Only the names templates reference are computed: tonal ramps, on-colors and
+# color forms, in pure Python so every installation resolves the same names
+
+import colorsys
+import hashlib
+import json
+import math
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from color_math import hex_to_rgb, lch_to_hex, srgb_to_oklab
+
+# Palette keys every theme defines
+PALETTE_KEYS = (
+    "primary", "secondary", "tertiary", "background", "surface",
+    "accent", "text_primary", "text_secondary", "text_accent",
+)
+
+# Tone distance of <key>_bright from <key>, away from the background
+BRIGHT_STEP = 10
+# Bright variants stay inside this tone range so they keep their hue instead of
+# turning white (or black); colors already near the edge step toward the middle
+BRIGHT_TONES = (10, 90)
+# On-colors are tone 10 or 95 of the color's hue, whichever contrasts more
+ON_TONES = (10, 95)
+# WCAG AA contrast; below it on-colors fall back to black or white
+MIN_CONTRAST = 4.5
+
+# <color>[<form>] where color is <key>, <key>_tone_<0-100>, <key>_bright or on_<key>
+_KEY_PATTERN = "|".join(sorted(PALETTE_KEYS, key=len, reverse=True))
+VARIABLE_PATTERN = re.compile(
+    rf"^(?P<on>on_)?(?P<key>{_KEY_PATTERN})"
+    r"(?:_tone_(?P<tone>\d{1,3})|_(?P<bright>bright))?"
+    r"(?:_(?P<form>color|hex|rgb|r|g|b|hsl|oklab|oklch)|_a(?P<alpha>\d{1,3})|_rgba_(?P<rgba>\d{1,3})"
+    r"|_(?P<legacy_alpha>\d{2}))?$"
+)
+
+def tone_to_lightness(tone: float) -> float:
+    """OKLab L of a tone 0-100 (CIELAB L*, exact for neutral grays)."""
+    luminance = ((tone + 16) / 116) ** 3 if tone > 8 else tone / 903.2963
+    return luminance ** (1 / 3)
+
+def relative_luminance(rgb: Tuple[float, float, float]) -> float:
+    """WCAG relative luminance of an sRGB color in [0, 1]."""
+    linear = [c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in rgb]
+    return 0.2126 * linear[0] + 0.7152 * linear[1] + 0.0722 * linear[2]
+
+def luminance_to_tone(luminance: float) -> float:
+    """CIELAB L* (tone) of a relative luminance value."""
+    return 116 * luminance ** (1 / 3) - 16 if luminance > 216 / 24389 else luminance * 24389 / 27
+
+def contrast_ratio(first: float, second: float) -> float:
+    """WCAG contrast ratio between two luminances."""
+    return (max(first, second) + 0.05) / (min(first, second) + 0.05)
+
+def bright_tone(tone: float, direction: int) -> float:
+    """Target tone of a bright variant: BRIGHT_STEP away from the background, within BRIGHT_TONES."""
+    low, high = BRIGHT_TONES
+    target = min(max(tone + direction * BRIGHT_STEP, low), high)
+    if abs(target - tone) < BRIGHT_STEP / 2:
+        # Already near the edge: a step toward the middle still gives a distinct slot
+        target = tone - direction * BRIGHT_STEP
+    return target
+
+def palette_hash(palette: Dict[str, str]) -> str:
+    """Stable hash of a palette, the memo key."""
+    return hashlib.blake2b(json.dumps(palette, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+
+def _parse(name: str) -> Optional[Tuple[str, str, Optional[int], str, Optional[int]]]:
+    """(key, modifier, tone, form, form argument) for a derived name, or None if it is not one."""
+    match = VARIABLE_PATTERN.match(name)
+    if not match:
+        return None
+    
+    modifier, tone = "base", None
+    if match.group("tone") is not None:
+        modifier, tone = "tone", int(match.group("tone"))
+        if tone > 100:
+            return None
+    elif match.group("bright"):
+        modifier = "bright"
+    if match.group("on"):
+        if modifier != "base":
+            return None
+        modifier = "on"
+    
+    form, argument = match.group("form") or "hex", None
+    for group in ("alpha", "rgba", "legacy_alpha"):
+        if match.group(group) is not None:
+            form, argument = ("rgba" if group == "rgba" else "alpha"), int(match.group(group))
+            if argument > 100:
+                return None
+    # <key>_color is the plain palette color; on/tone/bright colors have no _color alias
+    if form == "color":
+        if modifier != "base":
+            return None
+        form = "hex"
+    return match.group("key"), modifier, tone, form, argument
+
+class KnownNames:
+    """Container of every variable a template may use: fixed names plus derived families."""
+    
+    def __init__(self, static: Iterable[str], derived: "DerivedVariables"):
+        self.static = set(static)
+        self.derived = derived
+    
+    def __contains__(self, name: object) -> bool:
+        return name in self.static or (isinstance(name, str) and self.derived.is_known(name))
+
+class DerivedVariables:
+    """Computes palette-derived variables on demand; results are memoized per palette hash."""
+    
+    def __init__(self, memo_size: int = 16):
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+    
+    def is_known(self, name: str) -> bool:
+        """True if name belongs to a derived family."""
+        return _parse(name) is not None
+    
+    def resolve(self, palette: Dict[str, str], names: Iterable[str]) -> Dict[str, str]:
+        """Values of the derived names among names for this palette (others are skipped)."""
+        key = palette_hash(palette)
+        memo = self._memo.pop(key, None) or {}
+        self._memo[key] = memo
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        
+        pending = {}
+        for name in names:
+            if name not in memo and self.is_known(name):
+                pending[name] = _parse(name)
+        if pending:
+            memo.update(self._compute(palette, pending))
+        return {name: memo[name] for name in names if name in memo}
+    
+    def _compute(self, palette: Dict[str, str],
+                 requests: Dict[str, Tuple[str, str, Optional[int], str, Optional[int]]]) -> Dict[str, str]:
+        """Compute a batch of parsed names: colors first, then every form in one pass."""
+        colors = {(key, modifier, tone): None for key, modifier, tone, _, _ in requests.values()}
+        for color in colors:
+            if color[1] == "base":
+                colors[color] = palette[color[0]]
+        derived = [color for color, value in colors.items() if value is None]
+        if derived:
+            colors.update(self._derive_colors(palette, derived))
+        
+        needs_oklab = sorted({colors[(key, modifier, tone)] for key, modifier, tone, form, _ in requests.values()
+                              if form in ("oklab", "oklch")})
+        oklab = {hex_color: srgb_to_oklab(hex_to_rgb(hex_color)) for hex_color in needs_oklab}
+        
+        values = {}
+        for name, (key, modifier, tone, form, argument) in requests.items():
+            values[name] = self._format(colors[(key, modifier, tone)], form, argument, oklab)
+        return values
+    
+    def _derive_colors(self, palette: Dict[str, str],
+                       colors: List[Tuple[str, str, Optional[int]]]) -> Dict[Tuple[str, str, Optional[int]], str]:
+        """Tones, bright variants and on-colors, gamut-mapped in OKLCh."""
+        background_tone = luminance_to_tone(relative_luminance(hex_to_rgb(palette["background"])))
+        # Bright variants move away from the background: lighter on dark themes, darker on light ones
+        direction = 1 if background_tone < 50 else -1
+        
+        result = {}
+        for color in colors:
+            key, modifier, tone = color
+            srgb = hex_to_rgb(palette[key])
+            lightness, a, b_axis = srgb_to_oklab(srgb)
+            chroma, hue = math.hypot(a, b_axis), math.atan2(b_axis, a)
+            
+            if modifier == "tone":
+                targets = [tone]
+            elif modifier == "bright":
+                targets = [bright_tone(luminance_to_tone(relative_luminance(srgb)), direction)]
+            else:
+                targets = list(ON_TONES)
+            # Tones 0 and 100 are black and white whatever the hue
+            candidates = [lch_to_hex(tone_to_lightness(target), 0.0 if target <= 0 or target >= 100 else chroma, hue)
+                          for target in targets]
+            if modifier != "on":
+                result[color] = candidates[0]
+                continue
+            
+            base = relative_luminance(srgb)
+            ratios = [contrast_ratio(relative_luminance(hex_to_rgb(candidate)), base) for candidate in candidates]
+            best = max(range(len(ratios)), key=ratios.__getitem__)
+            if ratios[best] < MIN_CONTRAST:
+                # Mid-tone colors: plain black or white reads better than any tone of the hue
+                candidates, ratios = ["#000000", "#ffffff"], [contrast_ratio(0.0, base), contrast_ratio(1.0, base)]
+                best = max(range(len(ratios)), key=ratios.__getitem__)
+            result[color] = candidates[best]
+        return result
+    
+    @staticmethod
+    def _format(hex_color: str, form: str, argument: Optional[int], oklab: Dict[str, List[float]]) -> str:
+        """Render one color in the requested form."""
+        r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+        if form == "hex":
+            return hex_color
+        if form == "rgb":
+            return f"{r}, {g}, {b}"
+        if form in ("r", "g", "b"):
+            return str({"r": r, "g": g, "b": b}[form])
+        if form == "alpha":
+            return f"{hex_color}{int(argument * 255 / 100):02x}"
+        if form == "rgba":
+            return f"rgba({r}, {g}, {b}, {argument / 100:.2f})"
+        if form == "hsl":
+            hue, lightness, saturation = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+            return f"hsl({hue * 360:.0f}, {saturation * 100:.0f}%, {lightness * 100:.0f}%)"
+        
+        lightness, a, b_axis = oklab[hex_color]
+        if form == "oklab":
+            return f"oklab({lightness:.3f} {a:.3f} {b_axis:.3f})"
+        chroma = (a * a + b_axis * b_axis) ** 0.5
+        hue = math.degrees(math.atan2(b_axis, a)) % 360
+        return f"oklch({lightness:.3f} {chroma:.3f} {hue:.1f})"
+
+def main():
+    """CLI entry point: resolve derived variables for the current theme."""
+    from pathlib import Path
+    
+    if len(sys.argv) < 2:
+        print("Usage: derived_variables.py <name>...  (e.g. primary_tone_40 on_primary accent_bright_rgb)")
+        sys.exit(1)
+    
+    current_file = Path(__file__).parent / "theme_data" / "current.json"
+    try:
+        with open(current_file, 'r') as f:
+            palette = json.load(f)["palette"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        print(f"No current theme found at {current_file}")
+        sys.exit(1)
+    
+    engine = DerivedVariables()
+    values = engine.resolve(palette, sys.argv[1:])
+    for name in sys.argv[1:]:
+        print(f"{name:32} {values.get(name, '(unknown)')}")
+
+if __name__ == "__main__":
+    main()
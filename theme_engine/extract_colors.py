@@ -3,97 +3,153 @@
 # LLaVA color extraction via Ollama API for MaterialYou theming
 # Requires: ollama, llava model
 
+import argparse
 import json
 import os
 import sys
-import hashlib
-import requests
-import base64
-import subprocess
 import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import re
 
-# Setup logging to central file
-def log_to_file(level: str, component: str, message: str):
-    """Log messages to central log file using bash logger"""
-    try:
-        subprocess.run([
-            'bash', '-c', 
-            f'source "{Path(__file__).parent}/logger.sh" && log_{level.lower()} "{component}" "{message}"'
-        ], check=False, capture_output=True)
-    except Exception:
-        pass  # Fallback to stderr if logging fails
+from change_manifest import write_json_atomic
+from fingerprint_index import FingerprintIndex
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable
+from palette_stream import IncrementalJSONScanner, MalformedStream
+from palette_store import PaletteStore
+from theme_logging import log_debug, log_error, log_info, log_warning
+from tracing import annotate, span
 
-def log_info(component: str, message: str):
-    log_to_file("INFO", component, message)
-    print(f"[INFO] [{component}] {message}")
-
-def log_error(component: str, message: str):
-    log_to_file("ERROR", component, message)
-    print(f"[ERROR] [{component}] {message}", file=sys.stderr)
-
-def log_success(component: str, message: str):
-    log_to_file("SUCCESS", component, message)
-    print(f"[SUCCESS] [{component}] ✓ {message}")
-
-def log_warning(component: str, message: str):
-    log_to_file("WARNING", component, message)
-    print(f"[WARNING] [{component}] ⚠ {message}")
-
-def log_debug(component: str, message: str):
-    log_to_file("DEBUG", component, message)
-    if os.getenv("DEBUG"):
-        print(f"[DEBUG] [{component}] {message}")
+# Extraction engines selectable with --engine
+ENGINES = ("native", "llava", "auto")
 
 class ColorExtractor:
-    """Extracts MaterialYou color palette from wallpapers using LLaVA via Ollama."""
+    """Extracts MaterialYou color palette from wallpapers using LLaVA or the native engine."""
     
-    def __init__(self, dotfiles_dir: str):
+    def __init__(self, dotfiles_dir: str, engine: str = "auto"):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown extraction engine: {engine}")
+        
+        self.engine = engine
         self.dotfiles_dir = Path(dotfiles_dir)
         self.cache_dir = self.dotfiles_dir / "theme_engine" / "theme_data" / "palette_cache"
         self.current_theme_file = self.dotfiles_dir / "theme_engine" / "theme_data" / "current.json"
-        self.ollama_url = "http://127.0.0.1:11434"  # Default Ollama API URL
+        self.ollama_url = os.getenv("CLYPR_OLLAMA_URL", "http://127.0.0.1:11434")  # Ollama API URL
         self.model = "llava:latest"  # LLaVA model name
+        self.ollama = OllamaClient(self.ollama_url,
+                                   state_file=self.dotfiles_dir / "theme_engine" / "theme_data" / "ollama_state.json")
+        
+        # LLaVA upload preprocessing: the vision encoder only sees a few hundred
+        # pixels, so large wallpapers are downscaled and re-encoded before upload
+        self.llava_max_edge = int(os.getenv("CLYPR_LLAVA_MAX_EDGE", "672"))
+        self.llava_jpeg_quality = 85
+        self.payload_cache_dir = self.dotfiles_dir / "theme_engine" / "theme_data" / "llava_payload"
         
-        # Create cache directory if it doesn't exist
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Stream tokens and stop at the first complete palette object (CLYPR_LLAVA_STREAM=0 disables)
+        self.llava_stream = os.getenv("CLYPR_LLAVA_STREAM", "1") != "0"
+        self.llava_attempts = 2
+        self.last_llava_stats: Dict = {}
+        
+        # Stat fingerprint -> content hash, so cache hits never read the image
+        self.fingerprints = FingerprintIndex(self.dotfiles_dir / "theme_engine" / "theme_data" / "fingerprints.json")
+        
+        # Create cache directories if they don't exist
+        self.payload_cache_dir.mkdir(parents=True, exist_ok=True)
         self.current_theme_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Indexed palette store (one SQLite file), seeded once from the legacy JSON cache
+        self.palette_store = PaletteStore(self.dotfiles_dir / "theme_engine" / "theme_data" / "palettes.db")
+        self.palette_store.migrate_json_cache(self.cache_dir, validate=self._validate_color_palette)
     
     def _get_wallpaper_hash(self, wallpaper_path: str) -> str:
-        """Generate SHA256 hash of wallpaper file for caching."""
-        with open(wallpaper_path, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()[:16]
+        """Get SHA256 hash of wallpaper file for caching (rehashed only when the file changed)."""
+        with span("hash") as sp:
+            if self.fingerprints.lookup(wallpaper_path):
+                sp.set(cache="hit")
+            else:
+                sp.set(cache="miss", bytes_read=os.path.getsize(wallpaper_path))
+            return self.fingerprints.get_hash(wallpaper_path)
     
     def _encode_image(self, image_path: str) -> str:
         """Encode image to base64 for Ollama API."""
+        import base64
+        
         with open(image_path, 'rb') as f:
             return base64.b64encode(f.read()).decode('utf-8')
     
+    def _prepare_llava_image(self, image_path: str, wallpaper_hash: Optional[str] = None) -> str:
+        """Downscale and re-encode the image as compact JPEG, cached by wallpaper hash."""
+        # Only the LLaVA path needs these; palette cache hits never import them
+        import base64
+        import io
+        
+        original_size = os.path.getsize(image_path)
+        cache_file = None
+        if wallpaper_hash:
+            cache_file = self.payload_cache_dir / f"{wallpaper_hash}_{self.llava_max_edge}.jpg"
+        
+        if cache_file and cache_file.exists():
+            payload = cache_file.read_bytes()
+            annotate(payload_cache="hit", payload_bytes=len(payload), original_bytes=original_size)
+            log_debug("LLAVA", f"Using cached upload payload {cache_file.name} ({len(payload)} bytes)")
+            return base64.b64encode(payload).decode('utf-8')
+        
+        try:
+            from PIL import Image
+        except ImportError:
+            log_warning("LLAVA", "Pillow not installed, uploading original image")
+            return self._encode_image(image_path)
+        
+        try:
+            with Image.open(image_path) as img:
+                img.draft('RGB', (self.llava_max_edge, self.llava_max_edge))
+                img = img.convert('RGB')
+                img.thumbnail((self.llava_max_edge, self.llava_max_edge), Image.Resampling.LANCZOS)
+                
+                buffer = io.BytesIO()
+                img.save(buffer, format='JPEG', quality=self.llava_jpeg_quality, optimize=True)
+                payload = buffer.getvalue()
+        except Exception as e:
+            log_warning("LLAVA", f"Could not preprocess image ({e}), uploading original")
+            return self._encode_image(image_path)
+        
+        if len(payload) >= original_size:
+            # Already small: re-encoding would only cost quality
+            annotate(payload_bytes=original_size, original_bytes=original_size)
+            return self._encode_image(image_path)
+        annotate(payload_cache="miss", payload_bytes=len(payload), original_bytes=original_size)
+        
+        if cache_file:
+            cache_file.write_bytes(payload)
+        
+        log_info("LLAVA", f"Upload payload reduced from {original_size} to {len(payload)} bytes "
+                          f"({img.size[0]}x{img.size[1]})")
+        return base64.b64encode(payload).decode('utf-8')
+    
     def _check_ollama_available(self) -> bool:
         """Check if Ollama service is running and model is available."""
+        if self.ollama.breaker_open():
+            log_warning("OLLAMA", "Ollama failed recently, skipping until the circuit breaker closes")
+            return False
+        
         try:
-            # Check if Ollama is running
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-            if response.status_code != 200:
-                return False
+            # Model list is cached by the client, so this is usually free
+            model = self.ollama.find_model("llava")
+            if model:
+                self.model = model
+                return True
             
-            # Check if LLaVA model is available
-            models = response.json().get("models", [])
-            for model in models:
-                if model.get("name", "").startswith("llava"):
-                    self.model = model["name"]
-                    return True
-            
-            log_error("OLLAMA", f"LLaVA model not found. Available models: {[m['name'] for m in models]}")
+            log_error("OLLAMA", f"LLaVA model not found. Available models: {self.ollama.list_models()}")
             return False
             
-        except requests.exceptions.RequestException as e:
+        except OllamaUnavailable as e:
+            log_warning("OLLAMA", f"Ollama client unavailable: {e}")
+            return False
+        except OllamaError as e:
             log_error("OLLAMA", f"Ollama service not available: {e}")
             return False
     
-    def _call_llava(self, image_path: str) -> Optional[Dict]:
+    def _call_llava(self, image_path: str, wallpaper_hash: Optional[str] = None) -> Optional[Dict]:
         """Call LLaVA via Ollama API to extract colors from image."""
         
         # LLaVA prompt for MaterialYou color extraction
@@ -123,36 +179,23 @@ class ColorExtractor:
         - Text colors should contrast well with backgrounds"""
         
         try:
-            # Encode image
-            image_base64 = self._encode_image(image_path)
-            
-            # Prepare Ollama API request
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "images": [image_base64],
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Low temperature for consistent output
-                    "num_predict": 200   # Limit response length
-                }
-            }
+            # Downscale, re-encode and base64 the image
+            image_base64 = self._prepare_llava_image(image_path, wallpaper_hash)
             
             print(f"Calling LLaVA model '{self.model}' for color extraction...")
             
-            # Make API call
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=60  # 60 second timeout for image processing
-            )
+            options = {
+                "temperature": 0.1,  # Low temperature for consistent output
+                "num_predict": 200   # Limit response length
+            }
             
-            if response.status_code != 200:
-                print(f"Ollama API error: {response.status_code} - {response.text}")
-                return None
+            if self.llava_stream:
+                return self._stream_llava(prompt, image_base64, options)
+            
+            # Make API call over the pooled session
+            result = self.ollama.generate(self.model, prompt, images=[image_base64], options=options)
             
             # Parse response
-            result = response.json()
             response_text = result.get("response", "").strip()
             
             print(f"LLaVA response: {response_text}")
@@ -173,7 +216,7 @@ class ColorExtractor:
             
             return color_data
             
-        except requests.exceptions.RequestException as e:
+        except OllamaError as e:
             print(f"Error calling Ollama API: {e}")
             return None
         except json.JSONDecodeError as e:
@@ -183,6 +226,72 @@ class ColorExtractor:
             print(f"Unexpected error in LLaVA call: {e}")
             return None
     
+    def _stream_llava(self, prompt: str, image_base64: str, options: Dict) -> Optional[Dict]:
+        """Stream LLaVA tokens and stop as soon as a complete, valid palette arrives."""
+        for attempt in range(1, self.llava_attempts + 1):
+            start = time.perf_counter()
+            scanner = IncrementalJSONScanner()
+            tokens = 0
+            palette = None
+            reason = "stream ended without a palette object"
+            
+            stream = self.ollama.generate_stream(self.model, prompt, images=[image_base64], options=options)
+            try:
+                for chunk in stream:
+                    tokens += 1
+                    object_text = scanner.feed(chunk.get("response", ""))
+                    if object_text:
+                        # Complete object: close the request instead of waiting for num_predict
+                        palette = json.loads(object_text)
+                        break
+                    if chunk.get("done"):
+                        break
+            except MalformedStream as e:
+                reason = f"malformed output ({e})"
+            except json.JSONDecodeError as e:
+                reason = f"unparseable palette object ({e})"
+            finally:
+                stream.close()
+            
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.last_llava_stats = {"attempt": attempt, "tokens": tokens, "time_to_palette_ms": round(elapsed_ms, 1)}
+            annotate(**self.last_llava_stats)
+            
+            if palette and self._validate_color_palette(palette):
+                log_info("LLAVA", f"Palette after {elapsed_ms:.0f} ms, {tokens} tokens (attempt {attempt})")
+                return palette
+            
+            if palette:
+                reason = "invalid palette keys or colors"
+            log_warning("LLAVA", f"Attempt {attempt}: {reason} after {elapsed_ms:.0f} ms, {tokens} tokens")
+        
+        return None
+    
+    def _call_native(self, image_path: str) -> Optional[Dict]:
+        """Extract colors locally by quantizing the image in OKLab."""
+        try:
+            from native_palette import NativePaletteExtractor, NATIVE_AVAILABLE
+        except ImportError:
+            NATIVE_AVAILABLE = False
+        
+        if not NATIVE_AVAILABLE:
+            print("Native engine unavailable (requires python-numpy and python-pillow)")
+            return None
+        
+        try:
+            start = time.perf_counter()
+            palette = NativePaletteExtractor().extract(image_path)
+            print(f"Native extraction finished in {(time.perf_counter() - start) * 1000:.1f} ms")
+        except Exception as e:
+            print(f"Error in native extraction: {e}")
+            return None
+        
+        if not self._validate_color_palette(palette):
+            print("Invalid color palette from native engine")
+            return None
+        
+        return palette
+    
     def _validate_color_palette(self, palette: Dict) -> bool:
         """Validate that color palette has required keys and valid hex colors."""
         required_keys = [
@@ -222,54 +331,48 @@ class ColorExtractor:
             "text_accent": "#f9e2af"   # Catppuccin yellow
         }
     
-    def _save_to_cache(self, wallpaper_hash: str, palette: Dict) -> None:
-        """Save extracted palette to cache."""
-        cache_file = self.cache_dir / f"{wallpaper_hash}.json"
-        
-        cache_data = {
-            "wallpaper_hash": wallpaper_hash,
-            "palette": palette,
-            "extracted_at": __import__('time').time()
-        }
-        
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2)
-        
-        print(f"Cached palette for hash {wallpaper_hash}")
+    def _save_to_cache(self, wallpaper_hash: str, palette: Dict, engine: str,
+                       wallpaper_path: Optional[str] = None) -> None:
+        """Save extracted palette to the palette store."""
+        if wallpaper_path:
+            wallpaper_path = os.path.abspath(wallpaper_path)
+        self.palette_store.put(wallpaper_hash, palette, engine, path=wallpaper_path)
+        print(f"Cached {engine} palette for hash {wallpaper_hash}")
+    
+    def _engine_matches(self, cached_engine: str) -> bool:
+        """Check whether a cached palette satisfies the selected engine."""
+        return self.engine == "auto" or cached_engine == self.engine
     
     def _load_from_cache(self, wallpaper_hash: str) -> Optional[Dict]:
-        """Load palette from cache if available."""
-        cache_file = self.cache_dir / f"{wallpaper_hash}.json"
+        """Load palette from the palette store if available (validated on insert)."""
+        cached = self.palette_store.get(wallpaper_hash)
+        if not cached:
+            return None
         
-        if cache_file.exists():
-            try:
-                with open(cache_file, 'r') as f:
-                    cache_data = json.load(f)
-                
-                palette = cache_data.get("palette")
-                if palette and self._validate_color_palette(palette):
-                    print(f"Using cached palette for hash {wallpaper_hash}")
-                    return palette
-                    
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Error loading cache file {cache_file}: {e}")
-                # Remove corrupted cache file
-                cache_file.unlink(missing_ok=True)
+        cached_engine, palette = cached
+        if not self._engine_matches(cached_engine):
+            return None
         
-        return None
+        print(f"Using cached {cached_engine} palette for hash {wallpaper_hash}")
+        return palette
     
-    def _save_current_theme(self, wallpaper_path: str, palette: Dict) -> None:
-        """Save current theme data to current.json."""
-        theme_data = {
+    def theme_data(self, wallpaper_path: str, palette: Dict) -> Dict:
+        """Theme data as stored in current.json."""
+        return {
             "wallpaper_path": str(wallpaper_path),
             "wallpaper_name": os.path.basename(wallpaper_path),
             "palette": palette,
             "applied_at": __import__('time').time(),
             "version": "1.0"
         }
-        
-        with open(self.current_theme_file, 'w') as f:
-            json.dump(theme_data, f, indent=2)
+    
+    def _save_current_theme(self, wallpaper_path: str, palette: Dict) -> None:
+        """Save current theme data to current.json."""
+        self.save_theme_data(self.theme_data(wallpaper_path, palette))
+    
+    def save_theme_data(self, theme_data: Dict) -> None:
+        """Write current.json atomically, so readers never see a partial theme."""
+        write_json_atomic(self.current_theme_file, theme_data, indent=2)
         
         print(f"Current theme saved to {self.current_theme_file}")
     
@@ -280,56 +383,107 @@ class ColorExtractor:
             print(f"Wallpaper file not found: {wallpaper_path}")
             return self._generate_fallback_palette(wallpaper_path)
         
+        with span("extract_colors", wallpaper=os.path.basename(wallpaper_path)):
+            palette = self.get_palette(wallpaper_path)
+            
+            # Save as current theme
+            self._save_current_theme(wallpaper_path, palette)
+        
+        return palette
+    
+    def get_palette(self, wallpaper_path: str) -> Dict:
+        """Cached or freshly extracted palette for a wallpaper, without making it current."""
+        
+        if not os.path.exists(wallpaper_path):
+            return self._generate_fallback_palette(wallpaper_path)
+        
         # Generate hash for caching
         wallpaper_hash = self._get_wallpaper_hash(wallpaper_path)
         
         # Try to load from cache first
         cached_palette = self._load_from_cache(wallpaper_hash)
         if cached_palette:
-            self._save_current_theme(wallpaper_path, cached_palette)
+            annotate(cache="hit")
             return cached_palette
         
-        # Check if Ollama is available
-        if not self._check_ollama_available():
-            print("Ollama/LLaVA not available, using fallback palette")
-            fallback_palette = self._generate_fallback_palette(wallpaper_path)
-            self._save_current_theme(wallpaper_path, fallback_palette)
-            return fallback_palette
+        palette = None
+        engine_used = None
         
-        # Extract colors using LLaVA
-        palette = self._call_llava(wallpaper_path)
+        # Extract colors using LLaVA if Ollama is available
+        if self.engine in ("llava", "auto"):
+            with span("llava") as sp:
+                if not self._check_ollama_available():
+                    sp.set(available=False)
+                    print("Ollama/LLaVA not available")
+                else:
+                    sp.set(model=self.model)
+                    palette = self._call_llava(wallpaper_path, wallpaper_hash)
+                    if palette:
+                        engine_used = "llava"
+                    else:
+                        print("LLaVA extraction failed")
         
+        # Extract colors locally (native engine, or auto when LLaVA failed)
+        if not palette and self.engine in ("native", "auto"):
+            with span("native"):
+                palette = self._call_native(wallpaper_path)
+            if palette:
+                engine_used = "native"
+        
+        annotate(cache="miss", engine=engine_used or "fallback")
         if not palette:
-            print("LLaVA extraction failed, using fallback palette")
+            print("Color extraction failed, using fallback palette")
             palette = self._generate_fallback_palette(wallpaper_path)
         else:
-            print("Successfully extracted colors with LLaVA")
+            print(f"Successfully extracted colors with {engine_used} engine")
             # Cache the extracted palette
-            self._save_to_cache(wallpaper_hash, palette)
-        
-        # Save as current theme
-        self._save_current_theme(wallpaper_path, palette)
+            self._save_to_cache(wallpaper_hash, palette, engine_used, wallpaper_path)
         
         return palette
 
 def main():
     """CLI entry point for color extraction."""
-    if len(sys.argv) != 2:
-        print("Usage: extract_colors.py <wallpaper_path>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Extract a MaterialYou color palette from a wallpaper")
+    parser.add_argument("wallpaper_path", nargs="?", help="Path to the wallpaper image")
+    parser.add_argument("--engine", choices=ENGINES, default=os.getenv("CLYPR_ENGINE", "auto"),
+                        help="Extraction engine: native (local k-means), llava (Ollama), "
+                             "auto (LLaVA, then native if unavailable)")
+    parser.add_argument("--prewarm", metavar="DIR",
+                        help="Extract palettes for every uncached wallpaper below DIR")
+    parser.add_argument("--workers", type=int, help="Prewarm: native extraction processes")
+    parser.add_argument("--ollama-concurrency", type=int, default=1,
+                        help="Prewarm: concurrent requests to Ollama (default: 1)")
+    parser.add_argument("--idle-only", action="store_true",
+                        help="Prewarm: only start jobs while the system is idle")
+    parser.add_argument("--reset-state", action="store_true",
+                        help="Prewarm: forget progress and failures from earlier runs")
+    args = parser.parse_args()
     
-    wallpaper_path = sys.argv[1]
+    if not args.wallpaper_path and not args.prewarm:
+        parser.error("a wallpaper path or --prewarm DIR is required")
     
     # Determine dotfiles directory (parent of theme_engine)
     script_dir = Path(__file__).parent
     dotfiles_dir = script_dir.parent
     
+    extractor = ColorExtractor(str(dotfiles_dir), engine=args.engine)
+    
+    if args.prewarm:
+        from prewarm import PalettePrewarmer
+        
+        prewarmer = PalettePrewarmer(extractor, workers=args.workers,
+                                     ollama_concurrency=args.ollama_concurrency,
+                                     idle_only=args.idle_only)
+        if args.reset_state:
+            prewarmer.reset_state()
+        result = prewarmer.run(args.prewarm)
+        sys.exit(1 if result["failed"] else 0)
+    
     # Extract colors
-    extractor = ColorExtractor(str(dotfiles_dir))
-    palette = extractor.extract_colors(wallpaper_path)
+    palette = extractor.extract_colors(args.wallpaper_path)
     
     # Print palette as JSON
     print(json.dumps(palette, indent=2))
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
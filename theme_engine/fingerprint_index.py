@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# theme_engine/fingerprint_index.py
+# Persistent stat-based fingerprint index - maps (device, inode, size, mtime_ns)
+# to content hashes so unchanged wallpapers are never re-read
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+from change_manifest import write_json_atomic
+
+# Read size used when a file has to be rehashed
+CHUNK_SIZE = 1024 * 1024
+
+def hash_file(path: str, length: int = 16) -> str:
+    """SHA256 a file by streaming it through a fixed buffer."""
+    digest = hashlib.sha256()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    
+    return digest.hexdigest()[:length]
+
+class FingerprintIndex:
+    """Caches content hashes keyed by file stat so warm lookups do zero content reads."""
+    
+    def __init__(self, index_file: Path):
+        self.index_file = Path(index_file)
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._keys_by_path: Dict[str, str] = {}
+        self._dirty = False
+        self._load()
+    
+    def _load(self) -> None:
+        """Load the index from disk, starting empty if it is missing or corrupt."""
+        try:
+            with open(self.index_file, 'r') as f:
+                self._entries = json.load(f).get("entries", {})
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, AttributeError) as e:
+            print(f"Ignoring corrupt fingerprint index {self.index_file}: {e}")
+            self._entries = {}
+        
+        self._keys_by_path = {entry["path"]: key for key, entry in self._entries.items()}
+    
+    @staticmethod
+    def fingerprint(st: os.stat_result) -> str:
+        """Build the stat fingerprint key for a file."""
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    
+    def lookup(self, path: str) -> Optional[str]:
+        """Return the indexed hash if the file is unchanged, without reading it."""
+        entry = self._entries.get(self.fingerprint(os.stat(path)))
+        return entry["hash"] if entry else None
+    
+    def get_hash(self, path: str, save: bool = True) -> str:
+        """Return the content hash of a file, rehashing only if its stat changed.
+        
+        Bulk callers pass save=False and call save() once at the end.
+        """
+        path = os.path.abspath(path)
+        key = self.fingerprint(os.stat(path))
+        
+        entry = self._entries.get(key)
+        if entry:
+            return entry["hash"]
+        
+        content_hash = hash_file(path)
+        self.add(path, key, content_hash)
+        if save:
+            self.save()
+        return content_hash
+    
+    def add(self, path: str, key: str, content_hash: str) -> None:
+        """Record a hash computed elsewhere for the file with this fingerprint key."""
+        # Drop the stale fingerprint recorded for this path, if any
+        old_key = self._keys_by_path.get(path)
+        if old_key and old_key != key:
+            self._entries.pop(old_key, None)
+        
+        self._entries[key] = {"hash": content_hash, "path": path}
+        self._keys_by_path[path] = key
+        self._dirty = True
+    
+    def prune(self) -> int:
+        """Remove entries whose files no longer exist or have changed."""
+        stale = []
+        for key, entry in self._entries.items():
+            try:
+                if self.fingerprint(os.stat(entry["path"])) != key:
+                    stale.append(key)
+            except FileNotFoundError:
+                stale.append(key)
+        
+        for key in stale:
+            path = self._entries.pop(key)["path"]
+            if self._keys_by_path.get(path) == key:
+                del self._keys_by_path[path]
+        
+        if stale:
+            self._dirty = True
+            self.save()
+        return len(stale)
+    
+    def save(self) -> None:
+        """Write the index atomically if it changed."""
+        if not self._dirty:
+            return
+        
+        # Several instances may share the file (e.g. the daemon and its prewarm thread)
+        write_json_atomic(self.index_file, {"version": 1, "entries": self._entries})
+        self._dirty = False
+
+def main():
+    """CLI entry point: print content hashes for files via the index."""
+    if len(sys.argv) < 2:
+        print("Usage: fingerprint_index.py <file>... | --prune")
+        sys.exit(1)
+    
+    # Determine dotfiles directory (parent of theme_engine)
+    dotfiles_dir = Path(__file__).parent.parent
+    index = FingerprintIndex(dotfiles_dir / "theme_engine" / "theme_data" / "fingerprints.json")
+    
+    if sys.argv[1] == "--prune":
+        print(f"Pruned {index.prune()} stale entries")
+        return
+    
+    for path in sys.argv[1:]:
+        print(f"{index.get_hash(path)}  {path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 #!/bin/bash
 # theme_engine/logger.sh
 # Centralized logging system for all theming operations
+# Python scripts log through theme_logging.py, which writes the same format and rotation
 
 # Global log file
 LOG_FILE="${HOME}/.local/share/clypr/theme.log"
@@ -175,6 +176,47 @@ log_python_error() {
     done
 }
 
+# Span tracing: same JSON lines as tracing.py (report: python3 tracing.py stats)
+TRACE_FILE="${LOG_DIR}/trace.jsonl"
+
+# Function to run a command as a traced span: trace_span <name> <command> [args...]
+# The outermost span starts the trace; commands inherit CLYPR_TRACE_ID and
+# CLYPR_TRACE_PARENT, so spans of Python scripts nest below this one
+trace_span() {
+    local name="$1"
+    shift
+    
+    # EPOCHREALTIME needs bash 5; without it (or with CLYPR_TRACE=0) just run the command
+    if [[ "${CLYPR_TRACE:-1}" == "0" || -z "${EPOCHREALTIME:-}" ]]; then
+        "$@"
+        return
+    fi
+    
+    if [[ -z "${CLYPR_TRACE_ID:-}" ]]; then
+        printf -v CLYPR_TRACE_ID '%04x%04x%04x%04x' $RANDOM $RANDOM $RANDOM $RANDOM
+        export CLYPR_TRACE_ID
+    fi
+    local parent="${CLYPR_TRACE_PARENT:-}"
+    local span_id
+    printf -v span_id '%04x%04x%04x%04x' $RANDOM $RANDOM $RANDOM $RANDOM
+    
+    local start_us="${EPOCHREALTIME//[!0-9]/}"
+    local status=0
+    local -x CLYPR_TRACE_PARENT="$span_id"
+    "$@" || status=$?
+    local elapsed_us=$(( ${EPOCHREALTIME//[!0-9]/} - start_us ))
+    
+    local parent_json="null"
+    [[ -n "$parent" ]] && parent_json="\"$parent\""
+    local span_status="ok"
+    [[ $status -ne 0 ]] && span_status="error"
+    printf '{"trace":"%s","span":"%s","parent":%s,"name":"%s","start":%d.%06d,"ms":%d.%03d,"pid":%d,"status":"%s","attrs":{"exit_code":%d}}\n' \
+        "$CLYPR_TRACE_ID" "$span_id" "$parent_json" "$name" $((start_us / 1000000)) $((start_us % 1000000)) \
+        $((elapsed_us / 1000)) $((elapsed_us % 1000)) $$ "$span_status" $status >> "$TRACE_FILE" 2>/dev/null || true
+    
+    return $status
+}
+
 # Function to show log file location
 show_log_info() {
     echo "Centralized logging enabled:"
@@ -239,7 +281,7 @@ clear_logs() {
 # Export functions for use in other scripts
 export -f write_log log_info log_success log_warning log_error log_debug
 export -f log_command log_script_start log_script_end log_python_error
-export -f show_log_info tail_logs clear_logs
+export -f show_log_info tail_logs clear_logs trace_span
 export LOG_FILE LOG_DIR
 
 # Initialize log file on first source
@@ -3,44 +3,135 @@
 # Config merger - combines static configs with rendered templates
 
 import json
-import shutil
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 import configparser
 
+from backup_store import ORIGINAL_LABEL, BackupStore
+from change_manifest import ChangeManifest, stage_file, tree_version, write_json_atomic
+from theme_logging import log_error, log_info, log_success
+from tracing import current_span, record, span
+
+class IncludeTarget:
+    """A config installed once from config_static that includes a per-apply theme fragment."""
+    
+    def __init__(self, config: str, fragment: Optional[str] = None, rendered: Optional[str] = None,
+                 directive: Optional[str] = None, prepend: bool = False):
+        # Paths relative to config_static and ~/.config (the installed config has the same path)
+        self.config = config
+        # Theme fragment written on every apply, relative to ~/.config
+        self.fragment = fragment
+        # Rendered template the fragment is copied from, relative to the rendered dir
+        self.rendered = rendered or fragment
+        # Line(s) added to the installed config so the app loads the fragment;
+        # None when the static config already does or the app reads a drop-in directory
+        self.directive = directive
+        self.prepend = prepend
+
+# Apps that can include another file: the static config is installed only when it
+# (or the template set) changes, and an apply writes just the small theme fragments.
+# Apps not listed here (btop, GTK) are merged by concatenation on every apply.
+INCLUDE_TARGETS: Dict[str, List[IncludeTarget]] = {
+    # hyprland.conf already sources ~/.config/hypr/theme.conf
+    "hyprland": [IncludeTarget("hypr/hyprland.conf", "hypr/theme.conf", rendered="hyprland/theme.conf")],
+    "kitty": [IncludeTarget("kitty/kitty.conf", "kitty/theme.conf", directive="include theme.conf")],
+    "foot": [IncludeTarget("foot/foot.ini", "foot/theme.ini", directive="[main]\ninclude=~/.config/foot/theme.ini")],
+    # CSS @import must come before any rule
+    "waybar": [IncludeTarget("waybar/style.css", "waybar/theme.css", rendered="waybar/style.css",
+                             directive='@import "theme.css";', prepend=True),
+               IncludeTarget("waybar/config-top.json"),
+               IncludeTarget("waybar/config-bottom.json")],
+    # config.rasi loads ~/.config/rofi/theme.rasi with @theme
+    "rofi": [IncludeTarget("rofi/config.rasi", "rofi/theme.rasi")],
+    # dunst reads dunstrc.d/*.conf after dunstrc, fish sources conf.d/*.fish
+    "dunst": [IncludeTarget("dunst/dunstrc", "dunst/dunstrc.d/99-clypr-theme.conf", rendered="dunst/dunstrc")],
+    "fish": [IncludeTarget("fish/config.fish", "fish/conf.d/clypr_theme.fish", rendered="fish/theme.fish")],
+}
+
 class ConfigMerger:
     """Merges static application configs with rendered theme templates."""
     
-    def __init__(self, dotfiles_dir: str):
+    def __init__(self, dotfiles_dir: str, rendered_dir: Optional[Path] = None):
         self.dotfiles_dir = Path(dotfiles_dir)
         self.static_dir = self.dotfiles_dir / "config_static"
-        self.rendered_dir = self.dotfiles_dir / "theme_engine" / "theme_data" / "rendered"
+        # A different rendered_dir merges a staged theme (see plan_all_configs)
+        self.rendered_dir = Path(rendered_dir or self.dotfiles_dir / "theme_engine" / "theme_data" / "rendered")
         self.output_dir = Path.home() / ".config"
         
-        # Backup directory for config files
-        self.backup_dir = self.dotfiles_dir / "theme_engine" / "theme_data" / "backups"
-        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        # Content-addressed backups: one generation per apply that changed something
+        self.current_theme_file = self.dotfiles_dir / "theme_engine" / "theme_data" / "current.json"
+        self.backups = BackupStore(self.dotfiles_dir / "theme_engine" / "theme_data" / "backups")
+        
+        # Static config contents keyed by path, invalidated by mtime
+        self._static_cache: Dict[str, Tuple[int, str]] = {}
+        
+        # Installed static configs of include-mode apps: source version and output stats
+        self.templates_dir = self.dotfiles_dir / "config_templates"
+        self.base_state_file = self.dotfiles_dir / "theme_engine" / "theme_data" / "base_configs.json"
+        self._base_version: Optional[str] = None
+        
+        # Outputs that actually changed, consumed by reload_apps.sh
+        self.changes_file = self.dotfiles_dir / "theme_engine" / "theme_data" / "changes.json"
+        self.changes = ChangeManifest(self.changes_file, "merge")
+        
+        # Outputs written to temp files by the app jobs, published together afterwards
+        self._staged: List[Tuple[str, Path, Path, bytes]] = []
+        # Every output of the current merge, changed or not, for the backup generation
+        self._outputs: Dict[Path, str] = {}
+        # Set while planning: collects every output's content instead of staging it
+        self._plan: Optional[Dict[Path, Tuple[str, bytes]]] = None
+        self._staged_lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+    
+    def _read_static(self, static_file: Path) -> Optional[str]:
+        """Read a static config file, reusing the in-memory copy while unchanged."""
+        try:
+            mtime_ns = static_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        
+        cached = self._static_cache.get(str(static_file))
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        
+        with open(static_file, 'r') as f:
+            content = f.read()
+        
+        self._static_cache[str(static_file)] = (mtime_ns, content)
+        return content
+    
+    def _write_output(self, app_name: str, output_file: Path, content: str) -> bool:
+        """Stage a merged config next to its target if its content changed."""
+        data = content.encode("utf-8")
+        with self._staged_lock:
+            self._outputs[output_file] = app_name
+            if self._plan is not None:
+                self._plan[output_file] = (app_name, data)
+                return True
+        if self.changes.unchanged(output_file, data):
+            return False
+        
+        tmp_file = stage_file(output_file, data)
+        with self._staged_lock:
+            self._staged.append((app_name, output_file, tmp_file, data))
+        return True
     
-    def _backup_existing_config(self, config_path: Path) -> None:
-        """Backup existing config file before overwriting."""
-        if config_path.exists():
-            backup_path = self.backup_dir / f"{config_path.name}.backup"
-            shutil.copy2(config_path, backup_path)
+    def _discard_staged(self) -> None:
+        """Remove staged temp files after a failed merge, leaving live configs untouched."""
+        for _, _, tmp_file, _ in self._staged:
+            tmp_file.unlink(missing_ok=True)
+        self._staged = []
     
-    def _merge_text_files(self, static_file: Path, rendered_file: Path, output_file: Path) -> None:
+    def _merge_text_files(self, app_name: str, static_file: Path, rendered_file: Path, output_file: Path) -> None:
         """Merge plain text config files."""
         
-        # Backup existing
-        self._backup_existing_config(output_file)
-        
-        # Ensure output directory exists
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        
         # Start with static content
-        merged_content = ""
-        if static_file.exists():
-            with open(static_file, 'r') as f:
-                merged_content = f.read()
+        merged_content = self._read_static(static_file) or ""
         
         # Append theme content
         if rendered_file.exists():
@@ -51,25 +142,18 @@ class ConfigMerger:
             merged_content += "\n\n# === DYNAMIC THEME SECTION ===\n"
             merged_content += theme_content
         
-        # Write merged content
-        with open(output_file, 'w') as f:
-            f.write(merged_content)
+        # Write merged content (skipped when unchanged)
+        self._write_output(app_name, output_file, merged_content)
     
-    def _merge_json_files(self, static_file: Path, rendered_file: Path, output_file: Path) -> None:
+    def _merge_json_files(self, app_name: str, static_file: Path, rendered_file: Path, output_file: Path) -> None:
         """Merge JSON config files."""
         
-        # Backup existing
-        self._backup_existing_config(output_file)
-        
-        # Ensure output directory exists  
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        
         merged_data = {}
         
         # Load static data
-        if static_file.exists():
-            with open(static_file, 'r') as f:
-                merged_data = json.load(f)
+        static_content = self._read_static(static_file)
+        if static_content is not None:
+            merged_data = json.loads(static_content)
         
         # Merge theme data
         if rendered_file.exists():
@@ -79,9 +163,8 @@ class ConfigMerger:
             # Deep merge dictionaries
             self._deep_merge_dict(merged_data, theme_data)
         
-        # Write merged data
-        with open(output_file, 'w') as f:
-            json.dump(merged_data, f, indent=2)
+        # Write merged data (skipped when unchanged)
+        self._write_output(app_name, output_file, json.dumps(merged_data, indent=2))
     
     def _deep_merge_dict(self, base: dict, overlay: dict) -> None:
         """Deep merge two dictionaries."""
@@ -91,52 +174,83 @@ class ConfigMerger:
             else:
                 base[key] = value
     
-    def merge_hyprland_config(self) -> None:
-        """Merge Hyprland configuration."""
-        app_name = "hyprland"
-        
-        # Main config file
-        static_main = self.static_dir / app_name / "hyprland.conf"
-        output_main = self.output_dir / app_name / "hyprland.conf"
-        
-        if static_main.exists():
-            shutil.copy2(static_main, output_main)
-            output_main.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Theme config (colors, fonts)
-        rendered_theme = self.rendered_dir / app_name / "theme.conf"
-        output_theme = self.output_dir / app_name / "theme.conf"
-        
-        if rendered_theme.exists():
-            shutil.copy2(rendered_theme, output_theme)
-        
-        print(f"✓ Merged {app_name} config")
+    def _has_template(self, target: IncludeTarget) -> bool:
+        """True if a template renders the target's fragment."""
+        return target.fragment is not None and (self.templates_dir / f"{target.rendered}.tmpl").exists()
     
-    def merge_waybar_config(self) -> None:
-        """Merge Waybar configuration."""
-        app_name = "waybar"
-        
-        # Copy static config JSON files
-        for config_file in ["config-top.json", "config-bottom.json"]:
-            static_file = self.static_dir / app_name / config_file
-            output_file = self.output_dir / app_name / config_file
-            
-            if static_file.exists():
-                self.output_dir.mkdir(parents=True, exist_ok=True)
-                output_file.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(static_file, output_file)
-        
-        # Merge CSS files
-        static_css = self.static_dir / app_name / "style.css"
-        rendered_css = self.rendered_dir / app_name / "style.css"
-        output_css = self.output_dir / app_name / "style.css"
-        
-        self._merge_text_files(static_css, rendered_css, output_css)
-        
-        print(f"✓ Merged {app_name} config")
+    def _base_content(self, target: IncludeTarget) -> str:
+        """Static config plus the include directive for its theme fragment."""
+        content = self._read_static(self.static_dir / target.config) or ""
+        if not target.directive or not self._has_template(target):
+            return content
+        
+        if target.prepend:
+            return f"/* Theme colors, rewritten on every apply */\n{target.directive}\n\n{content}"
+        return f"{content.rstrip()}\n\n# Theme colors, rewritten on every apply\n{target.directive}\n"
+    
+    def _base_configs_stale(self) -> bool:
+        """True if the installed static configs are missing, edited, or older than config_static."""
+        self._base_version = tree_version(self.static_dir, self.templates_dir, Path(__file__))
+        try:
+            with open(self.base_state_file, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return True
+        if state.get("version") != self._base_version or state.get("output_dir") != str(self.output_dir):
+            return True
+        
+        # Anything else writing these files (a backup restore, the user) triggers a reinstall
+        for path, (size, mtime_ns) in state.get("files", {}).items():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return True
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                return True
+        return False
+    
+    def _install_base_configs(self) -> bool:
+        """Stage the static configs of include-mode apps if they need (re)installing."""
+        if not self._base_configs_stale():
+            return False
+        
+        for app_name, targets in INCLUDE_TARGETS.items():
+            for target in targets:
+                if (self.static_dir / target.config).exists() or (target.directive and self._has_template(target)):
+                    self._write_output(app_name, self.output_dir / target.config, self._base_content(target))
+        log_info("MERGE", "Installed static configs for include-mode apps")
+        return True
     
-    def merge_generic_config(self, app_name: str, config_files: List[str]) -> None:
-        """Generic config merger for simple applications."""
+    def _save_base_state(self) -> None:
+        """Remember the installed static configs so later applies skip them."""
+        files = {}
+        for targets in INCLUDE_TARGETS.values():
+            for target in targets:
+                path = self.output_dir / target.config
+                if path.exists():
+                    st = path.stat()
+                    files[str(path)] = [st.st_size, st.st_mtime_ns]
+        
+        state = {"version": self._base_version, "output_dir": str(self.output_dir), "files": files}
+        write_json_atomic(self.base_state_file, state, indent=2)
+    
+    def merge_include_config(self, app_name: str) -> str:
+        """Write the theme fragments of an include-mode app (its static config is installed separately).
+        
+        Returns the message to log once all jobs are done.
+        """
+        for target in INCLUDE_TARGETS[app_name]:
+            if target.fragment is None:
+                continue
+            rendered_file = self.rendered_dir / target.rendered
+            if rendered_file.exists():
+                with open(rendered_file, 'r') as f:
+                    self._write_output(app_name, self.output_dir / target.fragment, f.read())
+        
+        return f"Merged {app_name} config"
+    
+    def merge_generic_config(self, app_name: str, config_files: List[str]) -> str:
+        """Generic config merger for simple applications; returns the message to log."""
         
         for config_file in config_files:
             static_file = self.static_dir / app_name / config_file
@@ -144,63 +258,208 @@ class ConfigMerger:
             output_file = self.output_dir / app_name / config_file
             
             if config_file.endswith('.json'):
-                self._merge_json_files(static_file, rendered_file, output_file)
+                self._merge_json_files(app_name, static_file, rendered_file, output_file)
             else:
-                self._merge_text_files(static_file, rendered_file, output_file)
+                self._merge_text_files(app_name, static_file, rendered_file, output_file)
         
-        print(f"✓ Merged {app_name} config")
+        return f"Merged {app_name} config"
     
-    def merge_all_configs(self) -> None:
-        """Merge all application configurations."""
-        
-        print("Merging static configs with rendered themes...")
-        
-        # Hyprland (special handling)
-        self.merge_hyprland_config()
+    def _run_jobs(self, apps: Optional[Iterable[str]] = None) -> Tuple[int, Dict[str, float]]:
+        """Run every app's (or the given apps') merge job in parallel; returns (job count, per-app ms).
         
-        # Waybar (special handling)
-        self.merge_waybar_config()
-        
-        # Generic applications
+        On failure all staged outputs are discarded and the first error is raised.
+        """
+        # Applications without include support: static config and theme concatenated
         app_configs = {
-            "rofi": ["config.rasi"],
-            "dunst": ["dunstrc"],
-            "kitty": ["kitty.conf"],
-            "foot": ["foot.ini"],
-            "fish": ["config.fish"],
             "btop": ["btop.conf"],
         }
         
+        # One job per app; include-mode apps only write their theme fragments, GTK needs special handling
+        jobs: Dict[str, Callable[[], str]] = {}
+        for app_name in INCLUDE_TARGETS:
+            jobs[app_name] = partial(self.merge_include_config, app_name)
         for app_name, config_files in app_configs.items():
-            self.merge_generic_config(app_name, config_files)
+            jobs[app_name] = partial(self.merge_generic_config, app_name, config_files)
+        jobs["gtk"] = self._merge_gtk_configs
+        if apps is not None:
+            selected = set(apps)
+            jobs = {app_name: job for app_name, job in jobs.items() if app_name in selected}
+            if not jobs:
+                return 0, {}
+        
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=min(8, len(jobs)), thread_name_prefix="merge")
+        
+        futures = {app_name: self._pool.submit(self._timed_job, job) for app_name, job in jobs.items()}
+        timings: Dict[str, float] = {}
+        messages: Dict[str, str] = {}
+        errors = []
+        # Jobs only return their messages; logging here, in job order, keeps output from interleaving
+        for app_name, future in futures.items():
+            try:
+                timings[app_name], messages[app_name] = future.result()
+            except Exception as e:
+                errors.append((app_name, e))
+        
+        # Publish only if every app merged, so configs never mix two themes
+        if errors:
+            self._discard_staged()
+            app_name, error = errors[0]
+            log_error("MERGE", f"Merging {app_name} failed, no configs were changed: {error}")
+            raise error
+        for app_name, message in messages.items():
+            log_success("MERGE", message)
+        return len(jobs), timings
+    
+    def merge_all_configs(self) -> None:
+        """Merge all application configurations."""
         
-        # GTK configs (special handling for different versions)
-        self._merge_gtk_configs()
+        with span("merge_configs") as sp:
+            log_info("MERGE", "Merging static configs with rendered themes...")
+            
+            # Reload so changes not yet consumed by the reloader are kept
+            self.changes = ChangeManifest(self.changes_file, "merge")
+            self._outputs = {}
+            
+            start = time.perf_counter()
+            installed = self._install_base_configs()
+            job_count, timings = self._run_jobs()
+            self._commit_staged()
+            if installed:
+                self._save_base_state()
+            total_ms = (time.perf_counter() - start) * 1000
+            
+            per_app = ", ".join(f"{app_name} {elapsed_ms:.1f}" for app_name, elapsed_ms
+                                in sorted(timings.items(), key=lambda item: -item[1]))
+            log_info("MERGE", f"Merged {job_count} apps in {total_ms:.1f} ms (per app, ms: {per_app})")
+            # Jobs ran on pool threads; their timings become child spans here
+            for app_name, elapsed_ms in timings.items():
+                record(f"merge.{app_name}", elapsed_ms)
+            
+            self._record_changes()
+            sp.set(apps=job_count, changed=sorted(self.changes.written_apps))
+            log_success("MERGE", "All configs merged successfully!")
+    
+    def merge_app_configs(self, apps: Iterable[str]) -> List[str]:
+        """Re-merge only the given apps (watch mode); returns the apps that changed.
+        
+        Live edits are not themes, so no backup generation is recorded.
+        """
+        with span("merge_configs") as sp:
+            self.changes = ChangeManifest(self.changes_file, "merge")
+            self._outputs = {}
+            # Only static configs whose content changed are rewritten
+            installed = self._install_base_configs()
+            job_count, timings = self._run_jobs(apps)
+            self._commit_staged()
+            if installed:
+                self._save_base_state()
+            for app_name, elapsed_ms in timings.items():
+                record(f"merge.{app_name}", elapsed_ms)
+            
+            self.changes.save()
+            sp.set(apps=job_count, changed=sorted(self.changes.written_apps))
+            return sorted(self.changes.written_apps)
+    
+    def plan_all_configs(self) -> Dict[Path, Tuple[str, bytes]]:
+        """Compute every merged output as path -> (app, content) without writing anything."""
+        self._outputs = {}
+        self._plan = {}
+        try:
+            with span("plan_configs"):
+                self._run_jobs()
+            return self._plan
+        finally:
+            self._plan = None
+    
+    def publish_planned(self, planned: Dict[Path, Tuple[str, bytes]]) -> List[str]:
+        """Publish outputs computed by plan_all_configs; returns the apps that changed.
+        
+        Same atomic commit, change manifest and backup generation as a merge,
+        without reading any static or rendered file.
+        """
+        with span("publish_configs") as sp:
+            self.changes = ChangeManifest(self.changes_file, "merge")
+            self._outputs = {}
+            start = time.perf_counter()
+            # Plans (and bundles) hold only per-theme outputs; static configs are installed here
+            installed = self._install_base_configs()
+            for output_file, (app_name, data) in planned.items():
+                self._write_output(app_name, output_file, data.decode("utf-8"))
+            self._commit_staged()
+            if installed:
+                self._save_base_state()
+            log_info("MERGE", f"Published {len(planned)} planned configs in "
+                              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+            
+            self._record_changes()
+            sp.set(files=len(planned), changed=sorted(self.changes.written_apps))
+            return sorted(self.changes.written_apps)
+    
+    def _commit_staged(self) -> None:
+        """Publish all staged outputs at once with atomic renames."""
+        # Keep the configs that existed before the very first apply
+        if self._staged and not self.backups.generations():
+            self.backups.snapshot(self._outputs_by_app(), label=ORIGINAL_LABEL)
+        
+        for app_name, output_file, tmp_file, data in self._staged:
+            os.replace(tmp_file, output_file)
+            self.changes.record(app_name, output_file, data)
+            current_span().add("bytes_written", len(data))
+        self._staged = []
+    
+    def _record_changes(self) -> None:
+        """Save the change manifest and record a backup generation if anything changed."""
+        self.changes.save()
+        log_info("MERGE", f"Changed configs: {', '.join(sorted(self.changes.written_apps)) or 'none'}")
         
-        print("All configs merged successfully!")
+        if self.changes.written_apps:
+            self._snapshot_generation()
+    
+    def _outputs_by_app(self) -> List[Tuple[str, Path]]:
+        return [(app_name, path) for path, app_name in sorted(self._outputs.items())]
+    
+    def _snapshot_generation(self) -> None:
+        """Record the merged configs and theme state as a backup generation."""
+        label = ""
+        try:
+            with open(self.current_theme_file, 'r') as f:
+                label = json.load(f).get("wallpaper_name", "")
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        
+        generation = self.backups.snapshot(self._outputs_by_app() + [("theme", self.current_theme_file)], label)
+        if generation is not None:
+            log_info("MERGE", f"Backup generation {generation} recorded")
+    
+    def _timed_job(self, job: Callable[[], str]) -> Tuple[float, str]:
+        """Run one app's merge job; returns its wall time in milliseconds and its message."""
+        start = time.perf_counter()
+        message = job()
+        return (time.perf_counter() - start) * 1000, message
     
-    def _merge_gtk_configs(self) -> None:
-        """Merge GTK theme configurations."""
+    def _merge_gtk_configs(self) -> str:
+        """Merge GTK theme configurations; returns the message to log."""
         
         # GTK2
         static_gtk2 = self.static_dir / "gtk" / "gtkrc-2.0"
         rendered_gtk2 = self.rendered_dir / "gtk" / "gtk-2.0"
         output_gtk2 = Path.home() / ".gtkrc-2.0"
-        self._merge_text_files(static_gtk2, rendered_gtk2, output_gtk2)
+        self._merge_text_files("gtk", static_gtk2, rendered_gtk2, output_gtk2)
         
         # GTK3
         static_gtk3 = self.static_dir / "gtk" / "settings.ini"
         rendered_gtk3 = self.rendered_dir / "gtk" / "gtk-3.0"
         output_gtk3 = self.output_dir / "gtk-3.0" / "settings.ini"
-        self._merge_text_files(static_gtk3, rendered_gtk3, output_gtk3)
+        self._merge_text_files("gtk", static_gtk3, rendered_gtk3, output_gtk3)
         
         # GTK4
         static_gtk4 = self.static_dir / "gtk" / "settings.ini"
         rendered_gtk4 = self.rendered_dir / "gtk" / "gtk-4.0"
         output_gtk4 = self.output_dir / "gtk-4.0" / "settings.ini"
-        self._merge_text_files(static_gtk4, rendered_gtk4, output_gtk4)
+        self._merge_text_files("gtk", static_gtk4, rendered_gtk4, output_gtk4)
         
-        print("✓ Merged GTK configs")
+        return "Merged GTK configs"
 
 def main():
     """CLI entry point for config merging."""
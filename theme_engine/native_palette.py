@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# theme_engine/native_palette.py
+# Native palette extraction - k-means quantization in OKLab with NumPy
+# Requires: python-numpy, python-pillow
+
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from color_math import LMS_TO_OKLAB, LMS_TO_RGB, OKLAB_TO_LMS, RGB_TO_LMS
+
+try:
+    import numpy as np
+    from PIL import Image
+    NATIVE_AVAILABLE = True
+except ImportError:
+    NATIVE_AVAILABLE = False
+
+# Image modes Image.reduce() box-averages per channel (palette indices cannot be averaged)
+REDUCIBLE_MODES = ("RGB", "RGBA", "L", "LA")
+
+def srgb_to_oklab(rgb: "np.ndarray") -> "np.ndarray":
+    """Convert sRGB values in [0, 1] (shape (..., 3)) to OKLab."""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    lms = np.cbrt(linear @ np.array(RGB_TO_LMS).T)
+    return lms @ np.array(LMS_TO_OKLAB).T
+
+def oklab_to_srgb(lab: "np.ndarray") -> "np.ndarray":
+    """Convert OKLab values (shape (..., 3)) to unclipped sRGB (in [0, 1] when in gamut)."""
+    lms = (np.asarray(lab, dtype=np.float64) @ np.array(OKLAB_TO_LMS).T) ** 3
+    linear = lms @ np.array(LMS_TO_RGB).T
+    # Sign-preserving transfer so out-of-gamut channels stay negative for the gamut test
+    magnitude = np.abs(linear)
+    encoded = np.where(magnitude <= 0.0031308, magnitude * 12.92, 1.055 * np.power(magnitude, 1 / 2.4) - 0.055)
+    return np.sign(linear) * encoded
+
+def hex_to_srgb(hex_colors: List[str]) -> "np.ndarray":
+    """Convert a list of #RRGGBB strings to an (N, 3) sRGB array in [0, 1]."""
+    values = [[int(c.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)] for c in hex_colors]
+    return np.array(values, dtype=np.float64).reshape(-1, 3) / 255.0
+
+def lch_to_hex(lch: "np.ndarray") -> List[str]:
+    """Convert OKLCh rows (L, C, h in radians) to hex, reducing chroma until in gamut."""
+    lch = np.array(lch, dtype=np.float64).reshape(-1, 3)
+    low = np.zeros(len(lch))
+    high = lch[:, 1].copy()
+    
+    # Bisect chroma per color so hue and lightness are preserved
+    for _ in range(12):
+        chroma = (low + high) / 2
+        rgb = _lch_to_srgb(lch[:, 0], chroma, lch[:, 2])
+        in_gamut = np.all((rgb >= -1e-4) & (rgb <= 1 + 1e-4), axis=1)
+        low = np.where(in_gamut, chroma, low)
+        high = np.where(in_gamut, high, chroma)
+    
+    full = _lch_to_srgb(lch[:, 0], lch[:, 1], lch[:, 2])
+    full_ok = np.all((full >= -1e-4) & (full <= 1 + 1e-4), axis=1)
+    rgb = np.where(full_ok[:, None], full, _lch_to_srgb(lch[:, 0], low, lch[:, 2]))
+    rgb8 = np.clip(np.round(rgb * 255), 0, 255).astype(int)
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb8]
+
+def _lch_to_srgb(lightness, chroma, hue) -> "np.ndarray":
+    lab = np.stack([lightness, chroma * np.cos(hue), chroma * np.sin(hue)], axis=-1)
+    return oklab_to_srgb(lab)
+
+class NativePaletteExtractor:
+    """Extracts a MaterialYou-style palette locally by clustering pixels in OKLab."""
+    
+    def __init__(self, max_edge: int = 128, clusters: int = 8, iterations: int = 12):
+        if not NATIVE_AVAILABLE:
+            raise ImportError("Native palette extraction requires numpy and pillow")
+        
+        self.max_edge = max_edge
+        self.clusters = clusters
+        self.iterations = iterations
+    
+    def _load_pixels(self, image_path: str) -> "np.ndarray":
+        """Decode a downsampled copy of the image and return (N, 3) sRGB floats."""
+        with Image.open(image_path) as img:
+            # JPEG can decode at 1/2..1/8 scale directly
+            img.draft('RGB', (self.max_edge * 2, self.max_edge * 2))
+            # PNG has no draft mode: reduce before converting, so only the small copy
+            # is converted (dropping alpha or gray->RGB commutes with box averaging)
+            if img.mode not in REDUCIBLE_MODES:
+                img = img.convert('RGB')
+            
+            factor = max(1, max(img.size) // self.max_edge)
+            if factor > 1:
+                img = img.reduce(factor)
+            img = img.convert('RGB')
+            
+            return np.asarray(img, dtype=np.float64).reshape(-1, 3) / 255.0
+    
+    def _assign(self, points: "np.ndarray", centers: "np.ndarray") -> "np.ndarray":
+        """Label each point with its nearest center (squared Euclidean)."""
+        distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        return np.argmin(distances, axis=1)
+    
+    def _kmeans(self, points: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """Deterministic k-means: farthest-point seeding from the median pixel."""
+        k = min(self.clusters, len(points))
+        median = np.median(points, axis=0)
+        centers = [points[np.argmin(np.sum((points - median) ** 2, axis=1))]]
+        min_dist = np.sum((points - centers[0]) ** 2, axis=1)
+        
+        for _ in range(1, k):
+            centers.append(points[np.argmax(min_dist)])
+            min_dist = np.minimum(min_dist, np.sum((points - centers[-1]) ** 2, axis=1))
+        
+        centers = np.array(centers)
+        for _ in range(self.iterations):
+            labels = self._assign(points, centers)
+            counts = np.bincount(labels, minlength=k)
+            sums = np.stack([np.bincount(labels, weights=points[:, d], minlength=k) for d in range(3)], axis=1)
+            nonempty = counts > 0
+            new_centers = centers.copy()
+            new_centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+            if np.allclose(new_centers, centers, atol=1e-5):
+                break
+            centers = new_centers
+        
+        weights = np.bincount(self._assign(points, centers), minlength=k) / len(points)
+        return centers, weights
+    
+    def _map_to_palette(self, centers: "np.ndarray", weights: "np.ndarray", mean_lightness: float) -> Dict[str, str]:
+        """Map OKLab clusters onto the nine palette keys."""
+        lightness = centers[:, 0]
+        chroma = np.hypot(centers[:, 1], centers[:, 2])
+        hue = np.arctan2(centers[:, 2], centers[:, 1])
+        is_dark = mean_lightness < 0.6
+        
+        # Neutral roles follow the hue of the dominant cluster
+        base_hue = hue[np.argmax(weights)]
+        
+        # Chromatic roles: rank clusters by prominence, favouring colorful ones
+        order = list(np.argsort(-(weights * (chroma + 0.02)), kind='stable'))
+        chosen = [order[0]]
+        for idx in order[1:]:
+            hue_gap = np.abs(np.angle(np.exp(1j * (hue[idx] - hue[chosen]))))
+            if np.all(hue_gap > np.radians(30)):
+                chosen.append(idx)
+            if len(chosen) == 3:
+                break
+        
+        role_hues = [hue[i] for i in chosen]
+        role_chroma = [max(chroma[i], 0.04) for i in chosen]
+        while len(role_hues) < 3:
+            # Not enough distinct hues in the image: rotate from primary like MaterialYou
+            role_hues.append(role_hues[0] + np.radians(60 * len(role_hues)))
+            role_chroma.append(role_chroma[0] * 0.8)
+        
+        accent_idx = int(np.argmax(chroma * np.sqrt(weights)))
+        accent_hue = hue[accent_idx]
+        accent_chroma = max(chroma[accent_idx] * 1.2, 0.12)
+        
+        def tone(dark: float, light: float) -> float:
+            return dark if is_dark else light
+        
+        role_l = tone(0.78, 0.48)
+        rows = {
+            "primary": (role_l, min(role_chroma[0], 0.2), role_hues[0]),
+            "secondary": (tone(0.74, 0.52), min(role_chroma[1], 0.16), role_hues[1]),
+            "tertiary": (tone(0.72, 0.50), min(role_chroma[2], 0.16), role_hues[2]),
+            "background": (tone(0.18, 0.97), min(chroma.max(), 0.025), base_hue),
+            "surface": (tone(0.27, 0.90), min(chroma.max(), 0.035), base_hue),
+            "accent": (tone(0.80, 0.55), min(accent_chroma, 0.25), accent_hue),
+            "text_primary": (tone(0.93, 0.22), 0.012, base_hue),
+            "text_secondary": (tone(0.80, 0.38), 0.02, base_hue),
+            "text_accent": (tone(0.88, 0.32), 0.09, accent_hue),
+        }
+        
+        hex_colors = lch_to_hex(np.array(list(rows.values())))
+        return dict(zip(rows.keys(), hex_colors))
+    
+    def extract(self, image_path: str) -> Dict[str, str]:
+        """Extract a nine-key palette from an image file."""
+        pixels = srgb_to_oklab(self._load_pixels(image_path))
+        centers, weights = self._kmeans(pixels)
+        return self._map_to_palette(centers, weights, float(pixels[:, 0].mean()))
+
+def main():
+    """CLI entry point for native palette extraction."""
+    if len(sys.argv) != 2:
+        print("Usage: native_palette.py <wallpaper_path>")
+        sys.exit(1)
+    
+    if not NATIVE_AVAILABLE:
+        print("Error: native extraction requires python-numpy and python-pillow")
+        sys.exit(1)
+    
+    palette = NativePaletteExtractor().extract(str(Path(sys.argv[1])))
+    print(json.dumps(palette, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# theme_engine/ollama_client.py
+# Pooled, model-aware Ollama API client
+# Session reuse, cached model list, keep_alive control and a circuit breaker
+# so a stopped Ollama server costs nothing after the first failed call
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from change_manifest import write_json_atomic
+
+class OllamaError(Exception):
+    """Raised when a request to the Ollama API fails."""
+
+class OllamaUnavailable(OllamaError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+def _import_requests():
+    """Import python-requests lazily; without it Ollama is treated as unavailable."""
+    try:
+        import requests
+    except ImportError as e:
+        raise OllamaUnavailable("python-requests not installed") from e
+    return requests
+
+class OllamaClient:
+    """Talks to a local Ollama server over a reused HTTP session."""
+    
+    def __init__(self, base_url: str = "http://127.0.0.1:11434", state_file: Optional[Path] = None,
+                 keep_alive: Optional[str] = None, connect_timeout: float = 2.0, read_timeout: float = 60.0,
+                 model_ttl: float = 300.0, failure_threshold: int = 2, cooldown: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        # How long Ollama keeps the model loaded after a request ("30m", "-1" = forever)
+        self.keep_alive = keep_alive or os.getenv("CLYPR_OLLAMA_KEEP_ALIVE", "30m")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.model_ttl = model_ttl
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        
+        # Breaker and model list survive across one-shot CLI runs via the state file
+        self.state_file = Path(state_file) if state_file else None
+        self._state: Dict[str, Any] = {"failures": 0, "open_until": 0.0, "models": None, "models_at": 0.0}
+        self._lock = threading.Lock()
+        self._session = None
+        self._load_state()
+    
+    def _load_state(self) -> None:
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, 'r') as f:
+                self._state.update(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+    
+    def _save_state(self) -> None:
+        if not self.state_file:
+            return
+        write_json_atomic(self.state_file, self._state)
+    
+    @property
+    def session(self):
+        """HTTP session with a small keep-alive connection pool (requests imported lazily)."""
+        if self._session is None:
+            requests = _import_requests()
+            from requests.adapters import HTTPAdapter
+            
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+            self._session = session
+        return self._session
+    
+    def breaker_open(self) -> bool:
+        """True while recent failures keep the client from contacting Ollama."""
+        return time.time() < self._state["open_until"]
+    
+    def _record_success(self) -> None:
+        with self._lock:
+            if self._state["failures"] or self._state["open_until"]:
+                self._state["failures"] = 0
+                self._state["open_until"] = 0.0
+                self._save_state()
+    
+    def _record_failure(self) -> None:
+        with self._lock:
+            self._state["failures"] += 1
+            if self._state["failures"] >= self.failure_threshold:
+                self._state["open_until"] = time.time() + self.cooldown
+            self._save_state()
+    
+    def _request(self, method: str, path: str, read_timeout: Optional[float] = None, **kwargs):
+        """Send a request through the breaker; raises OllamaError on any failure."""
+        if self.breaker_open():
+            remaining = self._state["open_until"] - time.time()
+            raise OllamaUnavailable(f"Ollama marked unavailable for another {remaining:.0f}s")
+        
+        requests = _import_requests()
+        
+        try:
+            response = self.session.request(
+                method, f"{self.base_url}{path}",
+                timeout=(self.connect_timeout, read_timeout or self.read_timeout), **kwargs
+            )
+        except requests.exceptions.RequestException as e:
+            self._record_failure()
+            raise OllamaError(str(e)) from e
+        
+        if response.status_code >= 500:
+            self._record_failure()
+            raise OllamaError(f"HTTP {response.status_code}: {response.text[:200]}")
+        if response.status_code != 200:
+            raise OllamaError(f"HTTP {response.status_code}: {response.text[:200]}")
+        
+        self._record_success()
+        return response
+    
+    def list_models(self, force: bool = False) -> List[str]:
+        """Return installed model names, cached for model_ttl seconds."""
+        models = self._state.get("models")
+        if not force and models is not None and time.time() - self._state["models_at"] < self.model_ttl:
+            return models
+        
+        response = self._request("GET", "/api/tags", read_timeout=5)
+        models = [m.get("name", "") for m in response.json().get("models", [])]
+        with self._lock:
+            self._state["models"] = models
+            self._state["models_at"] = time.time()
+            self._save_state()
+        return models
+    
+    def find_model(self, prefix: str) -> Optional[str]:
+        """Return the first installed model whose name starts with prefix."""
+        for name in self.list_models():
+            if name.startswith(prefix):
+                return name
+        return None
+    
+    def generate(self, model: str, prompt: str, images: Optional[List[str]] = None,
+                 options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a non-streaming /api/generate call and return the decoded response."""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": options or {},
+        }
+        if images:
+            payload["images"] = images
+        
+        try:
+            return self._request("POST", "/api/generate", json=payload).json()
+        except ValueError as e:
+            raise OllamaError(f"Invalid JSON from Ollama: {e}") from e
+    
+    def generate_stream(self, model: str, prompt: str, images: Optional[List[str]] = None,
+                        options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Run a streaming /api/generate call, yielding one decoded NDJSON chunk per token.
+        
+        Closing the generator closes the HTTP response, which stops generation early.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": options or {},
+        }
+        if images:
+            payload["images"] = images
+        
+        requests = _import_requests()
+        
+        response = self._request("POST", "/api/generate", json=payload, stream=True)
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        except requests.exceptions.RequestException as e:
+            self._record_failure()
+            raise OllamaError(f"Stream interrupted: {e}") from e
+        except ValueError as e:
+            raise OllamaError(f"Invalid JSON chunk from Ollama: {e}") from e
+        finally:
+            response.close()
+    
+    def close(self) -> None:
+        """Close pooled connections."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+def main():
+    """CLI entry point: show Ollama status as seen by the client."""
+    dotfiles_dir = Path(__file__).parent.parent
+    client = OllamaClient(state_file=dotfiles_dir / "theme_engine" / "theme_data" / "ollama_state.json")
+    
+    if client.breaker_open():
+        print("Circuit breaker open: Ollama recently unreachable")
+    try:
+        print("Models:", ", ".join(client.list_models(force="--refresh" in sys.argv)) or "(none)")
+    except OllamaError as e:
+        print(f"Ollama unavailable: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
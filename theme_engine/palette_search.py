@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# theme_engine/palette_search.py
+# Palette similarity search over the wallpaper library
+# Cached palettes are indexed as one NumPy matrix of OKLab vectors (nine keys per
+# wallpaper) with precomputed norms, so a query is a single matrix-vector product
+# Requires: python-numpy
+
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from native_palette import hex_to_srgb, srgb_to_oklab
+from palette_store import PaletteStore
+
+try:
+    import numpy as np
+    SEARCH_AVAILABLE = True
+except ImportError:
+    SEARCH_AVAILABLE = False
+
+# Palette keys compared between wallpapers, in index column order
+PALETTE_KEYS = (
+    "primary", "secondary", "tertiary", "background", "surface",
+    "accent", "text_primary", "text_secondary", "text_accent",
+)
+
+def palette_vector(palette: Dict[str, str]) -> "np.ndarray":
+    """OKLab coordinates of the nine palette keys, shape (9, 3)."""
+    return srgb_to_oklab(hex_to_srgb([palette[key] for key in PALETTE_KEYS])).astype(np.float32)
+
+class PaletteIndex:
+    """OKLab matrix of every cached palette, rebuilt when the palette store changes."""
+    
+    def __init__(self, dotfiles_dir: str, store: Optional[PaletteStore] = None):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.theme_data_dir = self.dotfiles_dir / "theme_engine" / "theme_data"
+        self.index_file = self.theme_data_dir / "palette_index.npz"
+        self.store = store or PaletteStore(self.theme_data_dir / "palettes.db")
+        
+        self.hashes: List[str] = []
+        self.paths: List[Optional[str]] = []
+        self._set_vectors(np.zeros((0, len(PALETTE_KEYS), 3), dtype=np.float32))
+        self._signature: Optional[str] = None
+    
+    def _set_vectors(self, vectors: "np.ndarray") -> None:
+        """Install palette vectors (N, 9, 3) and precompute the query-side terms."""
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2, so only the dot products depend on the query
+        self._flat = self.vectors.reshape(len(self.vectors), len(PALETTE_KEYS) * 3)
+        self._norms = np.einsum("nd,nd->n", self._flat, self._flat)
+        # Key-major copy for color queries: the min over keys then runs across 9 contiguous rows
+        self._by_key = np.ascontiguousarray(self.vectors.transpose(1, 0, 2)).reshape(-1, 3)
+        self._key_norms = np.einsum("nc,nc->n", self._by_key, self._by_key).reshape(len(PALETTE_KEYS), -1)
+    
+    def load(self) -> int:
+        """Load the index, rebuilding it if the palette store changed; returns its size."""
+        signature = self.store.signature()
+        if signature == self._signature:
+            return len(self.hashes)
+        
+        try:
+            with np.load(self.index_file, allow_pickle=False) as data:
+                if str(data["signature"]) == signature:
+                    self.hashes = data["hashes"].tolist()
+                    self.paths = [path or None for path in data["paths"].tolist()]
+                    self._set_vectors(data["vectors"])
+                    self._signature = signature
+                    return len(self.hashes)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            pass
+        
+        return self.build(signature)
+    
+    def build(self, signature: Optional[str] = None) -> int:
+        """Rebuild the index from the palette store and persist it; returns its size."""
+        signature = signature or self.store.signature()
+        hashes, paths, raw = [], [], []
+        for wallpaper_hash, path, _, palette, _, _ in self.store.entries():
+            try:
+                # bytes.fromhex doubles as validation of the nine #RRGGBB values
+                values = bytes.fromhex("".join(palette[key][1:] for key in PALETTE_KEYS))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if len(values) != len(PALETTE_KEYS) * 3:
+                continue
+            hashes.append(wallpaper_hash)
+            paths.append(path)
+            raw.append(values)
+        
+        # One conversion for the whole library instead of one per palette
+        rgb = np.frombuffer(b"".join(raw), dtype=np.uint8).reshape(-1, 3) / 255.0
+        lab = srgb_to_oklab(rgb)
+        self.hashes = hashes
+        self.paths = paths
+        self._set_vectors(lab.reshape(len(hashes), len(PALETTE_KEYS), 3))
+        self._signature = signature
+        
+        # np.savez appends .npz to names without it, so keep the suffix on the temp file;
+        # pid and thread make it unique when two searches rebuild the index at once
+        self.theme_data_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.index_file.with_name(
+            f".{self.index_file.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez(tmp_file, signature=np.array(signature), hashes=np.array(hashes, dtype=str),
+                 paths=np.array([p or "" for p in paths], dtype=str), vectors=self.vectors)
+        os.replace(tmp_file, self.index_file)
+        return len(hashes)
+    
+    def palette_distances(self, palette: Dict[str, str]) -> "np.ndarray":
+        """RMS per-key OKLab distance (ΔE_OK) from palette to every indexed palette.
+        
+        Uses the index as loaded; call load() first to pick up store changes.
+        """
+        query = palette_vector(palette).reshape(-1)
+        squared = self._norms - 2.0 * (self._flat @ query) + float(query @ query)
+        return np.sqrt(np.maximum(squared, 0.0) / len(PALETTE_KEYS))
+    
+    def color_distances(self, hex_color: str) -> "np.ndarray":
+        """OKLab distance from a color to the closest key of every indexed palette."""
+        target = srgb_to_oklab(hex_to_srgb([hex_color]))[0].astype(np.float32)
+        squared = self._key_norms - 2.0 * (self._by_key @ target).reshape(self._key_norms.shape)
+        return np.sqrt(np.maximum(squared.min(axis=0) + float(target @ target), 0.0))
+    
+    def nearest(self, distances: "np.ndarray", count: int = 10) -> List[Tuple[str, float]]:
+        """The count closest (hash, distance) pairs for a distance vector, closest first."""
+        if count < len(distances):
+            # Partial selection, then sort just the winners
+            candidates = np.argpartition(distances, count)[:count]
+        else:
+            candidates = np.arange(len(distances))
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(self.hashes[i], float(distances[i])) for i in order]
+    
+    def distance_map(self, distances: "np.ndarray") -> Dict[str, float]:
+        """hash -> distance for every indexed palette (for sorting other listings)."""
+        return dict(zip(self.hashes, distances.tolist()))
+    
+    def path_of(self, wallpaper_hash: str) -> Optional[str]:
+        """Path recorded in the palette store for a hash, if any."""
+        try:
+            return self.paths[self.hashes.index(wallpaper_hash)]
+        except ValueError:
+            return None
+
+def load_current_palette(dotfiles_dir: Path) -> Tuple[Optional[str], Optional[Dict[str, str]]]:
+    """(wallpaper path, palette) of the applied theme, or (None, None)."""
+    try:
+        with open(Path(dotfiles_dir) / "theme_engine" / "theme_data" / "current.json", 'r') as f:
+            current = json.load(f)
+        return current.get("wallpaper_path"), current["palette"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None, None
+
+def main():
+    """CLI entry point: find wallpapers whose palette is close to the theme or a color."""
+    import argparse
+    import time
+    
+    from wallpaper_catalog import WallpaperCatalog
+    
+    parser = argparse.ArgumentParser(description="Find wallpapers with similar palettes")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--current", action="store_true", help="closest to the applied theme")
+    target.add_argument("--color", metavar="HEX", help="closest to a color, e.g. '#ff5500'")
+    target.add_argument("--wallpaper", metavar="PATH", help="closest to a cached wallpaper's palette")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of results (default: 10)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index first")
+    args = parser.parse_args()
+    
+    if not SEARCH_AVAILABLE:
+        print("Error: palette search requires python-numpy")
+        sys.exit(1)
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    index = PaletteIndex(str(dotfiles_dir))
+    if args.rebuild:
+        index.build()
+    index.load()
+    
+    exclude = None
+    if args.color:
+        if not re.match(r'^#?[0-9A-Fa-f]{6}$', args.color):
+            parser.error(f"invalid color: {args.color}")
+        query_start = time.perf_counter()
+        distances = index.color_distances(args.color)
+    else:
+        if args.current:
+            exclude, palette = load_current_palette(dotfiles_dir)
+            exclude = str(Path(exclude).resolve()) if exclude else None
+            if not palette:
+                print("No theme applied yet")
+                sys.exit(1)
+        else:
+            exclude = str(Path(args.wallpaper).resolve())
+            entry = index.store.get_by_paths([exclude]).get(exclude)
+            if not entry:
+                print(f"No cached palette for {args.wallpaper}")
+                sys.exit(1)
+            palette = entry[1]
+        query_start = time.perf_counter()
+        distances = index.palette_distances(palette)
+    
+    # One extra result in case the query wallpaper itself is among them
+    results = index.nearest(distances, args.count + 1)
+    query_ms = (time.perf_counter() - query_start) * 1000
+    
+    # Current paths come from the catalog; the store's path may be stale or missing
+    catalog = WallpaperCatalog(str(dotfiles_dir))
+    catalog.refresh()
+    paths_by_hash: Dict[str, List[str]] = {}
+    for entry in catalog.query():
+        paths_by_hash.setdefault(entry["hash"], []).append(entry["path"])
+    
+    shown = 0
+    for wallpaper_hash, distance in results:
+        paths = paths_by_hash.get(wallpaper_hash) or [index.path_of(wallpaper_hash) or f"({wallpaper_hash})"]
+        paths = [path for path in paths if path != exclude]
+        if not paths or shown >= args.count:
+            continue
+        print(f"{distance:.4f}  {paths[0]}")
+        shown += 1
+    print(f"Searched {len(index.hashes)} palettes in {query_ms:.3f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# theme_engine/palette_store.py
+# Single-file SQLite palette store with LRU eviction
+# Replaces the per-hash JSON files in theme_data/palette_cache/
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS palettes (
+    hash TEXT PRIMARY KEY,
+    path TEXT,
+    engine TEXT NOT NULL,
+    palette TEXT NOT NULL,
+    extracted_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_palettes_path ON palettes(path);
+CREATE INDEX IF NOT EXISTS idx_palettes_last_used ON palettes(last_used);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# SQLite limits the number of bound parameters per statement
+BATCH_SIZE = 500
+
+class PaletteStore:
+    """Stores extracted palettes keyed by wallpaper hash in one SQLite file."""
+    
+    def __init__(self, db_file: Path, max_entries: Optional[int] = None):
+        self.db_file = Path(db_file)
+        self.max_entries = max_entries or int(os.getenv("CLYPR_PALETTE_CACHE_MAX", "5000"))
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Shared by the daemon's request and prewarm threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+    
+    def get(self, wallpaper_hash: str, touch: bool = True) -> Optional[Tuple[str, Dict]]:
+        """Return (engine, palette) for a hash, marking it as recently used."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT engine, palette FROM palettes WHERE hash = ?", (wallpaper_hash,)
+            ).fetchone()
+            if row and touch:
+                with self._conn:
+                    self._conn.execute("UPDATE palettes SET last_used = ? WHERE hash = ?",
+                                       (time.time(), wallpaper_hash))
+        
+        return (row[0], json.loads(row[1])) if row else None
+    
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Tuple[str, Dict]]:
+        """Batch lookup: hash -> (engine, palette) for every cached hash."""
+        return self._select_many("hash", list(hashes))
+    
+    def get_by_paths(self, paths: Iterable[str]) -> Dict[str, Tuple[str, Dict]]:
+        """Batch lookup by wallpaper path: path -> (engine, palette)."""
+        return self._select_many("path", [str(p) for p in paths])
+    
+    def _select_many(self, column: str, keys: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        results = {}
+        with self._lock:
+            for i in range(0, len(keys), BATCH_SIZE):
+                batch = keys[i:i + BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT {column}, engine, palette FROM palettes WHERE {column} IN ({placeholders})", batch
+                )
+                for key, engine, palette in rows:
+                    results[key] = (engine, json.loads(palette))
+        return results
+    
+    def put(self, wallpaper_hash: str, palette: Dict, engine: str,
+            path: Optional[str] = None, extracted_at: Optional[float] = None) -> None:
+        """Insert or replace a palette, evicting least recently used entries if over the limit."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO palettes (hash, path, engine, palette, extracted_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (wallpaper_hash, path, engine, json.dumps(palette), extracted_at or now, now),
+            )
+            self._evict_locked()
+    
+    def _evict_locked(self) -> int:
+        count = self._conn.execute("SELECT COUNT(*) FROM palettes").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        
+        self._conn.execute(
+            "DELETE FROM palettes WHERE hash IN "
+            "(SELECT hash FROM palettes ORDER BY last_used ASC LIMIT ?)", (excess,)
+        )
+        return excess
+    
+    def evict(self) -> int:
+        """Trim the store to max_entries; returns the number of evicted palettes."""
+        with self._lock, self._conn:
+            return self._evict_locked()
+    
+    def delete(self, wallpaper_hash: str) -> None:
+        """Remove a single palette."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM palettes WHERE hash = ?", (wallpaper_hash,))
+    
+    def entries(self) -> Iterator[Tuple[str, Optional[str], str, Dict, float, float]]:
+        """Iterate over (hash, path, engine, palette, extracted_at, last_used) rows."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hash, path, engine, palette, extracted_at, last_used FROM palettes ORDER BY hash"
+            ).fetchall()
+        for wallpaper_hash, path, engine, palette, extracted_at, last_used in rows:
+            yield wallpaper_hash, path, engine, json.loads(palette), extracted_at, last_used
+    
+    def signature(self) -> str:
+        """Changes whenever palettes are added, replaced or removed (but not when read)."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), TOTAL(extracted_at) FROM palettes").fetchone()
+        return f"{count}:{total!r}"
+    
+    def count(self) -> int:
+        """Number of stored palettes."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM palettes").fetchone()[0]
+    
+    def migrate_json_cache(self, cache_dir: Path, validate=None) -> int:
+        """One-time import of legacy <hash>.json cache files; returns the number imported."""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done or not Path(cache_dir).is_dir():
+            return 0
+        
+        rows = []
+        for cache_file in sorted(Path(cache_dir).glob("*.json")):
+            try:
+                with open(cache_file, 'r') as f:
+                    cache_data = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Skipping unreadable cache file {cache_file}: {e}")
+                continue
+            
+            palette = cache_data.get("palette")
+            if not palette or (validate and not validate(palette)):
+                continue
+            
+            extracted_at = cache_data.get("extracted_at", time.time())
+            rows.append((cache_data.get("wallpaper_hash", cache_file.stem), None,
+                         cache_data.get("engine", "llava"), json.dumps(palette), extracted_at, extracted_at))
+        
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO palettes (hash, path, engine, palette, extracted_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                               (str(time.time()),))
+            self._evict_locked()
+        
+        if rows:
+            print(f"Migrated {len(rows)} cached palettes from {cache_dir}")
+        return len(rows)
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def main():
+    """CLI entry point for inspecting the palette store."""
+    usage = "Usage: palette_store.py <stats|list|evict>"
+    if len(sys.argv) != 2 or sys.argv[1] not in ("stats", "list", "evict"):
+        print(usage)
+        sys.exit(1)
+    
+    # Determine dotfiles directory (parent of theme_engine)
+    dotfiles_dir = Path(__file__).parent.parent
+    store = PaletteStore(dotfiles_dir / "theme_engine" / "theme_data" / "palettes.db")
+    
+    if sys.argv[1] == "stats":
+        print(f"Palettes: {store.count()} (limit {store.max_entries})")
+        print(f"Database: {store.db_file} ({store.db_file.stat().st_size} bytes)")
+    elif sys.argv[1] == "list":
+        for wallpaper_hash, path, engine, palette, extracted_at, last_used in store.entries():
+            print(f"{wallpaper_hash}  {engine:6}  {palette['primary']}  {path or '-'}")
+    else:
+        print(f"Evicted {store.evict()} palettes")
+
+if __name__ == "__main__":
+    main()
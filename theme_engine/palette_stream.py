@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# theme_engine/palette_stream.py
+# Incremental JSON scanner for streamed LLaVA output
+# Detects the end of the palette object as tokens arrive and rejects
+# clearly malformed output early instead of waiting for the full completion
+
+import re
+from typing import Optional
+
+HEX_COLOR = re.compile(r'^#[0-9A-Fa-f]{6}$')
+
+class MalformedStream(Exception):
+    """Raised as soon as the streamed text cannot become a valid palette object."""
+
+class IncrementalJSONScanner:
+    """Scans streamed text for the first flat JSON object of "key": "#RRGGBB" pairs."""
+    
+    def __init__(self, max_prelude: int = 300, max_object: int = 1200):
+        # Characters allowed before the opening brace (LLaVA likes to add a sentence)
+        self.max_prelude = max_prelude
+        # A nine-color palette object is ~300 characters; anything far longer is rambling
+        self.max_object = max_object
+        
+        self._prelude = 0
+        self._buffer = []
+        self._length = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._expect_value = False
+    
+    def feed(self, text: str) -> Optional[str]:
+        """Consume more text; returns the object text once it is complete."""
+        for char in text:
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._append(char)
+                else:
+                    self._prelude += 1
+                    if self._prelude > self.max_prelude:
+                        raise MalformedStream(f"No JSON object after {self.max_prelude} characters")
+                continue
+            
+            self._append(char)
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string("".join(self._string))
+                else:
+                    self._string.append(char)
+                continue
+            
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char == ":":
+                self._expect_value = True
+            elif char == ",":
+                self._expect_value = False
+            elif char == "}":
+                return "".join(self._buffer)
+            elif char in "{[":
+                raise MalformedStream("Nested value in palette object")
+            elif self._expect_value and not char.isspace():
+                raise MalformedStream(f"Non-string value in palette object: {char!r}")
+        
+        return None
+    
+    def _append(self, char: str) -> None:
+        self._buffer.append(char)
+        self._length += 1
+        if self._length > self.max_object:
+            raise MalformedStream(f"Palette object longer than {self.max_object} characters")
+    
+    def _close_string(self, value: str) -> None:
+        if self._expect_value:
+            if not HEX_COLOR.match(value):
+                raise MalformedStream(f"Invalid hex color in stream: {value!r}")
+            self._expect_value = False
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# theme_engine/prewarm.py
+# Bulk palette pre-extraction for the wallpaper library
+# Native extraction runs in a process pool, LLaVA requests are bounded by a
+# separate concurrency limit so the local Ollama server is not flooded
+
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from change_manifest import write_json_atomic
+from wallpaper_catalog import WALLPAPER_EXTENSIONS, WallpaperCatalog
+
+def find_wallpapers(root: Path) -> List[Path]:
+    """Find all wallpaper images below root, in stable order (thumbnails excluded)."""
+    wallpapers = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "thumbnails")
+        for name in sorted(filenames):
+            if Path(name).suffix.lower() in WALLPAPER_EXTENSIONS:
+                wallpapers.append(Path(dirpath) / name)
+    return wallpapers
+
+def _lower_priority() -> None:
+    """Process pool initializer: prewarm work should never compete with the desktop."""
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+def _native_extract(image_path: str) -> Dict[str, str]:
+    """Process pool job: extract a palette with the native engine."""
+    from native_palette import NativePaletteExtractor
+    return NativePaletteExtractor().extract(image_path)
+
+class PalettePrewarmer:
+    """Extracts and caches palettes for every wallpaper that is not cached yet."""
+    
+    def __init__(self, extractor, workers: Optional[int] = None, ollama_concurrency: int = 1,
+                 idle_only: bool = False, idle_load: Optional[float] = None):
+        self.extractor = extractor
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.ollama_concurrency = max(1, ollama_concurrency)
+        self.idle_only = idle_only
+        # Load average (1 min) below which the system counts as idle
+        self.idle_load = idle_load if idle_load is not None else (os.cpu_count() or 2) * 0.25
+        self.state_file = extractor.dotfiles_dir / "theme_engine" / "theme_data" / "prewarm_state.json"
+        self.state: Dict[str, Dict] = {"done": {}, "failed": {}}
+    
+    def _load_state(self, root: Path) -> None:
+        """Load the resumable state for this library root."""
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            if state.get("root") == str(root):
+                self.state = state
+                return
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self.state = {"root": str(root), "done": {}, "failed": {}}
+    
+    def _save_state(self) -> None:
+        """Write the state file atomically."""
+        write_json_atomic(self.state_file, self.state)
+    
+    def reset_state(self) -> None:
+        """Forget progress and failures from previous runs."""
+        self.state_file.unlink(missing_ok=True)
+    
+    def find_wallpapers(self, root: Path) -> List[Path]:
+        """Find all wallpaper images below root, in stable order."""
+        return find_wallpapers(root)
+    
+    def find_hashed(self, root: Path) -> List[Tuple[str, str]]:
+        """Return (path, hash) for every wallpaper below root."""
+        catalog = WallpaperCatalog(str(self.extractor.dotfiles_dir), fingerprints=self.extractor.fingerprints)
+        try:
+            if root == catalog.root or catalog.root in root.parents:
+                # Inside the library: the catalog already knows paths and hashes
+                catalog.refresh()
+                return [(entry["path"], entry["hash"]) for entry in catalog.query(under=root) if entry["hash"]]
+        finally:
+            catalog.close()
+        
+        hashed = [(str(path), self.extractor.fingerprints.get_hash(str(path), save=False))
+                  for path in self.find_wallpapers(root)]
+        self.extractor.fingerprints.save()
+        return hashed
+    
+    def find_pending(self, root: Path) -> List[Tuple[str, str]]:
+        """Return (path, hash) for wallpapers without a cached palette."""
+        candidates = []
+        for key, wallpaper_hash in self.find_hashed(root):
+            if key in self.state["failed"]:
+                continue
+            if self.state["done"].get(key) == wallpaper_hash:
+                continue
+            candidates.append((key, wallpaper_hash))
+        
+        # One batched store query instead of a lookup per wallpaper
+        cached = self.extractor.palette_store.get_many(h for _, h in candidates)
+        pending = []
+        for key, wallpaper_hash in candidates:
+            entry = cached.get(wallpaper_hash)
+            if entry and self.extractor._engine_matches(entry[0]):
+                self.state["done"][key] = wallpaper_hash
+            else:
+                pending.append((key, wallpaper_hash))
+        return pending
+    
+    def _wait_for_idle(self) -> None:
+        """Block until the 1-minute load average drops below the idle threshold."""
+        if not self.idle_only:
+            return
+        
+        announced = False
+        while os.getloadavg()[0] >= self.idle_load:
+            if not announced:
+                print(f"Waiting for idle system (load < {self.idle_load:.2f})...")
+                announced = True
+            time.sleep(5)
+    
+    def _select_engine(self) -> str:
+        """Pick the engine for this run from the extractor's engine setting."""
+        if self.extractor.engine == "native":
+            return "native"
+        if self.extractor._check_ollama_available():
+            return "llava"
+        if self.extractor.engine == "llava":
+            raise RuntimeError("Ollama/LLaVA not available")
+        return "native"
+    
+    def run(self, root: str) -> Dict[str, int]:
+        """Pre-extract palettes for every uncached wallpaper below root."""
+        root_path = Path(root).resolve()
+        self._load_state(root_path)
+        
+        pending = self.find_pending(root_path)
+        total = len(pending)
+        print(f"Prewarm: {total} wallpapers need extraction ({len(self.state['done'])} already cached)")
+        if not pending:
+            self._save_state()
+            return {"extracted": 0, "failed": 0, "total": 0}
+        
+        engine = self._select_engine()
+        if engine == "native":
+            pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+            limit = self.workers
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.ollama_concurrency)
+            limit = self.ollama_concurrency
+        
+        print(f"Prewarm: using {engine} engine with {limit} concurrent jobs")
+        
+        extracted = failed = 0
+        start = time.time()
+        in_flight: Dict[Future, Tuple[str, str]] = {}
+        queue = list(reversed(pending))
+        
+        try:
+            while queue or in_flight:
+                while queue and len(in_flight) < limit:
+                    self._wait_for_idle()
+                    path, wallpaper_hash = queue.pop()
+                    if engine == "native":
+                        future = pool.submit(_native_extract, path)
+                    else:
+                        future = pool.submit(self.extractor._call_llava, path, wallpaper_hash)
+                    in_flight[future] = (path, wallpaper_hash)
+                
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, wallpaper_hash = in_flight.pop(future)
+                    try:
+                        palette = future.result()
+                        error = None if palette and self.extractor._validate_color_palette(palette) else "no valid palette"
+                    except Exception as e:
+                        palette, error = None, str(e)
+                    
+                    if error:
+                        failed += 1
+                        self.state["failed"][path] = error
+                    else:
+                        extracted += 1
+                        self.extractor._save_to_cache(wallpaper_hash, palette, engine, path)
+                        self.state["done"][path] = wallpaper_hash
+                    
+                    completed = extracted + failed
+                    elapsed = time.time() - start
+                    eta = elapsed / completed * (total - completed)
+                    status = f"failed: {error}" if error else "ok"
+                    print(f"[{completed}/{total}] {Path(path).name} ({status}) - ETA {eta:.0f}s")
+                    
+                    # Persist progress periodically so an interrupted run can resume
+                    if completed % 10 == 0:
+                        self._save_state()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._save_state()
+        
+        print(f"Prewarm complete: {extracted} extracted, {failed} failed in {time.time() - start:.1f}s")
+        return {"extracted": extracted, "failed": failed, "total": total}
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# theme_engine/reload_apps.py
+# Concurrent application reload orchestrator
+# Runs one reload action per changed app in parallel and waits on real readiness
+# signals (command completion, process exit/appearance) instead of fixed sleeps
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from change_manifest import ChangeManifest
+from theme_logging import log_error, log_info, log_success, log_warning
+from tracing import record, span
+
+# Apps that may need a manual restart to pick up the theme (see check_running_apps)
+RESTART_CANDIDATES = ("brave", "brave-browser", "thunar", "nautilus", "code")
+
+class ReloadSkipped(Exception):
+    """Raised by an action when its app or tool is not available."""
+
+def process_names() -> Dict[int, str]:
+    """Map of PID -> process name for every running process."""
+    names = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/comm", 'r') as f:
+                names[int(entry.name)] = f.read().rstrip("\n")
+        except OSError:
+            continue
+    return names
+
+def find_pids(name: str) -> List[int]:
+    """PIDs whose process name is exactly name (like pgrep -x, without forking)."""
+    # The kernel truncates process names to 15 characters
+    return [pid for pid, comm in process_names().items() if comm == name[:15]]
+
+def wait_until(predicate: Callable[[], bool], timeout: float, interval: float = 0.02) -> bool:
+    """Poll predicate until it is true or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if predicate():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+
+class AppReloader:
+    """Reloads themed applications concurrently and reports per-app latency."""
+    
+    def __init__(self, dotfiles_dir: str, timeout: float = 5.0):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.config_dir = Path.home() / ".config"
+        self.timeout = timeout
+        
+        # Changed-app name (as recorded by the merger) -> reload action
+        self.actions: Dict[str, Callable[[], str]] = {
+            "hyprland": self.reload_hyprland,
+            "waybar": self.reload_waybar,
+            "dunst": self.reload_dunst,
+            "kitty": self.reload_kitty,
+            "foot": self.reload_foot,
+            "gtk": self.update_gtk_theme,
+            "rofi": self.refresh_rofi,
+        }
+    
+    def _run(self, *command: str) -> subprocess.CompletedProcess:
+        """Run a command to completion, bounded by the reload timeout."""
+        if shutil.which(command[0]) is None:
+            raise ReloadSkipped(f"{command[0]} not found")
+        result = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} exited with {result.returncode}: {result.stderr.strip()}")
+        return result
+    
+    def reload_hyprland(self) -> str:
+        self._run("hyprctl", "reload")
+        return "configuration reloaded"
+    
+    def reload_waybar(self) -> str:
+        pids = find_pids("waybar")
+        if pids:
+            # SIGUSR2 makes Waybar re-read config and style in place
+            for pid in pids:
+                os.kill(pid, signal.SIGUSR2)
+            return f"reloaded in place ({len(pids)} bars)"
+        
+        if shutil.which("waybar") is None:
+            raise ReloadSkipped("waybar not found")
+        
+        bars = []
+        for config_file in ("config-top.json", "config-bottom.json"):
+            bars.append(subprocess.Popen(
+                ["waybar", "-c", str(self.config_dir / "waybar" / config_file)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+            ))
+        
+        # Ready once the bars show up under their process name; fail fast if one exits
+        if not wait_until(lambda: len(find_pids("waybar")) >= len(bars)
+                          or any(bar.poll() is not None for bar in bars), self.timeout):
+            raise RuntimeError("waybar did not start in time")
+        exited = [bar.args[-1] for bar in bars if bar.poll() is not None]
+        if exited:
+            raise RuntimeError(f"waybar exited on start: {', '.join(exited)}")
+        return f"started {len(bars)} bars"
+    
+    def reload_dunst(self) -> str:
+        self._run("dunstctl", "reload")
+        return "configuration reloaded"
+    
+    def reload_kitty(self) -> str:
+        pids = find_pids("kitty")
+        if not pids:
+            raise ReloadSkipped("no running instances")
+        # Kitty reloads its config on SIGUSR1
+        for pid in pids:
+            os.kill(pid, signal.SIGUSR1)
+        return f"signalled {len(pids)} instances"
+    
+    def reload_foot(self) -> str:
+        # Foot cannot reload its config; new instances use the new theme
+        return "applies to new instances"
+    
+    def update_gtk_theme(self) -> str:
+        # Toggle the theme so running GTK apps notice; confirm the first write
+        # landed instead of sleeping before switching back
+        self._run("gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita")
+        if not wait_until(lambda: "'Adwaita'" in self._run(
+                "gsettings", "get", "org.gnome.desktop.interface", "gtk-theme").stdout, self.timeout):
+            raise RuntimeError("gtk-theme change was not applied")
+        self._run("gsettings", "set", "org.gnome.desktop.interface", "gtk-theme", "Adwaita-dark")
+        return "theme refreshed"
+    
+    def refresh_rofi(self) -> str:
+        return "applies on next launch"
+    
+    def _timed(self, app_name: str) -> Tuple[str, str, float, str]:
+        start = time.perf_counter()
+        try:
+            status, message = "ok", self.actions[app_name]()
+        except ReloadSkipped as e:
+            status, message = "skipped", str(e)
+        except Exception as e:
+            status, message = "failed", str(e)
+        return app_name, status, (time.perf_counter() - start) * 1000, message
+    
+    def reload(self, apps: Optional[List[str]] = None) -> List[Tuple[str, str, float, str]]:
+        """Run the reload actions for apps (all apps if None) concurrently.
+        
+        Returns (app, status, milliseconds, message) per app, slowest first.
+        """
+        with span("reload_apps") as sp:
+            selected = [app for app in (apps if apps is not None else self.actions) if app in self.actions]
+            if not selected:
+                return []
+            
+            with ThreadPoolExecutor(max_workers=len(selected)) as pool:
+                results = list(pool.map(self._timed, selected))
+            
+            # Actions ran on pool threads; their timings become child spans here
+            for app_name, status, elapsed_ms, message in results:
+                record(f"reload.{app_name}", elapsed_ms, status="error" if status == "failed" else "ok",
+                       result=status, message=message)
+            sp.set(apps=selected)
+            return sorted(results, key=lambda result: -result[2])
+    
+    def check_running_apps(self) -> List[str]:
+        """Running applications that may need a manual restart for the full theme."""
+        running = set(process_names().values())
+        return [app for app in RESTART_CANDIDATES if app[:15] in running]
+    
+    def send_notification(self) -> None:
+        """Desktop notification, fire-and-forget."""
+        if shutil.which("notify-send"):
+            subprocess.Popen(["notify-send", "Theme Applied", "Dynamic theme has been applied successfully!",
+                              "--icon=preferences-desktop-theme", "--urgency=normal", "--expire-time=3000"],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def changed_apps(dotfiles_dir: Path) -> Optional[List[str]]:
+    """Apps recorded as changed by merge_configs.py (consumed), or None to reload everything."""
+    manifest_file = dotfiles_dir / "theme_engine" / "theme_data" / "changes.json"
+    if manifest_file.exists():
+        return ChangeManifest(manifest_file, "merge").take()
+    log_info("RELOAD", "No change manifest available, reloading all applications")
+    return None
+
+def reload_and_report(dotfiles_dir: Path, apps: Optional[List[str]]) -> int:
+    """Reload apps (None = all), log one line per app and notify; returns the number of failures."""
+    if apps is not None and not apps:
+        log_info("RELOAD", "No themed configs changed, nothing to reload")
+        return 0
+    
+    reloader = AppReloader(str(dotfiles_dir))
+    start = time.perf_counter()
+    results = reloader.reload(apps)
+    total_ms = (time.perf_counter() - start) * 1000
+    
+    failed = 0
+    for app_name, status, elapsed_ms, message in results:
+        line = f"{app_name:9} {elapsed_ms:7.1f} ms  {status:7}  {message}"
+        if status == "failed":
+            failed += 1
+            log_error("RELOAD", line)
+        elif status == "skipped":
+            log_warning("RELOAD", line)
+        else:
+            log_success("RELOAD", line)
+    log_info("RELOAD", f"Reloaded {len(results)} apps in {total_ms:.1f} ms")
+    
+    running = reloader.check_running_apps()
+    if running:
+        log_info("RELOAD", f"Running applications that may benefit from restart: {', '.join(running)}")
+    reloader.send_notification()
+    return failed
+
+def main():
+    """CLI entry point: reload changed apps (from the change manifest), given apps, or --all."""
+    dotfiles_dir = Path(__file__).parent.parent
+    args = sys.argv[1:]
+    
+    if args and args[0] in ("--help", "-h"):
+        print("Usage: reload_apps.py [--all | app...]")
+        print("Without arguments, reloads the apps recorded as changed by merge_configs.py")
+        return
+    
+    apps: Optional[List[str]]
+    if "--all" in args:
+        apps = None
+    elif args:
+        apps = args
+    else:
+        apps = changed_apps(dotfiles_dir)
+    
+    sys.exit(1 if reload_and_report(dotfiles_dir, apps) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -5,24 +5,48 @@
 
 import json
 import os
-import re
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List, Optional
 import shutil
 
+from change_manifest import ChangeManifest
+from template_compiler import CompiledTemplate, TemplateCompiler
+from theme_logging import log_debug, log_error, log_info, log_success, log_warning
+from tracing import span
+
 class ThemeRenderer:
     """Renders minimal theme templates with extracted color palette and font data."""
     
-    def __init__(self, dotfiles_dir: str):
+    def __init__(self, dotfiles_dir: str, rendered_dir: Optional[Path] = None):
         self.dotfiles_dir = Path(dotfiles_dir)
         self.templates_dir = self.dotfiles_dir / "config_templates"
         self.theme_data_dir = self.dotfiles_dir / "theme_engine" / "theme_data"
         self.current_theme_file = self.theme_data_dir / "current.json"
         self.rendered_dir = self.theme_data_dir / "rendered"
+        self.changes_file = self.theme_data_dir / "changes.json"
+        
+        # Staged renders (e.g. rotation prefetch) keep their own output and change manifest
+        if rendered_dir is not None:
+            self.rendered_dir = Path(rendered_dir)
+            self.changes_file = self.rendered_dir.parent / "changes.json"
+        
+        # Compiled templates cached on disk, invalidated by mtime
+        self.compiler = TemplateCompiler(self.theme_data_dir / "compiled_templates.json")
+        # Palette-derived variables (tones, on-colors, color forms), memoized per palette;
+        # created on first render so bundle swaps never import it
+        self._derived = None
         
         # Create directories
         self.rendered_dir.mkdir(parents=True, exist_ok=True)
     
+    @property
+    def derived(self):
+        """Derived-variable engine, imported on first use."""
+        if self._derived is None:
+            from derived_variables import DerivedVariables
+            self._derived = DerivedVariables()
+        return self._derived
+    
     def _load_current_theme(self) -> Dict[str, Any]:
         """Load current theme data including palette and metadata."""
         if not self.current_theme_file.exists():
@@ -31,49 +55,14 @@ class ThemeRenderer:
         with open(self.current_theme_file, 'r') as f:
             return json.load(f)
     
-    def _get_template_variables(self, theme_data: Dict[str, Any]) -> Dict[str, str]:
-        """Generate all template variables from theme data."""
-        palette = theme_data["palette"]
-        
-        # Base color variables
-        variables = {
-            # Primary colors
-            "primary_color": palette["primary"],
-            "secondary_color": palette["secondary"], 
-            "tertiary_color": palette["tertiary"],
-            "accent_color": palette["accent"],
-            
-            # Background colors
-            "background_color": palette["background"],
-            "surface_color": palette["surface"],
-            
-            # Text colors
-            "text_primary_color": palette["text_primary"],
-            "text_secondary_color": palette["text_secondary"],
-            "text_accent_color": palette["text_accent"],
-            
+    def _get_static_variables(self, theme_data: Dict[str, Any]) -> Dict[str, str]:
+        """Variables that do not depend on the palette."""
+        return {
             # Wallpaper info
             "wallpaper_path": theme_data["wallpaper_path"],
             "wallpaper_name": theme_data["wallpaper_name"],
-        }
-        
-        # Generate RGB variants for applications that need them
-        for key, hex_color in palette.items():
-            rgb_values = self._hex_to_rgb(hex_color)
-            variables[f"{key}_rgb"] = f"{rgb_values[0]}, {rgb_values[1]}, {rgb_values[2]}"
-            variables[f"{key}_r"] = str(rgb_values[0])
-            variables[f"{key}_g"] = str(rgb_values[1])
-            variables[f"{key}_b"] = str(rgb_values[2])
-        
-        # Generate opacity variants
-        for key, hex_color in palette.items():
-            variables[f"{key}_80"] = self._hex_with_opacity(hex_color, 0.8)
-            variables[f"{key}_60"] = self._hex_with_opacity(hex_color, 0.6)
-            variables[f"{key}_40"] = self._hex_with_opacity(hex_color, 0.4)
-            variables[f"{key}_20"] = self._hex_with_opacity(hex_color, 0.2)
-        
-        # Font variables (will be expanded in font management section)
-        variables.update({
+            
+            # Font variables (will be expanded in font management section)
             "font_family": "JetBrains Mono",
             "font_size": "12",
             "font_size_large": "14",
@@ -81,46 +70,17 @@ class ThemeRenderer:
             "icon_theme": "Papirus-Dark",
             "cursor_theme": "Adwaita",
             "gtk_theme": "Adwaita-dark",
-        })
-        
-        return variables
-    
-    def _hex_to_rgb(self, hex_color: str) -> tuple:
-        """Convert hex color to RGB tuple."""
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        }
     
-    def _hex_with_opacity(self, hex_color: str, opacity: float) -> str:
-        """Convert hex to hex with opacity (8-digit hex)."""
-        alpha = int(opacity * 255)
-        return f"{hex_color}{alpha:02x}"
+    def _get_template_variables(self, theme_data: Dict[str, Any], names: Iterable[str]) -> Dict[str, str]:
+        """Template variables for the given names; palette-derived ones are computed on demand."""
+        variables = self._get_static_variables(theme_data)
+        variables.update(self.derived.resolve(theme_data["palette"], names))
+        return variables
     
     def _render_template_content(self, content: str, variables: Dict[str, str]) -> str:
-        """Render template content by replacing variables."""
-        
-        # Replace {{variable_name}} patterns
-        def replace_var(match):
-            var_name = match.group(1)
-            if var_name in variables:
-                return variables[var_name]
-            else:
-                print(f"Warning: Unknown template variable: {var_name}")
-                return match.group(0)  # Return original if not found
-        
-        rendered = re.sub(r'\{\{(\w+)\}\}', replace_var, content)
-        
-        # Replace ${variable_name} patterns (alternative syntax)
-        def replace_env_var(match):
-            var_name = match.group(1)
-            if var_name in variables:
-                return variables[var_name]
-            else:
-                print(f"Warning: Unknown template variable: {var_name}")
-                return match.group(0)
-        
-        rendered = re.sub(r'\$\{(\w+)\}', replace_env_var, rendered)
-        
-        return rendered
+        """Render template content by replacing variables in a single pass."""
+        return CompiledTemplate.compile(content).render(variables)
     
     def _find_template_files(self) -> List[Path]:
         """Find all template files recursively."""
@@ -143,51 +103,97 @@ class ThemeRenderer:
         
         return output_dir / output_name
     
-    def render_all_templates(self) -> Dict[str, str]:
-        """Render all template files with current theme."""
-        
-        # Load current theme
-        theme_data = self._load_current_theme()
-        variables = self._get_template_variables(theme_data)
-        
-        print(f"Rendering templates with theme: {theme_data['wallpaper_name']}")
-        
-        # Find all template files
-        template_files = self._find_template_files()
-        
-        if not template_files:
-            print(f"No template files found in {self.templates_dir}")
-            return {}
-        
-        rendered_files = {}
-        
-        # Render each template
-        for template_path in template_files:
-            try:
-                print(f"Rendering {template_path.name}...")
-                
-                # Read template content
-                with open(template_path, 'r') as f:
-                    template_content = f.read()
-                
-                # Render template
-                rendered_content = self._render_template_content(template_content, variables)
-                
-                # Get output path
-                output_path = self._get_output_path(template_path)
-                
-                # Write rendered content
-                with open(output_path, 'w') as f:
-                    f.write(rendered_content)
-                
-                rendered_files[str(template_path)] = str(output_path)
-                print(f"✓ Rendered to {output_path}")
-                
-            except Exception as e:
-                print(f"✗ Error rendering {template_path}: {e}")
-        
-        print(f"Rendered {len(rendered_files)} template files")
-        return rendered_files
+    def render_all_templates(self, theme_data: Optional[Dict[str, Any]] = None,
+                             templates: Optional[List[Path]] = None) -> Dict[str, str]:
+        """Render all template files (or just the given ones) with the current theme or the given theme data."""
+        
+        with span("render_templates") as sp:
+            # Load current theme
+            if theme_data is None:
+                theme_data = self._load_current_theme()
+            
+            log_info("RENDER", f"Rendering templates with theme: {theme_data['wallpaper_name']}")
+            
+            # Find all template files
+            template_files = self._find_template_files() if templates is None else sorted(templates)
+            
+            if not template_files:
+                log_warning("RENDER", f"No template files found in {self.templates_dir}")
+                return {}
+            
+            # Compile (or reuse) every template first: only the variables they reference are computed
+            from derived_variables import KnownNames
+            known_variables = KnownNames(self._get_static_variables(theme_data), self.derived)
+            compiled_templates = {}
+            for template_path in template_files:
+                try:
+                    compiled_templates[template_path] = self.compiler.get(template_path, known_variables)
+                except Exception as e:
+                    log_error("RENDER", f"Error compiling {template_path}: {e}")
+            
+            referenced = dict.fromkeys(name for compiled in compiled_templates.values() for name in compiled.variables)
+            variables = self._get_template_variables(theme_data, referenced)
+            sp.set(variables=len(referenced))
+            
+            rendered_files = {}
+            changes = ChangeManifest(self.changes_file, "render")
+            # A partial render (watch mode) keeps the other apps' recorded changes
+            if templates is None:
+                changes.reset()
+            
+            # Render each template
+            for template_path, compiled in compiled_templates.items():
+                try:
+                    log_debug("RENDER", f"Rendering {template_path.name}...")
+                    
+                    rendered_content = compiled.render(variables)
+                    
+                    # Get output path
+                    output_path = self._get_output_path(template_path)
+                    
+                    # Write rendered content only if it changed
+                    app_name = template_path.relative_to(self.templates_dir).parts[0]
+                    if changes.write(app_name, output_path, rendered_content):
+                        sp.add("bytes_written", len(rendered_content.encode("utf-8")))
+                        log_success("RENDER", f"Rendered to {output_path}")
+                    else:
+                        log_debug("RENDER", f"Unchanged: {output_path}")
+                    
+                    rendered_files[str(template_path)] = str(output_path)
+                    
+                except Exception as e:
+                    log_error("RENDER", f"Error rendering {template_path}: {e}")
+            
+            if templates is None:
+                self.compiler.prune(template_files)
+            self.compiler.save()
+            changes.save()
+            sp.set(templates=len(rendered_files), changed=sorted(changes.written_apps))
+            
+            log_info("RENDER", f"Rendered {len(rendered_files)} template files "
+                               f"(changed: {', '.join(sorted(changes.written_apps)) or 'none'})")
+            return rendered_files
+    
+    def collect_rendered(self) -> Dict[str, bytes]:
+        """Current rendered output of every template, as relative path -> content."""
+        rendered = {}
+        for template_path in self._find_template_files():
+            output_path = self._get_output_path(template_path)
+            if output_path.exists():
+                rendered[str(output_path.relative_to(self.rendered_dir))] = output_path.read_bytes()
+        return rendered
+    
+    def publish_rendered(self, rendered: Dict[str, bytes]) -> List[str]:
+        """Write prerendered files (relative path -> content), tracking changes like a render."""
+        with span("publish_rendered") as sp:
+            changes = ChangeManifest(self.changes_file, "render")
+            changes.reset()
+            for relative_path, data in rendered.items():
+                if changes.write(Path(relative_path).parts[0], self.rendered_dir / relative_path, data.decode("utf-8")):
+                    sp.add("bytes_written", len(data))
+            changes.save()
+            sp.set(files=len(rendered), changed=sorted(changes.written_apps))
+        return sorted(changes.written_apps)
     
     def get_rendered_file(self, app_name: str, file_name: str) -> Path:
         """Get path to specific rendered file."""
@@ -198,7 +204,7 @@ class ThemeRenderer:
         if self.rendered_dir.exists():
             shutil.rmtree(self.rendered_dir)
             self.rendered_dir.mkdir(parents=True, exist_ok=True)
-            print("Cleaned up old rendered files")
+            log_info("RENDER", "Cleaned up old rendered files")
 
 def main():
     """CLI entry point for template rendering."""
@@ -223,9 +229,9 @@ def main():
         # Render all templates
         renderer = ThemeRenderer(str(dotfiles_dir))
         renderer.render_all_templates()
-        print("Templates rendered successfully")
+        log_success("RENDER", "Templates rendered successfully")
     except FileNotFoundError as e:
-        print(f"Error: {e}")
+        log_error("RENDER", str(e))
         print("Run apply_theme.sh first to generate theme data")
         sys.exit(1)
 
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# theme_engine/rotation.py
+# Wallpaper rotation (slideshow) with background prefetch of the next themes
+# A low-priority worker keeps the next N wallpapers fully prepared: palette
+# extracted, templates rendered, merged configs planned; a tick only publishes
+# the prepared files atomically and reloads the apps that changed
+
+import collections
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from change_manifest import ChangeManifest
+from theme_logging import log_error, log_info, log_success, log_warning
+from tracing import span
+
+# Wallpapers prepared ahead of the current one
+DEFAULT_PREFETCH = 2
+# Nice increment for the prefetch worker; threads it starts inherit it
+PREFETCH_NICE = 10
+
+def parse_interval(value: str) -> float:
+    """Seconds from '90', '90s', '15m' or '1h'."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+def _lower_thread_priority() -> None:
+    """Renice the calling thread only (Linux schedules threads as tasks)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+    except (AttributeError, OSError):
+        pass
+
+class Playlist:
+    """Endless wallpaper order from the catalog, optionally limited to folders."""
+    
+    def __init__(self, dotfiles_dir: str, folders: Optional[List[str]] = None,
+                 shuffle: bool = False, seed: Optional[int] = None):
+        from wallpaper_catalog import WallpaperCatalog
+        
+        self.catalog = WallpaperCatalog(dotfiles_dir)
+        self.folders = folders or []
+        self.shuffle = shuffle
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._round: Iterator[str] = iter(())
+        self._last: Optional[str] = None
+    
+    def wallpapers(self) -> List[str]:
+        """Current playlist contents, in path order."""
+        self.catalog.refresh()
+        if not self.folders:
+            return [entry["path"] for entry in self.catalog.query()]
+        
+        paths: List[str] = []
+        for folder in self.folders:
+            paths.extend(entry["path"] for entry in self.catalog.query(under=self.catalog.root / folder))
+        return sorted(set(paths))
+    
+    def _new_round(self) -> List[str]:
+        paths = self.wallpapers()
+        if self.shuffle:
+            self._random.shuffle(paths)
+            # Never show the same wallpaper twice in a row across rounds
+            if len(paths) > 1 and paths[0] == self._last:
+                paths.append(paths.pop(0))
+        return paths
+    
+    def start_after(self, wallpaper_path: Optional[str]) -> None:
+        """Continue an ordered playlist after the given wallpaper (e.g. the current one)."""
+        with self._lock:
+            paths = self._new_round()
+            if wallpaper_path and not self.shuffle and wallpaper_path in paths:
+                paths = paths[paths.index(wallpaper_path) + 1:]
+            self._round = iter(paths)
+            self._last = wallpaper_path
+    
+    def next(self) -> str:
+        """Next wallpaper; a new round (re-read, reshuffled) starts when one ends."""
+        with self._lock:
+            for _ in range(2):
+                for path in self._round:
+                    if os.path.exists(path):
+                        self._last = path
+                        return path
+                self._round = iter(self._new_round())
+        raise RuntimeError("playlist is empty")
+
+class PreparedTheme:
+    """Everything needed to switch to a wallpaper without reading or computing anything."""
+    
+    def __init__(self, wallpaper_path: str, theme_data: Dict, rendered: Dict[str, bytes],
+                 outputs: Dict[Path, Tuple[str, bytes]], version: str):
+        self.wallpaper_path = wallpaper_path
+        self.theme_data = theme_data
+        # Rendered templates (relative path -> content), published to theme_data/rendered
+        self.rendered = rendered
+        # Merged configs (output path -> (app, content)), published to ~/.config
+        self.outputs = outputs
+        # Template/static config version the outputs were computed from
+        self.version = version
+
+class ThemeRotator:
+    """Rotates wallpapers on an interval, preparing upcoming themes in the background."""
+    
+    def __init__(self, dotfiles_dir: str, playlist: Playlist, interval: float = 600.0,
+                 prefetch: int = DEFAULT_PREFETCH, engine: str = "auto"):
+        from extract_colors import ColorExtractor
+        from merge_configs import ConfigMerger
+        from reload_apps import AppReloader
+        from render_templates import ThemeRenderer
+        from theme_bundles import ThemeBundles
+        
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.theme_data_dir = self.dotfiles_dir / "theme_engine" / "theme_data"
+        self.staging_dir = self.theme_data_dir / "rotation"
+        self.pid_file = self.staging_dir / "rotation.pid"
+        self.playlist = playlist
+        self.interval = interval
+        self.prefetch = max(1, prefetch)
+        
+        self.extractor = ColorExtractor(dotfiles_dir, engine=engine)
+        # Staging renderer and planner work in theme_data/rotation, never on live files
+        self.staged_renderer = ThemeRenderer(dotfiles_dir, rendered_dir=self.staging_dir / "rendered")
+        self.planner = ConfigMerger(dotfiles_dir, rendered_dir=self.staging_dir / "rendered")
+        self.renderer = ThemeRenderer(dotfiles_dir)
+        self.publisher = ConfigMerger(dotfiles_dir)
+        self.reloader = AppReloader(dotfiles_dir)
+        # Themes seen before are taken from (and new ones added to) the bundle store
+        self.bundles = ThemeBundles(dotfiles_dir)
+        
+        self._queue: Deque[PreparedTheme] = collections.deque()
+        self._cond = threading.Condition()
+        # Serializes use of the staging renderer/planner (prefetch worker vs. tick refresh)
+        self._prepare_lock = threading.Lock()
+        self._stop = threading.Event()
+        # Bumped by cancel_prefetch(); a job started under an older generation is discarded
+        self._generation = 0
+        self._job_generation = 0
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        # Wallpaper last made current by this rotation (or current when it started)
+        self._published: Optional[str] = None
+    
+    def _cancelled(self) -> bool:
+        return self._job_generation != self._generation or self._stop.is_set()
+    
+    def _render_and_plan(self, wallpaper_path: str, theme_data: Dict) -> Optional[PreparedTheme]:
+        """Render templates into staging and plan the merged configs."""
+        with self._prepare_lock:
+            version = self.bundles.version()
+            self.staged_renderer.render_all_templates(theme_data)
+            if self._cancelled():
+                return None
+            
+            outputs = self.planner.plan_all_configs()
+            rendered = self.staged_renderer.collect_rendered()
+        self.bundles.save(self.bundles.key(theme_data, version), version, theme_data, rendered, outputs)
+        return PreparedTheme(wallpaper_path, theme_data, rendered, outputs, version)
+    
+    def prepare(self, wallpaper_path: str) -> Optional[PreparedTheme]:
+        """Fully prepare a wallpaper's theme; None if cancelled on the way."""
+        start = time.perf_counter()
+        palette = self.extractor.get_palette(wallpaper_path)
+        if self._cancelled():
+            return None
+        
+        theme_data = self.extractor.theme_data(wallpaper_path, palette)
+        version = self.bundles.version()
+        bundle = self.bundles.load(self.bundles.key(theme_data, version), version)
+        if bundle is not None:
+            prepared = PreparedTheme(wallpaper_path, theme_data, bundle[0], bundle[1], version)
+        else:
+            prepared = self._render_and_plan(wallpaper_path, theme_data)
+        if prepared:
+            log_info("ROTATE", f"Prepared {Path(wallpaper_path).name} in "
+                               f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        return prepared
+    
+    def _prefetch_loop(self) -> None:
+        """Worker: keep the queue filled with prepared themes."""
+        _lower_thread_priority()
+        while not self._stop.is_set():
+            with self._cond:
+                while len(self._queue) >= self.prefetch and not self._stop.is_set():
+                    self._cond.wait()
+                if self._stop.is_set():
+                    return
+                # Taken together with the generation, so a resync cannot slip in between
+                self._job_generation = self._generation
+                try:
+                    wallpaper_path = self.playlist.next()
+                except RuntimeError as e:
+                    wallpaper_path, error = None, e
+            
+            try:
+                if wallpaper_path is None:
+                    raise error
+                with span("prepare"):
+                    prepared = self.prepare(wallpaper_path)
+            except Exception as e:
+                log_error("ROTATE", f"Prefetch failed: {e}")
+                self._stop.wait(5)
+                continue
+            
+            with self._cond:
+                if prepared and not self._cancelled():
+                    self._queue.append(prepared)
+                    self._cond.notify_all()
+    
+    def cancel_prefetch(self) -> None:
+        """Drop prepared themes and abandon the one in progress (e.g. after a playlist change)."""
+        with self._cond:
+            self._generation += 1
+            self._queue.clear()
+            self._cond.notify_all()
+    
+    def resync(self, wallpaper_path: Optional[str]) -> None:
+        """Continue the playlist after wallpaper_path, dropping themes prepared for the old order."""
+        # Under the worker's lock: it takes its next wallpaper either before (and is
+        # cancelled) or after the new order is in place
+        with self._cond:
+            self.playlist.start_after(wallpaper_path)
+            self.cancel_prefetch()
+    
+    def _current_wallpaper(self) -> Optional[str]:
+        """Resolved path of the wallpaper in current.json, if any."""
+        try:
+            current = self.renderer._load_current_theme().get("wallpaper_path")
+        except (FileNotFoundError, ValueError):
+            return None
+        return str(Path(current).resolve()) if current else None
+    
+    def _next_prepared(self) -> Optional[PreparedTheme]:
+        """Take the next prepared theme, waiting for the worker if it is behind."""
+        with self._cond:
+            if not self._queue:
+                log_warning("ROTATE", "Next theme not prepared yet, waiting for prefetch")
+            while not self._queue and not self._stop.is_set():
+                self._cond.wait(1.0)
+            if not self._queue:
+                return None
+            prepared = self._queue.popleft()
+            self._cond.notify_all()
+            return prepared
+    
+    def _set_wallpaper(self, wallpaper_path: str) -> None:
+        """Hand the wallpaper to swww (its transition runs on the daemon side)."""
+        if shutil.which("swww") is None:
+            log_warning("ROTATE", "swww not found, wallpaper not changed")
+            return
+        result = subprocess.run(["swww", "img", wallpaper_path, "--transition-type", "wipe",
+                                 "--transition-duration", "1", "--transition-fps", "60",
+                                 "--transition-angle", "30"], capture_output=True, text=True, timeout=10)
+        if result.returncode != 0:
+            log_error("ROTATE", f"swww failed: {result.stderr.strip()}")
+    
+    def publish(self, prepared: PreparedTheme) -> List[str]:
+        """Make a prepared theme current: theme data, rendered files, configs, wallpaper, reload."""
+        # Static configs or templates changed since prefetch: re-render with the same palette
+        if prepared.version != self.bundles.version():
+            log_info("ROTATE", "Templates or static configs changed, re-preparing")
+            prepared = self._render_and_plan(prepared.wallpaper_path, prepared.theme_data) or prepared
+        
+        start = time.perf_counter()
+        theme_data = dict(prepared.theme_data, applied_at=time.time())
+        self.extractor.save_theme_data(theme_data)
+        
+        # Keep theme_data/rendered consistent with current.json for restore and manual merges
+        self.renderer.publish_rendered(prepared.rendered)
+        
+        changed_apps = self.publisher.publish_planned(prepared.outputs)
+        with span("wallpaper"):
+            self._set_wallpaper(prepared.wallpaper_path)
+        publish_ms = (time.perf_counter() - start) * 1000
+        
+        apps = ChangeManifest(self.publisher.changes_file, "merge").take()
+        for app_name, status, elapsed_ms, message in self.reloader.reload(apps):
+            if status == "failed":
+                log_error("ROTATE", f"Reloading {app_name} failed: {message}")
+        
+        log_success("ROTATE", f"Switched to {theme_data['wallpaper_name']}: published in {publish_ms:.1f} ms, "
+                              f"total {(time.perf_counter() - start) * 1000:.1f} ms "
+                              f"(changed: {', '.join(changed_apps) or 'none'})")
+        return changed_apps
+    
+    def advance(self) -> bool:
+        """Switch to the next prepared theme; False if stopped while waiting."""
+        # A manual apply since the last switch makes the prepared themes stale
+        current = self._current_wallpaper()
+        if current != self._published:
+            log_info("ROTATE", f"Theme changed outside the rotation, continuing after "
+                               f"{Path(current).name if current else 'start'}")
+            self._published = current
+            self.resync(current)
+        
+        prepared = self._next_prepared()
+        if prepared is None:
+            return False
+        with span("rotate", wallpaper=Path(prepared.wallpaper_path).name):
+            self.publish(prepared)
+        self._published = str(Path(prepared.wallpaper_path).resolve())
+        return True
+    
+    def start_prefetch(self) -> None:
+        """Start the background prefetch worker."""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._prefetch_loop, name="rotation-prefetch", daemon=True)
+            self._worker.start()
+    
+    def stop(self) -> None:
+        """Stop rotating; prepared themes are dropped and the worker exits after its current stage."""
+        self._stop.set()
+        self._wake.set()
+        self.cancel_prefetch()
+    
+    def skip(self) -> None:
+        """Switch to the next wallpaper now instead of at the end of the interval."""
+        self._wake.set()
+    
+    def run(self, once: bool = False) -> None:
+        """Rotate until stopped (SIGTERM/SIGINT); SIGUSR1 skips to the next wallpaper."""
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.pid_file.write_text(str(os.getpid()))
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.skip())
+        
+        self._published = self._current_wallpaper()
+        try:
+            self.start_prefetch()
+            log_info("ROTATE", f"Rotating every {self.interval:.0f}s, {self.prefetch} themes prefetched")
+            while not self._stop.is_set():
+                if not self.advance() or once:
+                    break
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            self.stop()
+            self.pid_file.unlink(missing_ok=True)
+
+def _running_pid(pid_file: Path) -> Optional[int]:
+    """PID of the running rotation process, if any."""
+    try:
+        pid = int(pid_file.read_text())
+        os.kill(pid, 0)
+        return pid
+    except (FileNotFoundError, ValueError, ProcessLookupError, PermissionError):
+        return None
+
+def main():
+    """CLI entry point: run the rotation, or signal a running one."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Rotate wallpapers and themes on a timer")
+    parser.add_argument("command", nargs="?", choices=["run", "next", "stop"], default="run")
+    parser.add_argument("--interval", default="10m", help="time per wallpaper, e.g. 90s, 15m, 1h (default: 10m)")
+    parser.add_argument("--shuffle", action="store_true", help="random order, reshuffled every round")
+    parser.add_argument("--folder", action="append", help="limit to a wallpapers/ subfolder (repeatable)")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH,
+                        help=f"themes prepared ahead (default: {DEFAULT_PREFETCH})")
+    parser.add_argument("--engine", choices=["native", "llava", "auto"], default=os.getenv("CLYPR_ENGINE", "auto"))
+    parser.add_argument("--once", action="store_true", help="switch to the next wallpaper once and exit")
+    args = parser.parse_args()
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    pid_file = dotfiles_dir / "theme_engine" / "theme_data" / "rotation" / "rotation.pid"
+    pid = _running_pid(pid_file)
+    
+    if args.command in ("next", "stop"):
+        if pid is None:
+            print("Rotation is not running")
+            sys.exit(1)
+        os.kill(pid, signal.SIGUSR1 if args.command == "next" else signal.SIGTERM)
+        return
+    
+    if pid is not None:
+        print(f"Rotation already running (pid {pid})")
+        sys.exit(1)
+    
+    playlist = Playlist(str(dotfiles_dir), folders=args.folder, shuffle=args.shuffle)
+    rotator = ThemeRotator(str(dotfiles_dir), playlist, interval=parse_interval(args.interval),
+                           prefetch=args.prefetch, engine=args.engine)
+    
+    # Ordered playlists continue after the wallpaper that is currently applied
+    playlist.start_after(rotator._current_wallpaper())
+    
+    try:
+        if not playlist.wallpapers():
+            print("No wallpapers to rotate")
+            sys.exit(1)
+        rotator.run(once=args.once)
+    except RuntimeError as e:
+        log_error("ROTATE", str(e))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# theme_engine/template_compiler.py
+# Compiles config templates into literal/variable segments
+# Compiled templates are cached on disk by path and mtime so unchanged
+# templates are never re-scanned; rendering is a single join
+
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from change_manifest import write_json_atomic
+from theme_logging import log_debug, log_warning
+
+# {{variable}} and the alternative ${variable} syntax, matched in one pass
+TEMPLATE_VAR = re.compile(r'\{\{(\w+)\}\}|\$\{(\w+)\}')
+
+# Bump when the on-disk segment format changes
+CACHE_VERSION = 1
+
+class CompiledTemplate:
+    """A template split into literal chunks around variable slots."""
+    
+    def __init__(self, literals: List[str], slots: List[Tuple[str, str]], unknown: Optional[List[str]] = None):
+        # literals always has one more entry than slots: lit0 slot0 lit1 slot1 ... litN
+        self.literals = literals
+        # (variable name, original placeholder text) for each slot
+        self.slots = slots
+        self.unknown = unknown or []
+    
+    @classmethod
+    def compile(cls, content: str) -> "CompiledTemplate":
+        """Split template text at every {{var}} / ${var} placeholder."""
+        literals, slots = [], []
+        position = 0
+        for match in TEMPLATE_VAR.finditer(content):
+            literals.append(content[position:match.start()])
+            slots.append((match.group(1) or match.group(2), match.group(0)))
+            position = match.end()
+        literals.append(content[position:])
+        return cls(literals, slots)
+    
+    @property
+    def variables(self) -> List[str]:
+        """Distinct variable names referenced by the template, in order of appearance."""
+        return list(dict.fromkeys(name for name, _ in self.slots))
+    
+    def render(self, variables: Dict[str, str]) -> str:
+        """Fill the slots; unknown variables keep their placeholder text."""
+        parts = [self.literals[0]]
+        for (name, placeholder), literal in zip(self.slots, self.literals[1:]):
+            parts.append(variables.get(name, placeholder))
+            parts.append(literal)
+        return "".join(parts)
+    
+    def to_json(self) -> Dict:
+        return {"literals": self.literals, "slots": self.slots, "unknown": self.unknown}
+    
+    @classmethod
+    def from_json(cls, data: Dict) -> "CompiledTemplate":
+        return cls(data["literals"], [tuple(slot) for slot in data["slots"]], data.get("unknown"))
+
+class TemplateCompiler:
+    """Loads compiled templates, recompiling only those whose mtime changed."""
+    
+    def __init__(self, cache_file: Path):
+        self.cache_file = Path(cache_file)
+        self._entries: Dict[str, Dict] = {}
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self._dirty = False
+        self._load()
+    
+    def _load(self) -> None:
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+            if cache.get("version") == CACHE_VERSION:
+                self._entries = cache.get("templates", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+    
+    def save(self) -> None:
+        """Write the compiled cache atomically if anything was recompiled."""
+        if not self._dirty:
+            return
+        write_json_atomic(self.cache_file, {"version": CACHE_VERSION, "templates": self._entries})
+        self._dirty = False
+    
+    def get(self, template_path: Path, known_variables: Container[str]) -> CompiledTemplate:
+        """Return the compiled template, compiling it if it is new or modified."""
+        key = str(template_path)
+        mtime_ns = Path(template_path).stat().st_mtime_ns
+        
+        entry = self._entries.get(key)
+        if entry and entry["mtime_ns"] == mtime_ns:
+            compiled = self._compiled.get(key)
+            if compiled is None:
+                compiled = CompiledTemplate.from_json(entry["template"])
+                self._compiled[key] = compiled
+            return compiled
+        
+        with open(template_path, 'r') as f:
+            compiled = CompiledTemplate.compile(f.read())
+        
+        # Unknown variables are reported here, once per template change, not on every render
+        compiled.unknown = [name for name in compiled.variables if name not in known_variables]
+        for name in compiled.unknown:
+            log_warning("RENDER", f"Unknown template variable in {Path(template_path).name}: {name}")
+        log_debug("RENDER", f"Compiled {template_path} ({len(compiled.slots)} slots)")
+        
+        self._entries[key] = {"mtime_ns": mtime_ns, "template": compiled.to_json()}
+        self._compiled[key] = compiled
+        self._dirty = True
+        return compiled
+    
+    def prune(self, template_paths: Iterable[Path]) -> None:
+        """Drop cache entries for templates that no longer exist."""
+        keep = {str(path) for path in template_paths}
+        for key in list(self._entries):
+            if key not in keep:
+                del self._entries[key]
+                self._compiled.pop(key, None)
+                self._dirty = True
+
+def main():
+    """CLI entry point: show the slots of a template."""
+    if len(sys.argv) != 2:
+        print("Usage: template_compiler.py <template.tmpl>")
+        sys.exit(1)
+    
+    with open(sys.argv[1], 'r') as f:
+        compiled = CompiledTemplate.compile(f.read())
+    
+    print(f"{len(compiled.slots)} slots, {len(compiled.variables)} distinct variables")
+    for name in compiled.variables:
+        print(f"  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# theme_engine/theme_bundles.py
+# Prebuilt theme bundles: the rendered templates and merged configs of a palette
+# Bundles are keyed by palette hash plus a version hash of the templates, static
+# configs and engine code, so switching to a known theme is a pure file swap
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from change_manifest import tree_version, write_json_atomic
+from theme_logging import log_info, log_success
+from tracing import span
+
+# Total bundle size kept by gc() (CLYPR_BUNDLE_MAX_MB overrides)
+DEFAULT_MAX_MB = 20
+
+class ThemeBundles:
+    """Stores fully rendered and merged output sets per palette, with LRU size eviction."""
+    
+    def __init__(self, dotfiles_dir: str, max_bytes: Optional[int] = None):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.bundles_dir = self.dotfiles_dir / "theme_engine" / "theme_data" / "bundles"
+        self.templates_dir = self.dotfiles_dir / "config_templates"
+        self.max_bytes = max_bytes or int(float(os.getenv("CLYPR_BUNDLE_MAX_MB", str(DEFAULT_MAX_MB))) * 1024 * 1024)
+        
+        # Everything the rendered and merged outputs are derived from, besides the theme itself
+        engine_dir = self.dotfiles_dir / "theme_engine"
+        self._sources = [
+            self.templates_dir,
+            self.dotfiles_dir / "config_static",
+            engine_dir / "render_templates.py",
+            engine_dir / "merge_configs.py",
+            engine_dir / "template_compiler.py",
+            engine_dir / "derived_variables.py",
+            engine_dir / "color_math.py",
+        ]
+        # version -> whether any template references the wallpaper path/name
+        self._uses_wallpaper: Dict[str, bool] = {}
+    
+    def version(self) -> str:
+        """Version hash of templates, static configs and engine code (stat only)."""
+        # Outputs are absolute paths below the home directory
+        material = f"{tree_version(*self._sources)}:{Path.home()}".encode("utf-8")
+        return hashlib.blake2b(material, digest_size=16).hexdigest()
+    
+    def _references_wallpaper(self, version: str) -> bool:
+        if version not in self._uses_wallpaper:
+            self._uses_wallpaper[version] = any(
+                "wallpaper_" in template.read_text(errors="replace")
+                for template in self.templates_dir.rglob("*.tmpl")
+            )
+        return self._uses_wallpaper[version]
+    
+    def key(self, theme_data: Dict, version: str) -> str:
+        """Bundle key for a theme: palette hash, plus the wallpaper if templates use it."""
+        material = {"palette": theme_data["palette"]}
+        if self._references_wallpaper(version):
+            material["wallpaper_path"] = theme_data["wallpaper_path"]
+        encoded = json.dumps(material, sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+    
+    def _bundle_file(self, version: str, key: str) -> Path:
+        return self.bundles_dir / version / f"{key}.json"
+    
+    def load(self, key: str, version: str) -> Optional[Tuple[Dict[str, bytes], Dict[Path, Tuple[str, bytes]]]]:
+        """(rendered, outputs) of a bundle, or None; marks it as recently used."""
+        bundle_file = self._bundle_file(version, key)
+        try:
+            with open(bundle_file, 'r') as f:
+                bundle = json.load(f)
+            os.utime(bundle_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        
+        rendered = {path: content.encode("utf-8") for path, content in bundle["rendered"].items()}
+        outputs = {Path(path): (app_name, content.encode("utf-8"))
+                   for path, (app_name, content) in bundle["outputs"].items()}
+        return rendered, outputs
+    
+    def save(self, key: str, version: str, theme_data: Dict, rendered: Dict[str, bytes],
+             outputs: Dict[Path, Tuple[str, bytes]]) -> None:
+        """Store a bundle atomically, then evict stale and least recently used bundles."""
+        bundle = {
+            "created_at": time.time(),
+            "wallpaper_name": theme_data.get("wallpaper_name", ""),
+            "rendered": {path: data.decode("utf-8") for path, data in rendered.items()},
+            "outputs": {str(path): [app_name, data.decode("utf-8")] for path, (app_name, data) in outputs.items()},
+        }
+        # The daemon and the rotation prefetch may store the same bundle at once
+        write_json_atomic(self._bundle_file(version, key), bundle)
+        self.gc(version)
+    
+    def gc(self, version: Optional[str] = None) -> Tuple[int, int]:
+        """Drop bundles of other versions, then the least recently used beyond max_bytes.
+        
+        Returns (bundles removed, bytes kept).
+        """
+        version = version or self.version()
+        removed = 0
+        if not self.bundles_dir.is_dir():
+            return 0, 0
+        
+        for version_dir in self.bundles_dir.iterdir():
+            if version_dir.is_dir() and version_dir.name != version:
+                removed += sum(1 for _ in version_dir.glob("*.json"))
+                shutil.rmtree(version_dir)
+        
+        bundles = []
+        for bundle_file in (self.bundles_dir / version).glob("*.json"):
+            st = bundle_file.stat()
+            bundles.append((st.st_mtime, st.st_size, bundle_file))
+        bundles.sort(reverse=True)
+        
+        kept_bytes = 0
+        for _, size, bundle_file in bundles:
+            if kept_bytes + size > self.max_bytes:
+                bundle_file.unlink(missing_ok=True)
+                removed += 1
+            else:
+                kept_bytes += size
+        return removed, kept_bytes
+    
+    def apply(self, theme_data: Dict, renderer, merger) -> bool:
+        """Publish the theme's rendered and merged files; True if served from a bundle.
+        
+        Without a bundle the theme is rendered and merged as usual and then stored.
+        """
+        with span("bundle") as sp:
+            start = time.perf_counter()
+            version = self.version()
+            key = self.key(theme_data, version)
+            
+            bundle = self.load(key, version)
+            if bundle is not None:
+                sp.set(cache="hit", key=key[:12])
+                rendered, outputs = bundle
+                renderer.publish_rendered(rendered)
+                merger.publish_planned(outputs)
+                log_success("BUNDLE", f"Applied bundle {key[:12]} in {(time.perf_counter() - start) * 1000:.1f} ms")
+                return True
+            
+            sp.set(cache="miss", key=key[:12])
+            renderer.render_all_templates(theme_data)
+            outputs = merger.plan_all_configs()
+            merger.publish_planned(outputs)
+            self.save(key, version, theme_data, renderer.collect_rendered(), outputs)
+            log_info("BUNDLE", f"Built and stored bundle {key[:12]} in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return False
+    
+    def entries(self) -> List[Tuple[str, str, int, float]]:
+        """(version, key, size, last used) for every stored bundle, most recent first."""
+        if not self.bundles_dir.is_dir():
+            return []
+        entries = []
+        for bundle_file in self.bundles_dir.glob("*/*.json"):
+            st = bundle_file.stat()
+            entries.append((bundle_file.parent.name, bundle_file.stem, st.st_size, st.st_mtime))
+        return sorted(entries, key=lambda entry: -entry[3])
+
+def main():
+    """CLI entry point: apply the current theme through the bundle store, or manage it."""
+    usage = "Usage: theme_bundles.py <apply|list|gc|clear>"
+    if len(sys.argv) != 2 or sys.argv[1] not in ("apply", "list", "gc", "clear"):
+        print(usage)
+        sys.exit(1)
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    bundles = ThemeBundles(str(dotfiles_dir))
+    
+    if sys.argv[1] == "apply":
+        from merge_configs import ConfigMerger
+        from render_templates import ThemeRenderer
+        
+        renderer = ThemeRenderer(str(dotfiles_dir))
+        try:
+            theme_data = renderer._load_current_theme()
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        hit = bundles.apply(theme_data, renderer, ConfigMerger(str(dotfiles_dir)))
+        print("bundle" if hit else "built")
+    elif sys.argv[1] == "list":
+        current = bundles.version()
+        for version, key, size, last_used in bundles.entries():
+            used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used))
+            print(f"{key}  {size / 1024:7.1f} KB  {used}{'' if version == current else '  (stale)'}")
+    elif sys.argv[1] == "gc":
+        removed, kept_bytes = bundles.gc()
+        print(f"Removed {removed} bundles, {kept_bytes / 1024:.1f} KB kept")
+    else:
+        shutil.rmtree(bundles.bundles_dir, ignore_errors=True)
+        print("Removed all bundles")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# theme_engine/theme_daemon.py
+# Long-lived theme daemon - keeps ColorExtractor, ThemeRenderer and ConfigMerger
+# resident behind a Unix socket so shell scripts can act as thin clients
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import tracing
+
+# Exit code used by the client when no daemon is listening, so callers can
+# fall back to running the pipeline scripts directly
+EXIT_NO_DAEMON = 2
+
+class DaemonTimeout(Exception):
+    """Raised when a running daemon accepted a command but did not answer in time."""
+
+def get_socket_path() -> Path:
+    """Resolve the daemon socket path (CLYPR_SOCKET overrides the default)."""
+    override = os.getenv("CLYPR_SOCKET")
+    if override:
+        return Path(override)
+    
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR") or f"/tmp/clypr-{os.getuid()}"
+    return Path(runtime_dir) / "clypr" / "theme.sock"
+
+class ThemeDaemon:
+    """Hosts the theme engine in one process and serves pipeline commands."""
+    
+    def __init__(self, dotfiles_dir: str, socket_path: Optional[Path] = None):
+        # Heavy imports only happen in the serving process, never in the client
+        from extract_colors import ColorExtractor
+        from render_templates import ThemeRenderer
+        from merge_configs import ConfigMerger
+        from theme_bundles import ThemeBundles
+        
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.socket_path = socket_path or get_socket_path()
+        self.extractor = ColorExtractor(dotfiles_dir, engine=os.getenv("CLYPR_ENGINE", "auto"))
+        self.renderer = ThemeRenderer(dotfiles_dir)
+        self.merger = ConfigMerger(dotfiles_dir)
+        self.bundles = ThemeBundles(dotfiles_dir)
+        self.started_at = time.time()
+        
+        # Extractors for engines clients ask for besides the daemon's default (CLYPR_ENGINE)
+        self._extractors = {self.extractor.engine: self.extractor}
+        
+        # The engine classes are not thread-safe; pipeline commands run one at a time
+        self._pipeline_lock = threading.Lock()
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._prewarm_thread: Optional[threading.Thread] = None
+    
+    def _load_current_theme(self) -> Dict[str, Any]:
+        """Load current theme data through the renderer's reader."""
+        return self.renderer._load_current_theme()
+    
+    def _extractor_for(self, engine: Optional[str]):
+        """Extractor for the client's engine, built on first use (None: the daemon's default)."""
+        from extract_colors import ColorExtractor
+        
+        if engine is None:
+            return self.extractor
+        if engine not in self._extractors:
+            self._extractors[engine] = ColorExtractor(str(self.dotfiles_dir), engine=engine)
+        return self._extractors[engine]
+    
+    def _start_prewarm(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a library prewarm in the background; pipeline commands keep working."""
+        from extract_colors import ColorExtractor
+        from prewarm import PalettePrewarmer
+        
+        if self._prewarm_thread and self._prewarm_thread.is_alive():
+            return {"started": False, "reason": "prewarm already running"}
+        
+        # The prewarm thread runs outside the pipeline lock, so it gets its own extractor
+        # (fingerprint index, palette store connection and Ollama client)
+        extractor = ColorExtractor(str(self.dotfiles_dir), engine=self.extractor.engine)
+        prewarmer = PalettePrewarmer(extractor,
+                                     workers=args.get("workers"),
+                                     ollama_concurrency=args.get("ollama_concurrency", 1),
+                                     idle_only=args.get("idle_only", False))
+        root = args.get("directory") or str(self.dotfiles_dir / "wallpapers")
+        self._prewarm_thread = threading.Thread(target=prewarmer.run, args=(root,), daemon=True)
+        self._prewarm_thread.start()
+        return {"started": True, "directory": root}
+    
+    def handle_command(self, command: str, args: Dict[str, Any]) -> Any:
+        """Dispatch a single client command and return its JSON-serializable result."""
+        if command == "ping":
+            return {"pid": os.getpid(), "uptime": round(time.time() - self.started_at, 1)}
+        
+        if command == "palette":
+            return self._load_current_theme()
+        
+        if command == "prewarm":
+            return self._start_prewarm(args)
+        
+        if command == "shutdown":
+            # The handler stops the server once this response has been sent
+            return {"stopping": True}
+        
+        with self._pipeline_lock, tracing.span(f"daemon.{command}"):
+            if command == "extract":
+                return {"palette": self._extractor_for(args.get("engine")).extract_colors(args["wallpaper"])}
+            
+            if command == "render":
+                return {"rendered": self.renderer.render_all_templates()}
+            
+            if command == "merge":
+                self.merger.merge_all_configs()
+                return {"merged": True}
+            
+            if command == "apply":
+                palette = self._extractor_for(args.get("engine")).extract_colors(args["wallpaper"])
+                # Known palettes are a pure swap of prebuilt files
+                bundle_hit = self.bundles.apply(self._load_current_theme(), self.renderer, self.merger)
+                return {"palette": palette, "wallpaper_path": args["wallpaper"], "bundle": bundle_hit}
+            
+            if command == "restore":
+                theme_data = self._load_current_theme()
+                bundle_hit = self.bundles.apply(theme_data, self.renderer, self.merger)
+                return {"palette": theme_data["palette"], "wallpaper_path": theme_data["wallpaper_path"],
+                        "bundle": bundle_hit}
+        
+        raise ValueError(f"Unknown command: {command}")
+    
+    def _make_handler(self):
+        daemon = self
+        
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                
+                start = time.perf_counter()
+                try:
+                    request = json.loads(line)
+                    command = request.get("command", "")
+                    # Pipeline spans join the client's trace (e.g. the apply_theme.sh run)
+                    with tracing.use_context(request.get("trace")):
+                        result = daemon.handle_command(command, request.get("args", {}))
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                
+                response["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+                
+                if response["ok"] and request.get("command") == "shutdown":
+                    daemon._server.shutdown()
+        
+        return RequestHandler
+    
+    def serve_forever(self) -> None:
+        """Bind the Unix socket and serve until a shutdown command arrives."""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        
+        if self.socket_path.exists():
+            try:
+                running = send_command("ping", socket_path=self.socket_path) is not None
+            except DaemonTimeout:
+                # Listening but busy: still a live daemon
+                running = True
+            if running:
+                raise RuntimeError(f"Theme daemon already running on {self.socket_path}")
+            # Stale socket left behind by a crashed daemon
+            self.socket_path.unlink()
+        
+        self._server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), self._make_handler())
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        
+        print(f"Theme daemon listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+            print("Theme daemon stopped")
+
+def send_command(command: str, args: Optional[Dict[str, Any]] = None,
+                 socket_path: Optional[Path] = None, timeout: float = 120) -> Optional[Dict[str, Any]]:
+    """Send a command to the daemon; returns the response or None if unreachable.
+    
+    Raises DaemonTimeout if the daemon does not answer within timeout seconds; it may
+    still be working on the command, so callers must not redo it themselves.
+    """
+    socket_path = socket_path or get_socket_path()
+    request = {"command": command, "args": args or {}}
+    trace = tracing.request_context()
+    if trace:
+        request["trace"] = trace
+    
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+            return None
+        
+        try:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            raise DaemonTimeout(f"Theme daemon did not answer '{command}' within {timeout:g}s") from None
+    
+    return json.loads(data) if data else None
+
+def main():
+    """CLI entry point: run the daemon or act as a thin client."""
+    usage = "Usage: theme_daemon.py <serve|status|apply <wallpaper>|restore|palette|prewarm [dir] [--idle-only]|stop>"
+    
+    if len(sys.argv) < 2 or sys.argv[1] in ['--help', '-h', 'help']:
+        print(usage)
+        sys.exit(1)
+    
+    action = sys.argv[1]
+    
+    if action == "serve":
+        # Determine dotfiles directory (parent of theme_engine)
+        dotfiles_dir = Path(__file__).parent.parent
+        try:
+            ThemeDaemon(str(dotfiles_dir)).serve_forever()
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
+    commands = {"status": "ping", "apply": "apply", "restore": "restore", "palette": "palette",
+                "prewarm": "prewarm", "stop": "shutdown"}
+    if action not in commands:
+        print(usage)
+        sys.exit(1)
+    
+    args = {}
+    if action == "apply":
+        if len(sys.argv) != 3:
+            print(usage)
+            sys.exit(1)
+        args["wallpaper"] = os.path.abspath(sys.argv[2])
+    elif action == "prewarm":
+        args["idle_only"] = "--idle-only" in sys.argv[2:]
+        directories = [a for a in sys.argv[2:] if not a.startswith("--")]
+        if directories:
+            args["directory"] = os.path.abspath(directories[0])
+    
+    try:
+        response = send_command(commands[action], args)
+    except DaemonTimeout as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if response is None:
+        print(f"Theme daemon not running ({get_socket_path()})", file=sys.stderr)
+        sys.exit(EXIT_NO_DAEMON)
+    
+    if not response.get("ok"):
+        print(f"Error: {response.get('error')}", file=sys.stderr)
+        sys.exit(1)
+    
+    result = response["result"]
+    if action in ("apply", "restore", "palette"):
+        # Shell-friendly output: wallpaper path first, then the palette
+        print(result.get("wallpaper_path", ""))
+        for key, color in result.get("palette", {}).items():
+            print(f"  {key}: {color}")
+    else:
+        print(json.dumps(result, indent=2))
+    
+    print(f"Completed in {response['elapsed_ms']} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# theme_engine/theme_logging.py
+# Native Python logging backend for the theme engine
+# Writes the same format and rotation as logger.sh, through a queue so callers never block on disk
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from pathlib import Path
+from typing import Optional
+
+# Shared with logger.sh
+LOG_FILE = Path.home() / ".local" / "share" / "clypr" / "theme.log"
+MAX_LOG_SIZE = 10485760  # 10MB
+MAX_LOG_FILES = 5
+
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+_logger: Optional[logging.Logger] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class _ComponentFormatter(logging.Formatter):
+    """Formats records as: timestamp [LEVEL] [COMPONENT] [script:line] message."""
+    
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] [%(component)s] [%(filename)s:%(lineno)d] %(message)s",
+                         datefmt="%Y-%m-%d %H:%M:%S")
+    
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "component"):
+            record.component = "SYSTEM"
+        return super().format(record)
+
+def get_logger() -> logging.Logger:
+    """Return the theme engine logger, starting the background writer on first use."""
+    global _logger, _listener
+    if _logger is not None:
+        return _logger
+    
+    logger = logging.getLogger("clypr")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    
+    try:
+        LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=MAX_LOG_SIZE, backupCount=MAX_LOG_FILES, encoding="utf-8"
+        )
+    except OSError as e:
+        print(f"[WARNING] [LOGGER] ⚠ File logging disabled: {e}", file=sys.stderr)
+        logger.addHandler(logging.NullHandler())
+        _logger = logger
+        return logger
+    
+    file_handler.setFormatter(_ComponentFormatter())
+    
+    # The hot path only enqueues; a listener thread formats, rotates and writes
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    atexit.register(shutdown)
+    
+    _logger = logger
+    return logger
+
+def shutdown() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _log(level: int, component: str, message: str) -> None:
+    # stacklevel 3 attributes the record to the caller of log_info() and friends
+    get_logger().log(level, message, extra={"component": component}, stacklevel=3)
+
+def log_info(component: str, message: str):
+    _log(logging.INFO, component, message)
+    print(f"[INFO] [{component}] {message}")
+
+def log_error(component: str, message: str):
+    _log(logging.ERROR, component, message)
+    print(f"[ERROR] [{component}] {message}", file=sys.stderr)
+
+def log_success(component: str, message: str):
+    _log(SUCCESS, component, message)
+    print(f"[SUCCESS] [{component}] ✓ {message}")
+
+def log_warning(component: str, message: str):
+    _log(logging.WARNING, component, message)
+    print(f"[WARNING] [{component}] ⚠ {message}")
+
+def log_debug(component: str, message: str):
+    _log(logging.DEBUG, component, message)
+    if os.getenv("DEBUG"):
+        print(f"[DEBUG] [{component}] {message}")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# theme_engine/thumbnails.py
+# Parallel thumbnail engine for the wallpaper picker
+# Thumbnails are keyed by source path hash + mtime, so same-named wallpapers in
+# different folders never collide and edited wallpapers get a fresh thumbnail
+# The wallpaper list comes from the catalog, so no directory walk per launch
+# Requires: python-pillow (falls back to ImageMagick convert)
+
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from prewarm import _lower_priority
+from wallpaper_catalog import WallpaperCatalog, thumbnail_name
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Below this many missing thumbnails a process pool costs more than it saves
+POOL_THRESHOLD = 4
+
+def _make_thumbnail(source: str, target: str, size: int) -> Optional[str]:
+    """Process pool job: write a size x size center-cropped JPEG; returns an error or None."""
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+    try:
+        if PIL_AVAILABLE:
+            with Image.open(source) as img:
+                # JPEG decodes at 1/2..1/8 scale directly, still at least size x size
+                img.draft("RGB", (size, size))
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                
+                # Center crop to a square and scale in one resize (like convert -resize ^ -extent)
+                width, height = img.size
+                edge = min(width, height)
+                box = ((width - edge) / 2, (height - edge) / 2, (width + edge) / 2, (height + edge) / 2)
+                thumb = img.resize((size, size), Image.Resampling.BICUBIC, box=box, reducing_gap=2.0)
+                thumb.save(tmp_target, "JPEG", quality=85)
+        else:
+            subprocess.run(["convert", source, "-resize", f"{size}x{size}^", "-gravity", "center",
+                            "-extent", f"{size}x{size}", f"jpg:{tmp_target}"],
+                           check=True, capture_output=True, timeout=60)
+        os.replace(tmp_target, target)
+        return None
+    except Exception as e:
+        try:
+            os.unlink(tmp_target)
+        except FileNotFoundError:
+            pass
+        return str(e)
+
+class ThumbnailEngine:
+    """Generates, caches and prunes wallpaper thumbnails."""
+    
+    def __init__(self, dotfiles_dir: str, size: int = 200, workers: Optional[int] = None):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        # Resolved so thumbnail keys do not depend on how the script was invoked
+        self.wallpapers_dir = (self.dotfiles_dir / "wallpapers").resolve()
+        self.thumbnails_dir = self.wallpapers_dir / "thumbnails"
+        self.size = size
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    
+    def thumbnail_path(self, wallpaper: Path, mtime_ns: Optional[int] = None) -> Path:
+        """Where the thumbnail for the current version of wallpaper lives."""
+        if mtime_ns is None:
+            mtime_ns = wallpaper.stat().st_mtime_ns
+        return self.thumbnails_dir / thumbnail_name(wallpaper, mtime_ns)
+    
+    def ensure(self, wallpapers: List[Path], known: Optional[Dict[Path, Path]] = None) -> Dict[Path, Path]:
+        """Return wallpaper -> thumbnail for every wallpaper, generating missing ones.
+        
+        known maps wallpapers to thumbnail paths already computed (by the catalog),
+        which saves a stat per wallpaper.
+        """
+        self.thumbnails_dir.mkdir(parents=True, exist_ok=True)
+        existing = {entry.name for entry in os.scandir(self.thumbnails_dir)}
+        
+        thumbnails: Dict[Path, Path] = {}
+        missing: List[Tuple[Path, Path]] = []
+        for wallpaper in wallpapers:
+            try:
+                thumbnail = known[wallpaper] if known and wallpaper in known else self.thumbnail_path(wallpaper)
+            except FileNotFoundError:
+                continue
+            if thumbnail.name in existing:
+                thumbnails[wallpaper] = thumbnail
+            else:
+                missing.append((wallpaper, thumbnail))
+        
+        if missing:
+            print(f"Generating {len(missing)} thumbnails...", file=sys.stderr)
+            jobs = [(str(w), str(t), self.size) for w, t in missing]
+            if len(missing) < POOL_THRESHOLD:
+                errors = [_make_thumbnail(*job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(max_workers=min(self.workers, len(missing)),
+                                         initializer=_lower_priority) as pool:
+                    errors = list(pool.map(_make_thumbnail, *zip(*jobs), chunksize=4))
+            
+            for (wallpaper, thumbnail), error in zip(missing, errors):
+                if error:
+                    print(f"Thumbnail failed for {wallpaper}: {error}", file=sys.stderr)
+                else:
+                    thumbnails[wallpaper] = thumbnail
+        
+        return thumbnails
+    
+    def prune(self, thumbnails: Dict[Path, Path]) -> int:
+        """Remove thumbnails of deleted or changed wallpapers; returns the number removed."""
+        keep = {thumbnail.name for thumbnail in thumbnails.values()}
+        removed = 0
+        if self.thumbnails_dir.is_dir():
+            for entry in os.scandir(self.thumbnails_dir):
+                if entry.is_file() and entry.name not in keep:
+                    os.unlink(entry.path)
+                    removed += 1
+        return removed
+    
+    def build(self, catalog: Optional[WallpaperCatalog] = None, prune: bool = True,
+              **filters) -> Dict[Path, Path]:
+        """Ensure thumbnails for catalog entries matching filters (default: the whole library)."""
+        catalog = catalog or WallpaperCatalog(str(self.dotfiles_dir))
+        catalog.refresh()
+        known = {Path(entry["path"]): Path(entry["thumbnail"]) for entry in catalog.query(**filters)}
+        wallpapers = list(known)
+        thumbnails = self.ensure(wallpapers, known)
+        # Only prune after listing the full library, never a filtered subset
+        if prune and not filters:
+            self.prune(thumbnails)
+        return {wallpaper: thumbnails[wallpaper] for wallpaper in wallpapers if wallpaper in thumbnails}
+
+def sort_by_similarity(dotfiles_dir: Path, thumbnails: Dict[Path, Path]) -> Dict[Path, Path]:
+    """Reorder wallpapers by palette distance to the applied theme (uncached ones last)."""
+    from palette_search import SEARCH_AVAILABLE, PaletteIndex, load_current_palette
+    
+    _, palette = load_current_palette(dotfiles_dir)
+    if not SEARCH_AVAILABLE or not palette:
+        return thumbnails
+    
+    index = PaletteIndex(str(dotfiles_dir))
+    index.load()
+    distances = index.distance_map(index.palette_distances(palette))
+    catalog = WallpaperCatalog(str(dotfiles_dir))
+    hashes = {Path(entry["path"]): entry["hash"] for entry in catalog.query()}
+    order = sorted(thumbnails, key=lambda wallpaper: distances.get(hashes.get(wallpaper), float("inf")))
+    return {wallpaper: thumbnails[wallpaper] for wallpaper in order}
+
+def main():
+    """CLI entry point: build thumbnails for the library, optionally printing rofi entries."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate wallpaper picker thumbnails")
+    parser.add_argument("--rofi", action="store_true",
+                        help="print 'thumbnail|folder/name|path' lines for the picker")
+    parser.add_argument("--no-prune", action="store_true", help="keep orphaned thumbnails")
+    parser.add_argument("--workers", type=int, help="thumbnail worker processes")
+    parser.add_argument("--category", help="only wallpapers in this top-level folder")
+    parser.add_argument("--has-palette", action="store_true", help="only wallpapers with a cached palette")
+    parser.add_argument("--sort", choices=["name", "similar"], default="name",
+                        help="order by path, or by palette similarity to the applied theme")
+    args = parser.parse_args()
+    
+    filters = {}
+    if args.category:
+        filters["category"] = args.category
+    if args.has_palette:
+        filters["has_palette"] = True
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    engine = ThumbnailEngine(str(dotfiles_dir), workers=args.workers)
+    thumbnails = engine.build(prune=not args.no_prune, **filters)
+    if args.sort == "similar":
+        thumbnails = sort_by_similarity(dotfiles_dir, thumbnails)
+    
+    if args.rofi:
+        for wallpaper, thumbnail in thumbnails.items():
+            print(f"{thumbnail}|{wallpaper.parent.name}/{wallpaper.name}|{wallpaper}")
+    else:
+        print(f"{len(thumbnails)} thumbnails in {engine.thumbnails_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# theme_engine/tracing.py
+# Span tracing for theme applications
+# Each pipeline stage records a span (duration plus attributes such as cache hits,
+# bytes read/written and payload sizes) as one JSON line in trace.jsonl next to
+# theme.log; shell scripts and Python processes of one apply share CLYPR_TRACE_ID
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from theme_logging import LOG_FILE
+
+# Shared with logger.sh (trace_span)
+TRACE_FILE = LOG_FILE.with_name("trace.jsonl")
+MAX_TRACE_SIZE = 5242880  # 5MB, one rotated file is kept
+
+# CLYPR_TRACE=0 disables recording
+ENABLED = os.getenv("CLYPR_TRACE", "1") != "0"
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+def new_id() -> str:
+    """Random 64-bit span/trace id as hex."""
+    return os.urandom(8).hex()
+
+class Span:
+    """An open span; attributes set on it are written when it ends."""
+    
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs")
+    
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id()
+        self.parent_id = parent_id
+        self.attrs = attrs
+    
+    def set(self, **attrs: Any) -> None:
+        """Set attributes (last value wins)."""
+        self.attrs.update(attrs)
+    
+    def add(self, key: str, amount: float) -> None:
+        """Add to a counter attribute, e.g. bytes_written."""
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+class _NullSpan:
+    """Stands in for Span while tracing is disabled."""
+    
+    def set(self, **attrs: Any) -> None:
+        pass
+    
+    def add(self, key: str, amount: float) -> None:
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def _stack() -> List[Span]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _current_context() -> Tuple[Optional[str], Optional[str]]:
+    """(trace id, parent span id) for a span started now on this thread."""
+    stack = _stack()
+    if stack:
+        return stack[-1].trace_id, stack[-1].span_id
+    base = getattr(_local, "base", None)
+    if base:
+        return base
+    return os.getenv("CLYPR_TRACE_ID") or None, os.getenv("CLYPR_TRACE_PARENT") or None
+
+def current_span():
+    """The innermost open span on this thread (a no-op span if there is none)."""
+    stack = _stack()
+    return stack[-1] if stack else _NULL_SPAN
+
+def annotate(**attrs: Any) -> None:
+    """Set attributes on the innermost open span, if any."""
+    current_span().set(**attrs)
+
+def request_context() -> Optional[Dict[str, str]]:
+    """Trace context to pass along to another process (e.g. the daemon), if tracing."""
+    trace_id, parent_id = _current_context()
+    if not ENABLED or not trace_id:
+        return None
+    return {"id": trace_id, "parent": parent_id or ""}
+
+@contextmanager
+def use_context(context: Optional[Dict[str, str]]) -> Iterator[None]:
+    """Continue a trace received from another process for spans on this thread."""
+    previous = getattr(_local, "base", None)
+    if context and context.get("id"):
+        _local.base = (context["id"], context.get("parent") or None)
+    try:
+        yield
+    finally:
+        _local.base = previous
+
+def _write(record: Dict[str, Any]) -> None:
+    """Append one span as a JSON line (O_APPEND, so concurrent writers do not interleave)."""
+    line = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+    with _write_lock:
+        try:
+            TRACE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                if TRACE_FILE.stat().st_size > MAX_TRACE_SIZE:
+                    os.replace(TRACE_FILE, TRACE_FILE.with_name(TRACE_FILE.name + ".1"))
+            except FileNotFoundError:
+                pass
+            fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError:
+            # Tracing must never break an apply
+            pass
+
+def _record(span: Span, start: float, duration_ms: float, status: str) -> None:
+    record = {
+        "trace": span.trace_id,
+        "span": span.span_id,
+        "parent": span.parent_id,
+        "name": span.name,
+        "start": round(start, 6),
+        "ms": round(duration_ms, 3),
+        "pid": os.getpid(),
+        "status": status,
+    }
+    if span.attrs:
+        record["attrs"] = span.attrs
+    _write(record)
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Any]:
+    """Time the enclosed block as a child of the current span (or a new trace)."""
+    if not ENABLED:
+        yield _NULL_SPAN
+        return
+    
+    trace_id, parent_id = _current_context()
+    current = Span(name, trace_id or new_id(), parent_id, attrs)
+    stack = _stack()
+    stack.append(current)
+    start = time.time()
+    begin = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException as e:
+        status = "error"
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stack.pop()
+        _record(current, start, (time.perf_counter() - begin) * 1000, status)
+
+def record(name: str, duration_ms: float, status: str = "ok", **attrs: Any) -> None:
+    """Record an already measured child of the current span (e.g. per-app worker timings)."""
+    if not ENABLED:
+        return
+    trace_id, parent_id = _current_context()
+    finished = Span(name, trace_id or new_id(), parent_id, attrs)
+    _record(finished, time.time() - duration_ms / 1000, duration_ms, status)
+
+def read_traces(limit: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """Spans grouped by trace, oldest trace first; the last limit traces if given."""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for trace_file in (TRACE_FILE.with_name(TRACE_FILE.name + ".1"), TRACE_FILE):
+        try:
+            with open(trace_file, 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    traces.setdefault(record["trace"], []).append(record)
+        except FileNotFoundError:
+            continue
+    
+    ordered = sorted(traces.values(), key=lambda spans: min(s["start"] for s in spans))
+    return ordered[-limit:] if limit else ordered
+
+def _runs(traces: List[List[Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]]:
+    """(root span, parent id -> children) for every root span in the traces."""
+    runs = []
+    for spans in traces:
+        ids = {s["span"] for s in spans}
+        children: Dict[str, List[Dict[str, Any]]] = {}
+        for s in spans:
+            children.setdefault(s.get("parent") or "", []).append(s)
+        for s in spans:
+            if not s.get("parent") or s["parent"] not in ids:
+                runs.append((s, children))
+    return runs
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def stage_stats(runs: List[Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]]) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    """Per span path (root name, child name, ...): durations per run and cache outcomes.
+    
+    Same-named siblings within one run are summed, so parallel per-app spans add up.
+    """
+    stats: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    
+    def visit(node: Dict[str, Any], path: Tuple[str, ...], children: Dict[str, List[Dict[str, Any]]],
+              totals: Dict[Tuple[str, ...], float]) -> None:
+        totals[path] = totals.get(path, 0.0) + node["ms"]
+        entry = stats.setdefault(path, {"ms": [], "hits": 0, "misses": 0, "errors": 0})
+        cache = node.get("attrs", {}).get("cache")
+        if cache == "hit":
+            entry["hits"] += 1
+        elif cache == "miss":
+            entry["misses"] += 1
+        if node.get("status") == "error":
+            entry["errors"] += 1
+        for child in sorted(children.get(node["span"], []), key=lambda s: s["start"]):
+            visit(child, path + (child["name"],), children, totals)
+    
+    for root, children in runs:
+        totals: Dict[Tuple[str, ...], float] = {}
+        visit(root, (root["name"],), children, totals)
+        for path, total_ms in totals.items():
+            stats[path]["ms"].append(total_ms)
+    
+    # Tree order: every path right after its parent, siblings in order of first appearance
+    first_seen = {path: index for index, path in enumerate(stats)}
+    return dict(sorted(stats.items(), key=lambda item: [first_seen[item[0][:depth]]
+                                                        for depth in range(1, len(item[0]) + 1)]))
+
+def dominant_chain(stats: Dict[Tuple[str, ...], Dict[str, Any]], root: Tuple[str, ...],
+                   min_share: float = 0.2) -> List[Tuple[Tuple[str, ...], float]]:
+    """Follow the child with the largest median time down from root.
+    
+    Stops where no child accounts for min_share of its parent (time spent in the parent itself).
+    """
+    chain = []
+    path = root
+    while True:
+        parent_median = percentile(stats[path]["ms"], 0.5)
+        children = [p for p in stats if len(p) == len(path) + 1 and p[:len(path)] == path]
+        if not children or parent_median <= 0:
+            return chain
+        best = max(children, key=lambda p: percentile(stats[p]["ms"], 0.5))
+        share = percentile(stats[best]["ms"], 0.5) / parent_median
+        if share < min_share:
+            return chain
+        chain.append((best, share))
+        path = best
+
+def print_stats(limit: int = 50, root_name: Optional[str] = None) -> None:
+    """Percentiles per stage over the last limit traces, one table per root span name."""
+    runs = _runs(read_traces(limit))
+    if root_name:
+        runs = [run for run in runs if run[0]["name"] == root_name]
+    if not runs:
+        print(f"No traces recorded in {TRACE_FILE}")
+        return
+    
+    stats = stage_stats(runs)
+    for root in dict.fromkeys((run[0]["name"],) for run in runs):
+        root_p50 = percentile(stats[root]["ms"], 0.5)
+        chain = dominant_chain(stats, root)
+        dominant = {path for path, _ in chain}
+        
+        print(f"{root[0]}: {len(stats[root]['ms'])} runs")
+        print(f"  {'stage':38} {'n':>4} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'share':>6}")
+        for path, entry in stats.items():
+            if path[0] != root[0]:
+                continue
+            values = entry["ms"]
+            label = "  " * (len(path) - 1) + path[-1]
+            notes = []
+            if entry["hits"] or entry["misses"]:
+                notes.append(f"cache hit {entry['hits']}/{entry['hits'] + entry['misses']}")
+            if entry["errors"]:
+                notes.append(f"{entry['errors']} errors")
+            if path in dominant:
+                notes.append("<- dominant")
+            share = percentile(values, 0.5) / root_p50 * 100 if root_p50 else 0.0
+            print(f"  {label[:38]:38} {len(values):4} {percentile(values, 0.5):9.1f} {percentile(values, 0.9):9.1f} "
+                  f"{percentile(values, 0.99):9.1f} {max(values):9.1f} {share:5.0f}%  {'  '.join(notes)}".rstrip())
+        
+        if chain:
+            steps = " > ".join(f"{path[-1]} ({share * 100:.0f}% of {path[-2]})" for path, share in chain)
+            print(f"  Dominant stage: {steps}")
+        
+        # Interpreter start to pipeline start, recorded by clypr.py on its root span
+        startup = [run[0]["attrs"] for run in runs
+                   if run[0]["name"] == root[0] and "startup_ms" in run[0].get("attrs", {})]
+        if startup:
+            values = [attrs["startup_ms"] for attrs in startup]
+            over = sum(1 for attrs in startup if attrs["startup_ms"] > attrs.get("startup_budget_ms", float("inf")))
+            budget = startup[-1].get("startup_budget_ms")
+            print(f"  Startup: p50 {percentile(values, 0.5):.0f} ms, p90 {percentile(values, 0.9):.0f} ms, "
+                  f"budget {budget:.0f} ms, over budget in {over}/{len(values)} runs")
+        print()
+
+def print_trace(trace_id: Optional[str] = None) -> None:
+    """Span tree of one trace (the latest by default) with attributes."""
+    traces = read_traces()
+    if trace_id:
+        traces = [spans for spans in traces if spans[0]["trace"].startswith(trace_id)]
+    if not traces:
+        print("No matching trace")
+        return
+    
+    for root, children in _runs([traces[-1]]):
+        print(f"trace {root['trace']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(root['start']))}")
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            attrs = " ".join(f"{key}={value}" for key, value in node.get("attrs", {}).items())
+            status = "" if node.get("status") == "ok" else f" [{node.get('status')}]"
+            print(f"  {'  ' * depth}{node['name']:{max(1, 30 - 2 * depth)}} {node['ms']:9.1f} ms{status}  {attrs}".rstrip())
+            for child in sorted(children.get(node["span"], []), key=lambda s: s["start"], reverse=True):
+                stack.append((child, depth + 1))
+
+def main():
+    """CLI entry point: latency report over recent applies, or one trace in detail."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Theme application traces")
+    parser.add_argument("command", choices=["stats", "show", "clear"])
+    parser.add_argument("trace_id", nargs="?", help="show: trace id (prefix), default the latest")
+    parser.add_argument("-n", "--runs", type=int, default=50, help="stats: number of recent traces (default: 50)")
+    parser.add_argument("--root", help="stats: only runs whose root span has this name, e.g. apply")
+    args = parser.parse_args()
+    
+    if args.command == "stats":
+        print_stats(args.runs, args.root)
+    elif args.command == "show":
+        print_trace(args.trace_id)
+    else:
+        for trace_file in (TRACE_FILE, TRACE_FILE.with_name(TRACE_FILE.name + ".1")):
+            trace_file.unlink(missing_ok=True)
+        print(f"Removed {TRACE_FILE}")
+
+if __name__ == "__main__":
+    main()
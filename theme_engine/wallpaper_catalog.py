@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# theme_engine/wallpaper_catalog.py
+# Persistent wallpaper catalog with incremental scanning
+# Only directories whose mtime changed are listed again (known files elsewhere are
+# only stat'ed); new or changed files are examined (dimensions, content hash) once
+# and then served from SQLite
+
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fingerprint_index import FingerprintIndex, hash_file
+
+# Image types picked up by the picker
+WALLPAPER_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wallpapers (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    category TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    hash TEXT,
+    thumbnail TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_wallpapers_dir ON wallpapers(dir);
+CREATE INDEX IF NOT EXISTS idx_wallpapers_category ON wallpapers(category);
+CREATE INDEX IF NOT EXISTS idx_wallpapers_hash ON wallpapers(hash);
+"""
+
+def thumbnail_name(wallpaper: Path, mtime_ns: int) -> str:
+    """Thumbnail file name for a wallpaper version (path hash + mtime)."""
+    path_hash = hashlib.blake2b(str(wallpaper).encode("utf-8"), digest_size=8).hexdigest()
+    return f"{path_hash}-{mtime_ns:x}.jpg"
+
+def _examine(path: str) -> Tuple[Optional[int], Optional[int], Optional[str]]:
+    """Thread pool job: (width, height, content hash) of a wallpaper."""
+    width = height = None
+    try:
+        # Imported here so refreshes with nothing to examine skip loading Pillow
+        from PIL import Image
+        # Only the header is parsed; pixel data is never decoded
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        pass
+    try:
+        content_hash = hash_file(path)
+    except OSError:
+        content_hash = None
+    return width, height, content_hash
+
+class WallpaperCatalog:
+    """Indexed, incrementally refreshed list of wallpapers below wallpapers/."""
+    
+    def __init__(self, dotfiles_dir: str, fingerprints: Optional[FingerprintIndex] = None, workers: int = 4):
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.theme_data_dir = self.dotfiles_dir / "theme_engine" / "theme_data"
+        self.root = (self.dotfiles_dir / "wallpapers").resolve()
+        self.thumbnails_dir = self.root / "thumbnails"
+        self.db_file = self.theme_data_dir / "catalog.db"
+        self.palette_db = self.theme_data_dir / "palettes.db"
+        self.workers = workers
+        
+        # Shared with the extractor so wallpapers hashed here are never hashed again
+        self.fingerprints = fingerprints or FingerprintIndex(self.theme_data_dir / "fingerprints.json")
+        
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+    
+    def _category(self, directory: str) -> str:
+        """Top-level folder below the library root ('' for the root itself)."""
+        relative = Path(directory).relative_to(self.root)
+        return relative.parts[0] if relative.parts else ""
+    
+    def refresh(self, full: bool = False) -> Dict[str, int]:
+        """Bring the catalog up to date, listing only directories whose mtime changed.
+        
+        Files in unchanged directories are still stat'ed, since editing a wallpaper in
+        place does not touch its directory's mtime.
+        """
+        with self._lock:
+            known_dirs = {row["path"]: (row["parent"], row["mtime_ns"])
+                          for row in self._conn.execute("SELECT path, parent, mtime_ns FROM dirs")}
+            known_files: Dict[str, Dict[str, Tuple[int, int]]] = {}
+            for row in self._conn.execute("SELECT path, dir, size, mtime_ns FROM wallpapers"):
+                known_files.setdefault(row["dir"], {})[row["path"]] = (row["size"], row["mtime_ns"])
+        children: Dict[str, List[str]] = {}
+        for path, (parent, _) in known_dirs.items():
+            children.setdefault(parent, []).append(path)
+        
+        stats = {"dirs_scanned": 0, "added": 0, "updated": 0, "removed": 0}
+        seen_dirs = set()
+        dir_rows = []
+        removed: List[str] = []
+        to_examine: List[Tuple[str, str, os.stat_result, bool]] = []
+        
+        stack = [(str(self.root), None)]
+        while stack:
+            directory, parent = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            seen_dirs.add(directory)
+            
+            existing = known_files.get(directory, {})
+            # Unchanged directory: same entries as last time, only descend into known children
+            # and stat the known files for in-place edits
+            if not full and known_dirs.get(directory, (None, None))[1] == mtime_ns:
+                stack.extend((child, directory) for child in children.get(directory, []))
+                for path, version in existing.items():
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        removed.append(path)
+                        continue
+                    if version != (st.st_size, st.st_mtime_ns):
+                        to_examine.append((path, directory, st, True))
+                continue
+            
+            stats["dirs_scanned"] += 1
+            
+            present = set()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != "thumbnails":
+                            stack.append((entry.path, directory))
+                    elif os.path.splitext(entry.name)[1].lower() in WALLPAPER_EXTENSIONS and entry.is_file():
+                        st = entry.stat()
+                        present.add(entry.path)
+                        if full or existing.get(entry.path) != (st.st_size, st.st_mtime_ns):
+                            to_examine.append((entry.path, directory, st, entry.path in existing))
+            
+            removed.extend(path for path in existing if path not in present)
+            dir_rows.append((directory, parent, mtime_ns))
+        
+        gone_dirs = [path for path in known_dirs if path not in seen_dirs]
+        
+        # Examine new and changed files in parallel (hashing releases the GIL)
+        wallpaper_rows = []
+        if to_examine:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(_examine, [path for path, _, _, _ in to_examine]))
+            for (path, directory, st, known), (width, height, content_hash) in zip(to_examine, results):
+                if content_hash:
+                    self.fingerprints.add(path, FingerprintIndex.fingerprint(st), content_hash)
+                wallpaper_rows.append((path, directory, self._category(directory), os.path.basename(path),
+                                       st.st_size, st.st_mtime_ns, width, height, content_hash,
+                                       str(self.thumbnails_dir / thumbnail_name(Path(path), st.st_mtime_ns))))
+                stats["updated" if known else "added"] += 1
+            self.fingerprints.save()
+        
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM wallpapers WHERE path = ?", [(p,) for p in removed])
+            for directory in gone_dirs:
+                self._conn.execute("DELETE FROM dirs WHERE path = ?", (directory,))
+                self._conn.execute("DELETE FROM wallpapers WHERE dir = ?", (directory,))
+            self._conn.executemany("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)", dir_rows)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO wallpapers (path, dir, category, name, size, mtime_ns, width, height, "
+                "hash, thumbnail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", wallpaper_rows
+            )
+        stats["removed"] = len(removed)
+        return stats
+    
+    def query(self, category: Optional[str] = None, under: Optional[Path] = None,
+              min_width: Optional[int] = None, min_height: Optional[int] = None,
+              has_palette: Optional[bool] = None) -> List[Dict]:
+        """Catalog entries matching all given filters, ordered by path."""
+        conditions, params = [], []
+        if category is not None:
+            conditions.append("w.category = ?")
+            params.append(category)
+        if under is not None:
+            prefix = str(Path(under).resolve())
+            conditions.append("(w.dir = ? OR w.dir LIKE ? ESCAPE '\\')")
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.extend([prefix, escaped + "/%"])
+        if min_width is not None:
+            conditions.append("w.width >= ?")
+            params.append(min_width)
+        if min_height is not None:
+            conditions.append("w.height >= ?")
+            params.append(min_height)
+        
+        palette_column = "0"
+        with self._lock:
+            attached = self._attach_palettes()
+            if attached:
+                palette_column = "EXISTS (SELECT 1 FROM store.palettes p WHERE p.hash = w.hash)"
+            if has_palette is not None:
+                conditions.append(f"{palette_column} = ?")
+                params.append(1 if has_palette else 0)
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = self._conn.execute(
+                f"SELECT w.*, {palette_column} AS has_palette FROM wallpapers w {where} ORDER BY w.path", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def _attach_palettes(self) -> bool:
+        """Attach the palette store (read side) so queries can join on content hash."""
+        if any(row["name"] == "store" for row in self._conn.execute("PRAGMA database_list")):
+            return True
+        if not self.palette_db.exists():
+            return False
+        self._conn.execute("ATTACH DATABASE ? AS store", (str(self.palette_db),))
+        return True
+    
+    def categories(self) -> List[Tuple[str, int]]:
+        """(category, wallpaper count) pairs."""
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute(
+                "SELECT category, COUNT(*) FROM wallpapers GROUP BY category ORDER BY category")]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+def main():
+    """CLI entry point for refreshing and querying the wallpaper catalog."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Wallpaper catalog")
+    parser.add_argument("command", choices=["refresh", "list", "stats"])
+    parser.add_argument("--full", action="store_true", help="re-examine every directory and file")
+    parser.add_argument("--category", help="only wallpapers in this top-level folder")
+    parser.add_argument("--min-width", type=int)
+    parser.add_argument("--min-height", type=int)
+    palette = parser.add_mutually_exclusive_group()
+    palette.add_argument("--has-palette", dest="has_palette", action="store_true", default=None)
+    palette.add_argument("--no-palette", dest="has_palette", action="store_false")
+    args = parser.parse_args()
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    catalog = WallpaperCatalog(str(dotfiles_dir))
+    stats = catalog.refresh(full=args.full)
+    
+    if args.command == "refresh":
+        print(f"Scanned {stats['dirs_scanned']} directories: {stats['added']} added, "
+              f"{stats['updated']} updated, {stats['removed']} removed")
+    elif args.command == "stats":
+        for category, count in catalog.categories():
+            print(f"{category or '(root)':20} {count}")
+    else:
+        for entry in catalog.query(category=args.category, min_width=args.min_width,
+                                   min_height=args.min_height, has_palette=args.has_palette):
+            size = f"{entry['width']}x{entry['height']}" if entry["width"] else "?"
+            print(f"{entry['hash'] or '-':16}  {size:>9}  {'P' if entry['has_palette'] else ' '}  {entry['path']}")
+
+if __name__ == "__main__":
+    main()
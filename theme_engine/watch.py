@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# theme_engine/watch.py
+# Watch mode for template and static config development
+# Watches config_templates/ and config_static/ with inotify (polling where it is
+# unavailable); after a short debounce only the edited app is re-rendered against
+# the current palette, re-merged and reloaded
+
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from theme_logging import log_error, log_info, log_success, log_warning
+from tracing import span
+
+# Quiet time after the last event before a batch is processed; editors save with
+# several events (write, rename, chmod) within a few milliseconds
+DEBOUNCE_MS = 75
+# Polling fallback interval
+POLL_INTERVAL = 0.25
+
+# inotify(7) constants
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+def _ignored(path: Path) -> bool:
+    """Editor swap, backup and probe files."""
+    name = path.name
+    return name.startswith((".", "#")) or name.endswith(("~", ".swp", ".swx", ".tmp")) or name == "4913"
+
+class InotifyWatcher:
+    """Recursive inotify watches on directory trees, through libc."""
+    
+    def __init__(self, roots: Iterable[Path]):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self._dirs: Dict[int, Path] = {}
+        for root in roots:
+            self._add_tree(Path(root))
+    
+    def _add_tree(self, root: Path) -> None:
+        """Watch root and every directory below it (inotify is not recursive)."""
+        for dirpath, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"Cannot watch {dirpath}: {os.strerror(errno)}")
+            self._dirs[wd] = Path(dirpath)
+    
+    def read(self, timeout: Optional[float]) -> List[Path]:
+        """Paths of files changed within timeout seconds (empty on timeout)."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return []
+        
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                # New directories are watched too; files already in them count as changed
+                if mask & (IN_CREATE | IN_MOVED_TO) and path.is_dir():
+                    self._add_tree(path)
+                    paths.extend(p for p in path.rglob("*") if p.is_file())
+                continue
+            paths.append(path)
+        return paths
+    
+    def close(self) -> None:
+        os.close(self._fd)
+
+class PollingWatcher:
+    """Fallback watcher comparing file sizes and mtimes."""
+    
+    def __init__(self, roots: Iterable[Path], interval: float = POLL_INTERVAL):
+        self.roots = [Path(root) for root in roots]
+        self.interval = interval
+        self._files = self._scan()
+    
+    def _scan(self) -> Dict[Path, tuple]:
+        files = {}
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = Path(dirpath) / filename
+                    try:
+                        st = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    files[path] = (st.st_size, st.st_mtime_ns)
+        return files
+    
+    def read(self, timeout: Optional[float]) -> List[Path]:
+        """Paths of files changed since the last call, checked after at most one interval."""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        files = self._scan()
+        changed = [path for path in files.keys() | self._files.keys() if files.get(path) != self._files.get(path)]
+        self._files = files
+        return changed
+    
+    def close(self) -> None:
+        pass
+
+class ThemeWatcher:
+    """Re-renders, re-merges and reloads only the apps whose templates or static configs changed."""
+    
+    def __init__(self, dotfiles_dir: str, reload: bool = True, debounce_ms: float = DEBOUNCE_MS):
+        from merge_configs import INCLUDE_TARGETS, ConfigMerger
+        from render_templates import ThemeRenderer
+        
+        self.dotfiles_dir = Path(dotfiles_dir)
+        self.templates_dir = self.dotfiles_dir / "config_templates"
+        self.static_dir = self.dotfiles_dir / "config_static"
+        self.reload_enabled = reload
+        self.debounce = debounce_ms / 1000
+        
+        # Renderer and merger stay loaded, so compiled templates and static configs are reused
+        self.renderer = ThemeRenderer(str(self.dotfiles_dir))
+        self.merger = ConfigMerger(str(self.dotfiles_dir))
+        self.reloader = None
+        
+        # config_static directory -> app, where they differ (hypr -> hyprland)
+        self.static_apps = {Path(target.config).parts[0]: app_name
+                            for app_name, targets in INCLUDE_TARGETS.items() for target in targets}
+    
+    def app_for(self, path: Path) -> Optional[str]:
+        """App a changed template or static config belongs to, or None for other files."""
+        for root in (self.templates_dir, self.static_dir):
+            try:
+                relative = path.relative_to(root)
+            except ValueError:
+                continue
+            if len(relative.parts) < 2:
+                return None
+            if root == self.templates_dir:
+                return relative.parts[0] if path.suffix == ".tmpl" else None
+            return self.static_apps.get(relative.parts[0], relative.parts[0])
+        return None
+    
+    def warm_up(self) -> None:
+        """Load the current theme and import the rendering engine before the first edit."""
+        theme_data = self.renderer._load_current_theme()
+        self.renderer.derived.resolve(theme_data["palette"], ["primary_tone_50"])
+    
+    def process(self, paths: Iterable[Path], first_event: float) -> List[str]:
+        """Handle one debounced batch of changed files; returns the apps reloaded."""
+        paths = sorted(set(paths))
+        templates = [path for path in paths if path.suffix == ".tmpl" and path.is_relative_to(self.templates_dir)
+                     and path.exists()]
+        edited_static = {self.app_for(path) for path in paths if path.is_relative_to(self.static_dir)} - {None}
+        apps = {self.app_for(path) for path in templates} | edited_static
+        if not apps:
+            return []
+        
+        with span("watch", files=[str(path.relative_to(self.dotfiles_dir)) for path in paths]) as sp:
+            if templates:
+                # Cached current palette: no extraction, and only the edited templates
+                self.renderer.render_all_templates(self.renderer._load_current_theme(), templates=templates)
+            changed = self.merger.merge_app_configs(apps)
+            
+            reloaded = []
+            if self.reload_enabled:
+                from reload_apps import AppReloader
+                
+                # Static configs may be used in place (stow links), so their app reloads either way;
+                # changes left by earlier applies stay in the manifest for the next full reload
+                reloaded = sorted(set(changed) | edited_static)
+                if self.reloader is None:
+                    self.reloader = AppReloader(str(self.dotfiles_dir))
+                for app_name, status, elapsed_ms, message in self.reloader.reload(reloaded):
+                    line = f"{app_name:9} {elapsed_ms:7.1f} ms  {status:7}  {message}"
+                    if status == "failed":
+                        log_error("WATCH", line)
+                    elif status == "skipped":
+                        log_warning("WATCH", line)
+            
+            latency_ms = (time.monotonic() - first_event) * 1000
+            sp.set(apps=sorted(apps), changed=changed, latency_ms=round(latency_ms, 1))
+        log_success("WATCH", f"{', '.join(sorted(apps))}: changed {', '.join(changed) or 'nothing'}, "
+                             f"{latency_ms:.0f} ms from edit")
+        return reloaded
+    
+    def run(self, poll: bool = False) -> None:
+        """Watch until interrupted."""
+        roots = [root for root in (self.templates_dir, self.static_dir) if root.is_dir()]
+        watcher = None
+        if not poll:
+            try:
+                watcher = InotifyWatcher(roots)
+            except OSError as e:
+                log_warning("WATCH", f"inotify unavailable ({e}), polling every {POLL_INTERVAL} s")
+        if watcher is None:
+            watcher = PollingWatcher(roots)
+        
+        self.warm_up()
+        log_info("WATCH", f"Watching {', '.join(str(root.relative_to(self.dotfiles_dir)) for root in roots)}"
+                          f" (Ctrl+C to stop)")
+        
+        # Stop cleanly when run in the background (kill, systemd)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        
+        pending: Dict[Path, float] = {}
+        last_event = 0.0
+        try:
+            while True:
+                timeout = max(0.0, last_event + self.debounce - time.monotonic()) if pending else None
+                for path in watcher.read(timeout):
+                    if not _ignored(path):
+                        now = time.monotonic()
+                        pending.setdefault(path, now)
+                        last_event = now
+                
+                if pending and time.monotonic() - last_event >= self.debounce:
+                    batch, first_event = list(pending), min(pending.values())
+                    pending = {}
+                    try:
+                        self.process(batch, first_event)
+                    except Exception as e:
+                        # A broken template must not end the session; fix it and save again
+                        log_error("WATCH", f"Update failed: {e}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            log_info("WATCH", "Stopped watching")
+
+def main():
+    """CLI entry point: watch templates and static configs."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Re-render, merge and reload apps as their templates "
+                                                 "or static configs are edited")
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument("--no-reload", action="store_true", help="do not reload applications")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE_MS, metavar="MS",
+                        help=f"quiet time before a change is processed (default {DEBOUNCE_MS})")
+    args = parser.parse_args()
+    
+    dotfiles_dir = Path(__file__).parent.parent
+    watcher = ThemeWatcher(str(dotfiles_dir), reload=not args.no_reload, debounce_ms=args.debounce)
+    try:
+        watcher.run(poll=args.poll)
+    except FileNotFoundError as e:
+        log_error("WATCH", str(e))
+        print("Run apply_theme.sh first to generate theme data")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()